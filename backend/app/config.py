@@ -35,6 +35,56 @@ class Settings(BaseSettings):
     
     # ML Model settings
     ML_MODEL_PATH: Optional[str] = os.getenv("ML_MODEL_PATH", None)
+    # Recommendation model algorithm: "user_user", "item_item" or "als"
+    ML_CF_ALGORITHM: str = os.getenv("ML_CF_ALGORITHM", "user_user")
+    # Apply new ratings to the loaded CF model online; one worker periodically
+    # snapshots them into a new bundle version
+    ML_ONLINE_UPDATES: bool = True
+    ML_SNAPSHOT_EVERY: int = 500  # ratings
+    ML_SNAPSHOT_INTERVAL_SECONDS: int = 600
+    # Ratings replayed onto a loaded model start this long before its cutoff
+    ML_RATINGS_REPLAY_OVERLAP_SECONDS: int = 60
+    # Watch models/ and hot-swap newly published model versions
+    ML_MODEL_HOT_RELOAD: bool = True
+    ML_MODEL_POLL_SECONDS: int = 30
+    # Extra buckets probed per LSH table (higher = better recall, slower queries)
+    ML_LSH_PROBES: int = 2
+    # Search users through the LSH index only from this many users on; below
+    # it exact sparse search is faster (see scripts/benchmark_lsh.py)
+    ML_LSH_MIN_USERS: int = 500_000
+    # Reload the in-memory meal catalog at least this often (writes in this
+    # process reload it immediately)
+    MEAL_CATALOG_MAX_AGE_SECONDS: int = 300
+    # Cached recommendations are dropped when the user logs or rates a meal or
+    # edits their profile/preferences, so with a shared cache backend the TTL
+    # only bounds model drift
+    RECOMMENDATION_CACHE_TTL_SECONDS: int = 12 * 3600
+    # With the per-process memory backend those invalidations only reach the
+    # worker that handled the write, so other workers' entries must expire soon
+    RECOMMENDATION_CACHE_LOCAL_TTL_SECONDS: int = 300
+    # Older cached recommendations are still served but recomputed in the
+    # background (stale-while-revalidate)
+    RECOMMENDATION_CACHE_SOFT_TTL_SECONDS: int = 1800
+    # Result cache storage: "memory" (per worker process), "sqlite" (shared by
+    # the workers on one machine) or "redis" (any Redis-protocol server)
+    CACHE_BACKEND: str = os.getenv("CACHE_BACKEND", "memory")
+    CACHE_SQLITE_PATH: str = os.getenv("CACHE_SQLITE_PATH", "nutrichef_cache.sqlite3")
+    CACHE_REDIS_URL: str = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+    CACHE_KEY_PREFIX: str = "nutrichef:cache:"
+    # Bounds of the memory and sqlite caches (least recently used entries are
+    # evicted first) and how often expired entries are swept out
+    CACHE_MAX_ENTRIES: int = 10000
+    CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    CACHE_SWEEP_INTERVAL_SECONDS: int = 60
+    # Worker threads for stale-while-revalidate refreshes
+    CACHE_REFRESH_WORKERS: int = 2
+    
+    @property
+    def recommendation_cache_ttl_seconds(self) -> int:
+        """TTL of cached recommendations: long only when invalidations reach every worker."""
+        if self.CACHE_BACKEND.lower() == "memory":
+            return self.RECOMMENDATION_CACHE_LOCAL_TTL_SECONDS
+        return self.RECOMMENDATION_CACHE_TTL_SECONDS
     
     # AI/ML settings
     SIMILARITY_THRESHOLD: Optional[float] = 0.7
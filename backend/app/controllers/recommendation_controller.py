@@ -1,5 +1,5 @@
 """Recommendation API endpoints."""
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from pydantic import BaseModel
@@ -7,6 +7,7 @@ from app.repositories.database import get_db
 from app.services.recommendation_service import RecommendationService
 from app.services.ml_recommendation_service import MLRecommendationService
 from app.repositories.user_repository import UserRepository
+from app.enums import DietaryRestriction
 
 router = APIRouter(prefix="/api/recommendations", tags=["recommendations"])
 
@@ -31,7 +32,7 @@ class MealRecommendation(BaseModel):
 def get_recommendations(
     user_id: int,
     category: Optional[str] = None,
-    limit: int = 10,
+    limit: int = Query(10, ge=1),
     use_ml: bool = True,
     db: Session = Depends(get_db)
 ):
@@ -80,12 +81,30 @@ def get_recommendations(
 
 @router.get("/popular", response_model=List[MealRecommendation])
 def get_popular_meals(
-    limit: int = 10,
+    limit: int = Query(10, ge=1),
+    category: Optional[str] = None,
+    diet: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    """Get popular meals based on ML model popularity scores."""
+    """
+    Get popular meals based on ML model popularity scores.
+    
+    Optionally restricted to a category and to comma-separated dietary
+    flags (e.g. ?diet=vegan,gluten_free); unknown flags are rejected with 422.
+    """
+    diet_flags = [flag.strip() for flag in diet.split(",") if flag.strip()] if diet else None
+    unknown = [flag for flag in diet_flags or [] if flag not in DietaryRestriction.list()]
+    if unknown:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Unknown dietary restriction(s): {', '.join(unknown)} "
+                   f"(expected any of: {', '.join(DietaryRestriction.list())})"
+        )
+    
     try:
-        recommendations = MLRecommendationService.get_popular_meals(db, limit)
+        recommendations = MLRecommendationService.get_popular_meals(
+            db, limit, category=category, diet_flags=diet_flags
+        )
         
         formatted_recommendations = []
         for rec in recommendations:
@@ -54,6 +54,44 @@ class MealCategory(BaseEnum):
     SNACK = "snack"
 
 
+class DietaryRestriction(BaseEnum):
+    """Dietary restriction enumeration (Preference flags, Meal is_<value> columns)."""
+    VEGETARIAN = "vegetarian"
+    VEGAN = "vegan"
+    GLUTEN_FREE = "gluten_free"
+    DAIRY_FREE = "dairy_free"
+    NUT_FREE = "nut_free"
+    HALAL = "halal"
+    KOSHER = "kosher"
+    
+    @classmethod
+    def mask_of(cls, obj, prefix: str = "") -> int:
+        """
+        Pack boolean restriction attributes into a dietary bitmask.
+        
+        Bit i stands for the i-th restriction in declaration order.
+        
+        Args:
+            obj: Object with one boolean attribute per restriction
+            prefix: Attribute name prefix ("is_" for Meal, "" for Preference)
+        
+        Returns:
+            Integer mask with the bits of the set attributes
+        """
+        return sum(1 << bit for bit, restriction in enumerate(cls) if getattr(obj, prefix + restriction.value))
+    
+    @classmethod
+    def mask_of_values(cls, values) -> int:
+        """
+        Dietary bitmask of restriction values, e.g. ["vegan", "gluten_free"].
+        
+        Raises:
+            ValueError: For a value that is not a restriction
+        """
+        members = list(cls)
+        return sum(1 << members.index(cls(value)) for value in set(values))
+
+
 class MealType(BaseEnum):
     """Meal type enumeration for logging user meals."""
     BREAKFAST = "breakfast"
@@ -68,5 +106,6 @@ __all__ = [
     "ActivityLevel",
     "Goal",
     "MealCategory",
+    "DietaryRestriction",
     "MealType",
 ]
@@ -0,0 +1,12 @@
+"""Machine-learning runtime used by the recommendation services."""
+from .cf_runtime import (
+    CollaborativeFilteringModel,
+    ItemItemCollaborativeFilteringModel,
+    MatrixFactorizationModel,
+)
+
+__all__ = [
+    "CollaborativeFilteringModel",
+    "ItemItemCollaborativeFilteringModel",
+    "MatrixFactorizationModel",
+]
@@ -0,0 +1,1729 @@
+"""
+Inference runtime for the collaborative-filtering recommendation models.
+
+Owns the model data structures (interned CSR rating matrix, precomputed
+neighbour tables, on-disk array bundles) and the prediction kernels. The
+API process imports only this module; the training script in
+scripts/train_ml_model.py builds on these classes and adds the training
+stages.
+"""
+import os
+import json
+import math
+import pickle
+import shutil
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+from collections import defaultdict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# On-disk array bundle format (directory of .npy files + manifest.json)
+BUNDLE_FORMAT = "collaborative_filtering"
+BUNDLE_VERSION = 1
+BUNDLE_MANIFEST = "manifest.json"
+
+
+def _gather_positions(indptr: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """Return the concatenated CSR storage positions of the given rows."""
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(lengths.sum())
+
+
+def _lookup_many(ids: np.ndarray, keys: np.ndarray) -> np.ndarray:
+    """Binary search many keys in a sorted id array; missing keys map to -1."""
+    if len(ids) == 0:
+        return np.full(len(keys), -1, dtype=np.int64)
+    positions = np.minimum(np.searchsorted(ids, keys), len(ids) - 1)
+    return np.where(ids[positions] == keys, positions, -1)
+
+
+def _row_norms(indptr: np.ndarray, data: np.ndarray) -> np.ndarray:
+    """Euclidean norm of every CSR row (0 for empty rows)."""
+    n_rows = len(indptr) - 1
+    row_of_entry = np.repeat(np.arange(n_rows), np.diff(indptr))
+    return np.sqrt(np.bincount(row_of_entry, weights=data.astype(np.float64) ** 2, minlength=n_rows))
+
+
+class SparseRatingMatrix:
+    """
+    Rating matrix stored as CSR arrays with interned user/meal ids.
+    
+    User and meal ids are mapped to dense integer indices in sorted id
+    order, so an id lookup is a binary search over a NumPy array. The
+    ratings are kept twice: user-major (one row per user) and meal-major
+    (one row per meal). Together with the precomputed user row norms this
+    lets one sparse mat-vec produce a user's cosine similarity to everyone.
+    """
+    
+    def __init__(
+        self,
+        user_ids: np.ndarray,
+        meal_ids: np.ndarray,
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        data: np.ndarray,
+        meal_indptr: np.ndarray,
+        meal_indices: np.ndarray,
+        meal_data: np.ndarray,
+        user_norms: Optional[np.ndarray] = None,
+        meal_norms: Optional[np.ndarray] = None
+    ):
+        self.user_ids = user_ids  # sorted user ids, position = user index
+        self.meal_ids = meal_ids  # sorted meal ids, position = meal index
+        self.indptr = indptr  # user-major CSR
+        self.indices = indices
+        self.data = data
+        self.meal_indptr = meal_indptr  # meal-major CSR (the transpose)
+        self.meal_indices = meal_indices
+        self.meal_data = meal_data
+        self.user_norms = _row_norms(indptr, data) if user_norms is None else user_norms
+        self.meal_norms = _row_norms(meal_indptr, meal_data) if meal_norms is None else meal_norms
+    
+    @property
+    def n_users(self) -> int:
+        return len(self.user_ids)
+    
+    @property
+    def n_meals(self) -> int:
+        return len(self.meal_ids)
+    
+    @classmethod
+    def from_ratings(cls, user_ratings: Dict[str, Dict[int, float]]) -> "SparseRatingMatrix":
+        """Build the matrix from a {user_id: {meal_id: rating}} mapping."""
+        user_ids = np.array(sorted(user_ratings.keys()), dtype=str)
+        meal_ids = np.array(
+            sorted({meal_id for ratings in user_ratings.values() for meal_id in ratings}),
+            dtype=np.int64
+        )
+        
+        nnz = sum(len(ratings) for ratings in user_ratings.values())
+        rows = np.empty(nnz, dtype=np.int32)
+        cols = np.empty(nnz, dtype=np.int64)
+        data = np.empty(nnz, dtype=np.float32)
+        pos = 0
+        for row, user_id in enumerate(user_ids):
+            ratings = user_ratings[str(user_id)]
+            end = pos + len(ratings)
+            rows[pos:end] = row
+            cols[pos:end] = list(ratings.keys())
+            data[pos:end] = list(ratings.values())
+            pos = end
+        
+        return cls.from_coo(user_ids, meal_ids, rows, np.searchsorted(meal_ids, cols), data)
+    
+    @classmethod
+    def from_coo(
+        cls,
+        user_ids: np.ndarray,
+        meal_ids: np.ndarray,
+        rows: np.ndarray,
+        cols: np.ndarray,
+        data: np.ndarray
+    ) -> "SparseRatingMatrix":
+        """Build the matrix from (user index, meal index, rating) triplets."""
+        rows = np.asarray(rows, dtype=np.int32)
+        cols = np.asarray(cols, dtype=np.int32)
+        data = np.asarray(data, dtype=np.float32)
+        
+        by_user = np.lexsort((cols, rows))
+        indptr = np.zeros(len(user_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(user_ids)), out=indptr[1:])
+        
+        by_meal = np.lexsort((rows, cols))
+        meal_indptr = np.zeros(len(meal_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cols, minlength=len(meal_ids)), out=meal_indptr[1:])
+        
+        return cls(
+            user_ids, meal_ids,
+            indptr, cols[by_user], data[by_user],
+            meal_indptr, rows[by_meal], data[by_meal]
+        )
+    
+    @staticmethod
+    def _lookup(ids: np.ndarray, key) -> int:
+        """Binary search for an id; returns -1 if it is not present."""
+        pos = int(np.searchsorted(ids, key))
+        if pos < len(ids) and ids[pos] == key:
+            return pos
+        return -1
+    
+    def user_index(self, user_id: str) -> int:
+        """Dense index of a user id, or -1."""
+        return self._lookup(self.user_ids, str(user_id))
+    
+    def meal_index(self, meal_id: int) -> int:
+        """Dense index of a meal id, or -1."""
+        return self._lookup(self.meal_ids, int(meal_id))
+    
+    def meal_indices_of(self, meal_ids: np.ndarray) -> np.ndarray:
+        """Vectorized meal id lookup; unknown meals map to -1."""
+        return _lookup_many(self.meal_ids, np.asarray(meal_ids, dtype=np.int64))
+    
+    def user_row(self, user_idx: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (meal indices, ratings) of one user's row."""
+        start, end = self.indptr[user_idx], self.indptr[user_idx + 1]
+        return self.indices[start:end], self.data[start:end]
+    
+    def ratings_of(self, user_id: str) -> Dict[int, float]:
+        """A user's ratings as {meal_id: rating} ({} for unknown users)."""
+        user_idx = self.user_index(user_id)
+        if user_idx < 0:
+            return {}
+        meals, ratings = self.user_row(user_idx)
+        return dict(zip(self.meal_ids[meals].tolist(), ratings.tolist()))
+    
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """All arrays needed to rebuild the matrix without recomputation."""
+        return {
+            'user_ids': self.user_ids,
+            'meal_ids': self.meal_ids,
+            'indptr': self.indptr,
+            'indices': self.indices,
+            'data': self.data,
+            'meal_indptr': self.meal_indptr,
+            'meal_indices': self.meal_indices,
+            'meal_data': self.meal_data,
+            'user_norms': self.user_norms,
+            'meal_norms': self.meal_norms,
+        }
+    
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "SparseRatingMatrix":
+        """Wrap arrays (possibly memory-mapped) produced by to_arrays, without copying."""
+        return cls(
+            arrays['user_ids'], arrays['meal_ids'],
+            arrays['indptr'], arrays['indices'], arrays['data'],
+            arrays['meal_indptr'], arrays['meal_indices'], arrays['meal_data'],
+            user_norms=arrays['user_norms'], meal_norms=arrays['meal_norms']
+        )
+    
+    def user_similarities(self, user_idx: int) -> np.ndarray:
+        """
+        Cosine similarity of one user to every user (self excluded).
+        
+        Computed as a single sparse mat-vec R @ r_u through the meal-major
+        rows of the user's rated meals.
+        """
+        return _cosine_to_all(
+            user_idx,
+            (self.indptr, self.indices, self.data),
+            (self.meal_indptr, self.meal_indices, self.meal_data),
+            self.user_norms
+        )
+    
+    def similarities_to_ratings(self, ratings: Dict[int, float]) -> np.ndarray:
+        """
+        Cosine similarity of an arbitrary {meal_id: rating} vector to every user.
+        
+        Used for users whose ratings changed since the matrix was built.
+        Meals unknown to the matrix still count towards the vector's norm.
+        """
+        if not ratings:
+            return np.zeros(self.n_users)
+        values = np.array(list(ratings.values()), dtype=np.float64)
+        meal_idx = self.meal_indices_of(list(ratings.keys()))
+        known = meal_idx >= 0
+        return _cosine_to_vector(
+            meal_idx[known], values[known], float(np.sqrt(np.sum(values ** 2))),
+            (self.meal_indptr, self.meal_indices, self.meal_data),
+            self.user_norms
+        )
+    
+    def with_ratings(self, updates: Dict[str, Dict[int, float]]) -> Tuple["SparseRatingMatrix", np.ndarray, np.ndarray]:
+        """
+        Build a new matrix with new/changed ratings merged in.
+        
+        Args:
+            updates: {user_id: {meal_id: rating}} superseding existing entries
+        
+        Returns:
+            (matrix, user_map, meal_map) where the maps translate old user/meal
+            indices to indices in the new matrix
+        """
+        triplets = [
+            (str(user_id), int(meal_id), float(rating))
+            for user_id, ratings in updates.items()
+            for meal_id, rating in ratings.items()
+        ]
+        new_users = np.array([t[0] for t in triplets], dtype=str)
+        new_meals = np.array([t[1] for t in triplets], dtype=np.int64)
+        new_data = np.array([t[2] for t in triplets], dtype=np.float32)
+        
+        user_ids = np.union1d(np.asarray(self.user_ids), new_users)
+        meal_ids = np.union1d(np.asarray(self.meal_ids), new_meals)
+        user_map = np.searchsorted(user_ids, self.user_ids)
+        meal_map = np.searchsorted(meal_ids, self.meal_ids)
+        
+        rows = user_map[np.repeat(np.arange(self.n_users), np.diff(self.indptr))]
+        cols = meal_map[self.indices]
+        update_rows = np.searchsorted(user_ids, new_users)
+        update_cols = np.searchsorted(meal_ids, new_meals)
+        
+        # Drop existing entries that an update supersedes
+        keys = rows.astype(np.int64) * len(meal_ids) + cols
+        update_keys = update_rows.astype(np.int64) * len(meal_ids) + update_cols
+        keep = ~np.isin(keys, update_keys)
+        
+        matrix = SparseRatingMatrix.from_coo(
+            user_ids, meal_ids,
+            np.concatenate([rows[keep], update_rows]),
+            np.concatenate([cols[keep], update_cols]),
+            np.concatenate([np.asarray(self.data)[keep], new_data])
+        )
+        return matrix, user_map, meal_map
+    
+    def meal_similarities(self, meal_idx: int) -> np.ndarray:
+        """Cosine similarity of one meal to every meal (self excluded), via R^T @ r_m."""
+        return _cosine_to_all(
+            meal_idx,
+            (self.meal_indptr, self.meal_indices, self.meal_data),
+            (self.indptr, self.indices, self.data),
+            self.meal_norms
+        )
+
+
+def _cosine_to_all(row: int, rows_csr: Tuple, columns_csr: Tuple, norms: np.ndarray) -> np.ndarray:
+    """Cosine similarity of one CSR row to every row, through the transposed CSR."""
+    indptr, indices, data = rows_csr
+    start, end = indptr[row], indptr[row + 1]
+    similarities = _cosine_to_vector(indices[start:end], data[start:end], norms[row], columns_csr, norms)
+    similarities[row] = 0.0
+    return similarities
+
+
+def _cosine_to_vector(
+    columns: np.ndarray,
+    values: np.ndarray,
+    norm: float,
+    columns_csr: Tuple,
+    norms: np.ndarray
+) -> np.ndarray:
+    """Cosine similarity of a sparse vector (columns, values) to every CSR row."""
+    t_indptr, t_indices, t_data = columns_csr
+    n_rows = len(norms)
+    if len(columns) == 0 or norm == 0:
+        return np.zeros(n_rows)
+    
+    positions = _gather_positions(t_indptr, columns)
+    lengths = t_indptr[columns + 1] - t_indptr[columns]
+    weights = t_data[positions] * np.repeat(values.astype(np.float64), lengths)
+    dots = np.bincount(t_indices[positions], weights=weights, minlength=n_rows)
+    
+    denominators = norms * norm
+    return np.divide(dots, denominators, out=np.zeros(n_rows), where=denominators > 0)
+
+
+def top_k_indices(scores: np.ndarray, k: int, positive_only: bool = True) -> np.ndarray:
+    """
+    Indices of the k largest scores, best first (ties by index).
+    
+    Same order as a stable descending sort cut to k, in O(n + k log k).
+    Only positive scores are considered unless positive_only is False.
+    """
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    candidates = np.flatnonzero(scores > 0) if positive_only else np.arange(len(scores))
+    if len(candidates) > k:
+        # Keep every value tied with the k-th so the tie-break below stays stable
+        kth = np.partition(scores[candidates], len(candidates) - k)[len(candidates) - k]
+        candidates = candidates[scores[candidates] >= kth]
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order[:k]]
+
+
+def write_array_bundle(bundle_dir: Path, arrays: Dict[str, np.ndarray], metadata: Dict):
+    """
+    Write arrays as a versioned bundle: one .npy file per array plus a manifest.
+    
+    Bundles are immutable: the bundle is written next to the target and
+    renamed into place in one step, so a reader never sees a half-written
+    or missing bundle. Publish a changed model as a new version instead
+    (see app.ml.model_registry.next_version_path).
+    
+    Raises:
+        FileExistsError: If bundle_dir already exists
+    """
+    bundle_dir = Path(bundle_dir)
+    if bundle_dir.exists():
+        raise FileExistsError(f"{bundle_dir} already exists; bundles are written once, as new versions")
+    tmp_dir = bundle_dir.with_name(f"{bundle_dir.name}.tmp-{os.getpid()}")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+    
+    manifest = {
+        'format': BUNDLE_FORMAT,
+        'version': BUNDLE_VERSION,
+        'metadata': metadata,
+        'arrays': {},
+    }
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        np.save(tmp_dir / f"{name}.npy", array, allow_pickle=False)
+        manifest['arrays'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape)}
+    
+    with open(tmp_dir / BUNDLE_MANIFEST, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    
+    try:
+        tmp_dir.rename(bundle_dir)
+    except OSError:
+        # Another writer published the same path first
+        shutil.rmtree(tmp_dir)
+        raise
+
+
+def read_array_bundle(bundle_dir: Path, mmap: bool = True) -> Tuple[Dict[str, np.ndarray], Dict]:
+    """
+    Read a bundle written by write_array_bundle.
+    
+    With mmap=True every array is memory-mapped read-only, so opening is
+    near-instant and processes loading the same bundle share page cache.
+    
+    Returns:
+        (arrays, metadata)
+    """
+    bundle_dir = Path(bundle_dir)
+    with open(bundle_dir / BUNDLE_MANIFEST, 'r') as f:
+        manifest = json.load(f)
+    
+    if manifest.get('format') != BUNDLE_FORMAT:
+        raise ValueError(f"{bundle_dir} is not a {BUNDLE_FORMAT} bundle")
+    if manifest.get('version') != BUNDLE_VERSION:
+        raise ValueError(
+            f"Unsupported bundle version {manifest.get('version')} "
+            f"(this code reads version {BUNDLE_VERSION})"
+        )
+    
+    arrays = {
+        name: np.load(bundle_dir / f"{name}.npy", mmap_mode='r' if mmap else None, allow_pickle=False)
+        for name in manifest['arrays']
+    }
+    return arrays, manifest['metadata']
+
+
+class NeighbourTable:
+    """
+    Precomputed top-K neighbour lists for every user (or every meal).
+    
+    Row i holds the neighbours of ids[i] as indices into ids, best first,
+    padded with -1 when a row has fewer than K neighbours.
+    """
+    
+    def __init__(self, ids: np.ndarray, neighbours: np.ndarray, similarities: np.ndarray):
+        self.ids = ids
+        self.neighbours = neighbours
+        self.similarities = similarities
+    
+    @property
+    def k(self) -> int:
+        return self.neighbours.shape[1]
+    
+    def lookup(self, item_id, k: int) -> List[Tuple]:
+        """Return up to k (neighbour_id, similarity) pairs; [] for unknown ids."""
+        row = SparseRatingMatrix._lookup(self.ids, item_id)
+        if row < 0:
+            return []
+        neighbours = self.neighbours[row, :k]
+        neighbours = neighbours[neighbours >= 0]
+        return [
+            (self.ids[idx].item(), float(sim))
+            for idx, sim in zip(neighbours, self.similarities[row, :len(neighbours)])
+        ]
+    
+    def remapped(self, ids: np.ndarray, index_map: np.ndarray) -> "NeighbourTable":
+        """Copy of the table re-indexed onto a grown id array (new rows are empty)."""
+        neighbours = np.full((len(ids), self.k), -1, dtype=np.int32)
+        similarities = np.zeros((len(ids), self.k), dtype=np.float32)
+        old = np.asarray(self.neighbours)
+        neighbours[index_map] = np.where(old >= 0, index_map[old], -1)
+        similarities[index_map] = self.similarities
+        return NeighbourTable(ids, neighbours, similarities)
+    
+    def set_row(self, row: int, scores: np.ndarray) -> None:
+        """Replace one row with the top-k of a full similarity vector."""
+        top = top_k_indices(scores, self.k)
+        self.neighbours[row] = -1
+        self.similarities[row] = 0.0
+        self.neighbours[row, :len(top)] = top
+        self.similarities[row, :len(top)] = scores[top]
+    
+    def rows_of(self, item_ids: np.ndarray) -> np.ndarray:
+        """Vectorized row lookup; unknown ids map to -1."""
+        return _lookup_many(self.ids, np.asarray(item_ids, dtype=self.ids.dtype))
+    
+    def to_dict(self) -> Dict:
+        return {
+            'ids': self.ids,
+            'neighbours': self.neighbours,
+            'similarities': self.similarities
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> "NeighbourTable":
+        return cls(data['ids'], data['neighbours'], data['similarities'])
+
+
+def _splitmix64(values: np.ndarray) -> np.ndarray:
+    """Vectorized splitmix64 finalizer: a fast, well-mixed 64-bit hash."""
+    values = values.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def _cosine_to_rows(
+    rows: np.ndarray,
+    columns: np.ndarray,
+    values: np.ndarray,
+    norm: float,
+    rows_csr: Tuple,
+    norms: np.ndarray,
+    n_columns: int
+) -> np.ndarray:
+    """
+    Cosine similarity of a sparse vector to selected CSR rows only.
+    
+    Cost is proportional to the nonzeros of the selected rows (plus one
+    dense vector of n_columns), not the number of rows in the matrix.
+    """
+    indptr, indices, data = rows_csr
+    if len(rows) == 0 or len(columns) == 0 or norm == 0:
+        return np.zeros(len(rows))
+    
+    dense = np.zeros(n_columns)
+    dense[columns] = values
+    positions = _gather_positions(indptr, rows)
+    lengths = indptr[rows + 1] - indptr[rows]
+    weights = data[positions] * dense[indices[positions]]
+    dots = np.bincount(np.repeat(np.arange(len(rows)), lengths), weights=weights, minlength=len(rows))
+    
+    denominators = norms[rows] * norm
+    return np.divide(dots, denominators, out=np.zeros(len(rows)), where=denominators > 0)
+
+
+class RandomProjectionLSH:
+    """
+    Approximate nearest-neighbour index over user rating vectors.
+    
+    Each of n_tables hash tables signs n_bits random ±1 projections of a
+    user's rating vector into a bucket code (random-hyperplane LSH for
+    cosine similarity). A query collects the users sharing its bucket in
+    every table, optionally probing the neighbouring buckets whose bits
+    were closest to flipping, keeps the max_candidates users that collided
+    in the most tables, and ranks only those exactly.
+    
+    The hyperplanes are derived from a hash of (meal_id, seed) instead
+    of being stored, so any meal id, including ones the index was not
+    built with, has a projection.
+    
+    Recall/latency knobs: n_tables and n_bits at build time, probes
+    (extra buckets per table) and max_candidates at query time. Two users
+    agree on each bit with probability 1 - angle/pi, so recall depends on
+    how similar the true neighbours are: near-duplicate tastes (cosine
+    ~0.8) are found reliably, near-orthogonal neighbours (cosine ~0.3)
+    are not, whatever the settings.
+    
+    The index only pays off at scale. Exact sparse search touches just
+    the ratings of the meals the query rated, so it stays faster up to
+    hundreds of thousands of users; below min_users the model searches
+    exactly (scripts/benchmark_lsh.py measures the crossover).
+    """
+    
+    def __init__(
+        self,
+        codes: np.ndarray,
+        order: np.ndarray,
+        n_bits: int,
+        seed: int = 42,
+        probes: int = 2,
+        max_candidates: int = 2000
+    ):
+        self.codes = codes  # (n_tables, n_users) bucket codes, sorted per table
+        self.order = order  # (n_tables, n_users) user index of each sorted code
+        self.n_bits = n_bits
+        self.seed = seed
+        self.probes = probes
+        self.max_candidates = max_candidates  # users ranked exactly per query
+        self.min_users = 500_000  # smaller matrices are searched exactly
+    
+    @property
+    def n_tables(self) -> int:
+        return self.codes.shape[0]
+    
+    def pays_off(self, matrix: SparseRatingMatrix) -> bool:
+        """Whether searching this matrix through the index beats exact search."""
+        return matrix.n_users >= self.min_users
+    
+    def planes_for(self, meal_ids: np.ndarray, n_tables: Optional[int] = None) -> np.ndarray:
+        """±1 hyperplane coordinates of the given meals, shape (len(meal_ids), n_tables * n_bits)."""
+        n_planes = (n_tables or self.n_tables) * self.n_bits
+        n_words = -(-n_planes // 64)
+        keys = (np.asarray(meal_ids, dtype=np.int64).astype(np.uint64)[:, None] * np.uint64(n_words)
+                + np.arange(n_words, dtype=np.uint64)
+                + np.uint64((self.seed * 0x632BE59BD9B4E019) & 0xFFFFFFFFFFFFFFFF))
+        bits = np.unpackbits(_splitmix64(keys).view(np.uint8), axis=1)[:, :n_planes]
+        return bits.astype(np.float32) * 2 - 1
+    
+    def _pack(self, projections: np.ndarray) -> np.ndarray:
+        """Sign bits of (..., n_tables * n_bits) projections as (..., n_tables) codes."""
+        bits = (projections > 0).reshape(projections.shape[:-1] + (-1, self.n_bits))
+        weights = np.uint64(1) << np.arange(self.n_bits, dtype=np.uint64)
+        return (bits.astype(np.uint64) * weights).sum(axis=-1, dtype=np.uint64)
+    
+    # Users gathered from the buckets per candidate kept (the rest lose the collision vote)
+    GATHER_FACTOR = 16
+    
+    @classmethod
+    def default_bits(cls, n_users: int, n_tables: int, probes: int, max_candidates: int) -> int:
+        """
+        Bits per table sized from the candidate budget.
+        
+        A query probes n_tables * (probes + 1) buckets of n_users / 2**n_bits
+        users each on average. This picks the fewest bits (the largest
+        buckets, the best recall) that keep the users gathered within
+        GATHER_FACTOR * max_candidates; the collision vote then keeps
+        max_candidates of them.
+        """
+        gathered = n_users * n_tables * (probes + 1) / (cls.GATHER_FACTOR * max_candidates)
+        return int(min(64, max(1, math.ceil(math.log2(max(gathered, 1.0))))))
+    
+    @classmethod
+    def build(
+        cls,
+        matrix: SparseRatingMatrix,
+        n_tables: int = 16,
+        n_bits: Optional[int] = None,
+        seed: int = 42,
+        probes: int = 2,
+        max_candidates: int = 2000
+    ) -> "RandomProjectionLSH":
+        """
+        Hash every user of the matrix into n_tables tables of 2**n_bits buckets.
+        
+        n_bits defaults to default_bits() for the matrix and candidate budget.
+        """
+        if n_bits is None:
+            n_bits = cls.default_bits(matrix.n_users, n_tables, probes, max_candidates)
+        if not 1 <= n_bits <= 64:
+            raise ValueError("n_bits must be between 1 and 64")
+        index = cls(np.empty((n_tables, 0), dtype=np.uint64), np.empty((n_tables, 0), dtype=np.int32),
+                    n_bits, seed, probes, max_candidates)
+        
+        # R @ planes, one bincount per hyperplane, one table at a time to bound memory
+        planes = index.planes_for(matrix.meal_ids, n_tables)
+        rows = np.repeat(np.arange(matrix.n_users), np.diff(matrix.indptr))
+        index.codes = np.empty((n_tables, matrix.n_users), dtype=np.uint64)
+        index.order = np.empty((n_tables, matrix.n_users), dtype=np.int32)
+        projections = np.empty((matrix.n_users, n_bits), dtype=np.float32)
+        for table in range(n_tables):
+            for bit in range(n_bits):
+                projections[:, bit] = np.bincount(
+                    rows, weights=matrix.data * planes[matrix.indices, table * n_bits + bit],
+                    minlength=matrix.n_users
+                )
+            codes = index._pack(projections)[:, 0]
+            order = np.argsort(codes, kind='stable')
+            index.codes[table] = codes[order]
+            index.order[table] = order
+        return index
+    
+    def candidates(self, meal_ids: np.ndarray, values: np.ndarray, probes: Optional[int] = None) -> np.ndarray:
+        """
+        Indices of users sharing a (probed) bucket with the rating vector, in any table.
+        
+        At most max_candidates users are returned: those colliding with
+        the query in the most tables, ties by user index. Each probed
+        bucket contributes at most max_candidates users, so the work per
+        query stays bounded when buckets grow.
+        """
+        probes = self.probes if probes is None else min(probes, self.n_bits)
+        projections = values.astype(np.float32) @ self.planes_for(meal_ids)
+        codes = self._pack(projections)
+        
+        probe_codes = codes[:, None]
+        if probes:
+            # Flip, per table, the bits whose projections were nearest zero
+            margins = np.abs(projections).reshape(self.n_tables, self.n_bits)
+            flip = np.argsort(margins, axis=1)[:, :probes].astype(np.uint64)
+            probe_codes = np.concatenate([probe_codes, codes[:, None] ^ (np.uint64(1) << flip)], axis=1)
+        
+        # Bucket bounds in every table, then one gather over the flattened order
+        n_users = self.codes.shape[1]
+        lo = np.empty(probe_codes.shape, dtype=np.int64)
+        hi = np.empty(probe_codes.shape, dtype=np.int64)
+        for table in range(self.n_tables):
+            lo[table] = np.searchsorted(self.codes[table], probe_codes[table], side='left')
+            hi[table] = np.searchsorted(self.codes[table], probe_codes[table], side='right')
+        starts = (lo + np.arange(self.n_tables)[:, None] * n_users).ravel()
+        lengths = np.minimum(hi - lo, self.max_candidates).ravel()
+        found = self.order.reshape(-1)[
+            np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        ]
+        
+        users, collisions = np.unique(found, return_counts=True)
+        if len(users) > self.max_candidates:
+            users = np.sort(users[top_k_indices(collisions, self.max_candidates)])
+        return users.astype(np.int32)
+    
+    def query(
+        self,
+        matrix: SparseRatingMatrix,
+        ratings: Dict[int, float],
+        k: int,
+        exclude: int = -1,
+        probes: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Approximate top-k users for a {meal_id: rating} vector.
+        
+        Candidates are ranked by exact cosine similarity, so every returned
+        similarity is exact; only neighbours outside the probed buckets can
+        be missed.
+        
+        Returns:
+            (user indices, similarities), best first
+        """
+        if not ratings:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        meal_ids = np.fromiter(ratings.keys(), dtype=np.int64, count=len(ratings))
+        values = np.fromiter(ratings.values(), dtype=np.float64, count=len(ratings))
+        
+        candidates = self.candidates(meal_ids, values, probes)
+        candidates = candidates[candidates != exclude]
+        
+        meal_idx = matrix.meal_indices_of(meal_ids)
+        known = meal_idx >= 0
+        scores = _cosine_to_rows(
+            candidates, meal_idx[known], values[known],
+            float(np.sqrt(np.sum(values ** 2))),
+            (matrix.indptr, matrix.indices, matrix.data), matrix.user_norms,
+            matrix.n_meals
+        )
+        top = top_k_indices(scores, k)
+        return candidates[top], scores[top]
+    
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        return {'user_lsh_codes': self.codes, 'user_lsh_order': self.order}
+    
+    def params(self) -> Dict:
+        return {'n_bits': self.n_bits, 'seed': self.seed, 'probes': self.probes,
+                'max_candidates': self.max_candidates}
+    
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], params: Dict) -> "RandomProjectionLSH":
+        return cls(arrays['user_lsh_codes'], arrays['user_lsh_order'], **params)
+
+
+class PopularityRankingMixin:
+    """
+    Presorted popularity ranking shared by the recommendation models.
+    
+    The ranking (positions into the model's meal ids, most popular first)
+    is computed once at training time, so the top N popular meals are a
+    slice instead of a sort. Optional facets aligned with the meal ids (a
+    category code and a diet-flag bitmask per meal) let the same ranking
+    answer "top N popular vegan lunches" with one vectorized mask.
+    
+    Expects meal_popularity, popularity_scores and matrix on the model.
+    Online updates publish new popularity arrays and then bump
+    _popularity_version; a ranking is tagged with the version it was
+    built for, so readers re-sort instead of serving a stale order.
+    """
+    
+    popularity_facets: Optional[Dict] = None  # categories, diet_flags, category_codes, diet_bits
+    _popularity_version = 0  # bumped after every online popularity change
+    _ranked_popularity: Optional[Tuple[int, np.ndarray]] = None  # (version ranked, ranking)
+    
+    @property
+    def popularity_ranking(self) -> Optional[np.ndarray]:
+        """Positions into the meal ids, most popular first."""
+        ranked = self._ranked_popularity
+        return None if ranked is None else ranked[1]
+    
+    @popularity_ranking.setter
+    def popularity_ranking(self, ranking: Optional[np.ndarray]) -> None:
+        self._ranked_popularity = None if ranking is None else (self._popularity_version, ranking)
+    
+    @staticmethod
+    def _rank_popularity(meal_ids: np.ndarray, scores: np.ndarray) -> np.ndarray:
+        """Positions sorted by popularity, ties by meal id."""
+        return np.lexsort((meal_ids, -scores)).astype(np.int32)
+    
+    def _popularity_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(meal ids, popularity scores) the ranking indexes into."""
+        if self.matrix is not None and self.popularity_scores is not None:
+            return np.asarray(self.matrix.meal_ids), np.asarray(self.popularity_scores)
+        meal_ids = np.fromiter(self.meal_popularity.keys(), dtype=np.int64, count=len(self.meal_popularity))
+        scores = np.fromiter(self.meal_popularity.values(), dtype=np.float64, count=len(self.meal_popularity))
+        return meal_ids, scores
+    
+    def build_popularity_ranking(
+        self,
+        meal_facets: Optional[Dict[int, Dict]] = None,
+        diet_flags: Sequence[str] = ()
+    ) -> None:
+        """
+        Sort meals by popularity (ties by meal id) and attach optional facets.
+        
+        Args:
+            meal_facets: {meal_id: {"category": str, <diet flag>: bool}}; meals
+                missing here match no category and no diet flag
+            diet_flags: Diet flag names to index (at most 64)
+        """
+        version = self._popularity_version
+        meal_ids, scores = self._popularity_arrays()
+        self._ranked_popularity = (version, self._rank_popularity(meal_ids, scores))
+        if meal_facets is None:
+            return
+        
+        categories = sorted({facet['category'] for facet in meal_facets.values() if facet.get('category')})
+        category_index = {category: code for code, category in enumerate(categories)}
+        category_codes = np.full(len(meal_ids), -1, dtype=np.int16)
+        diet_bits = np.zeros(len(meal_ids), dtype=np.uint64)
+        for position, meal_id in enumerate(meal_ids.tolist()):
+            facet = meal_facets.get(meal_id)
+            if facet is None:
+                continue
+            category_codes[position] = category_index.get(facet.get('category'), -1)
+            diet_bits[position] = sum(1 << bit for bit, flag in enumerate(diet_flags) if facet.get(flag))
+        
+        self.popularity_facets = {
+            'categories': categories,
+            'diet_flags': list(diet_flags),
+            'category_codes': category_codes,
+            'diet_bits': diet_bits,
+        }
+    
+    def _remapped_popularity_facets(self, n_meals: int, meal_map: np.ndarray) -> Optional[Dict]:
+        """Facets re-indexed onto a grown meal id array; new meals get no facets."""
+        if self.popularity_facets is None:
+            return None
+        category_codes = np.full(n_meals, -1, dtype=np.int16)
+        diet_bits = np.zeros(n_meals, dtype=np.uint64)
+        category_codes[meal_map] = self.popularity_facets['category_codes']
+        diet_bits[meal_map] = self.popularity_facets['diet_bits']
+        return dict(self.popularity_facets, category_codes=category_codes, diet_bits=diet_bits)
+    
+    @property
+    def has_popularity_facets(self) -> bool:
+        """Whether the ranking can be filtered by category and diet flags."""
+        return self.popularity_facets is not None
+    
+    def top_popular(
+        self,
+        limit: int,
+        category: Optional[str] = None,
+        diet_flags: Sequence[str] = ()
+    ) -> List[Tuple[int, float]]:
+        """
+        Most popular meals, best first, as (meal_id, popularity) pairs.
+        
+        Category and diet-flag filters need facets (see
+        build_popularity_ranking); without them the filters are ignored
+        and the caller has to filter.
+        """
+        version = self._popularity_version
+        meal_ids, scores = self._popularity_arrays()
+        ranked = self._ranked_popularity
+        if ranked is None or ranked[0] != version or len(ranked[1]) != len(meal_ids):
+            # Popularity changed online (or was never ranked): re-sort, keeping the facets
+            ranking = self._rank_popularity(meal_ids, scores)
+            self._ranked_popularity = (version, ranking)
+        else:
+            ranking = ranked[1]
+        facets = self.popularity_facets
+        if facets is not None and (category or diet_flags):
+            keep = np.ones(len(ranking), dtype=bool)
+            if category:
+                if category not in facets['categories']:
+                    return []
+                keep &= facets['category_codes'][ranking] == facets['categories'].index(category)
+            if diet_flags:
+                if any(flag not in facets['diet_flags'] for flag in diet_flags):
+                    return []
+                required = np.uint64(sum(1 << facets['diet_flags'].index(flag) for flag in diet_flags))
+                keep &= (facets['diet_bits'][ranking] & required) == required
+            ranking = ranking[keep]
+        
+        top = ranking[:limit]
+        return list(zip(meal_ids[top].tolist(), scores[top].tolist()))
+    
+    def _popularity_ranking_arrays(self) -> Dict[str, np.ndarray]:
+        """Ranking and facet arrays for saving."""
+        arrays = {}
+        if self.popularity_ranking is not None:
+            arrays['popularity_ranking'] = self.popularity_ranking
+        if self.popularity_facets is not None:
+            arrays['meal_category_codes'] = self.popularity_facets['category_codes']
+            arrays['meal_diet_bits'] = self.popularity_facets['diet_bits']
+        return arrays
+    
+    def _restore_popularity_ranking(self, arrays, categories: Sequence[str], diet_flags: Sequence[str]) -> None:
+        """Inverse of _popularity_ranking_arrays."""
+        if 'popularity_ranking' in arrays:
+            self.popularity_ranking = arrays['popularity_ranking']
+        if 'meal_category_codes' in arrays:
+            self.popularity_facets = {
+                'categories': list(categories),
+                'diet_flags': list(diet_flags),
+                'category_codes': arrays['meal_category_codes'],
+                'diet_bits': arrays['meal_diet_bits'],
+            }
+
+
+class CollaborativeFilteringModel(PopularityRankingMixin):
+    """
+    Simple collaborative filtering recommendation model.
+    Uses user-item interaction matrix with cosine similarity.
+    
+    Two similarity engines are available:
+    - "sparse" (default): CSR matrix with interned ids, one mat-vec per query
+    - "dict": the original nested-dict implementation, kept as a reference
+    """
+    
+    ENGINES = ("sparse", "dict")
+    
+    def __init__(self, engine: str = "sparse"):
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown engine '{engine}'. Expected one of {self.ENGINES}")
+        self.engine = engine
+        self.user_ratings = defaultdict(dict)  # {user_id: {meal_id: rating}}
+        self.meal_ratings = defaultdict(dict)  # {meal_id: {user_id: rating}}
+        self.user_similarities = {}  # Cached user similarities
+        self.meal_popularity = {}  # Meal popularity scores
+        self.matrix: Optional[SparseRatingMatrix] = None  # Built for the sparse engine
+        self.popularity_scores: Optional[np.ndarray] = None  # Popularity aligned with matrix.meal_ids
+        self.user_neighbours: Optional[NeighbourTable] = None  # Precomputed top-K similar users
+        self.meal_neighbours: Optional[NeighbourTable] = None  # Precomputed top-K similar meals
+        self.user_lsh: Optional[RandomProjectionLSH] = None  # Approximate user search
+        # Online updates applied on top of the matrix until the next compact()
+        self.rating_overlay: Dict[str, Dict[int, float]] = {}
+        # {user_id: (overlay dict searched from, neighbours)}
+        self._neighbour_cache: Dict[str, Tuple[Dict[int, float], List[Tuple[str, float]]]] = {}
+        self._meal_stats: Dict[int, Tuple[float, int]] = {}  # {meal_id: (rating sum, rating count)}
+        # (rating totals, rating counts, global mean) of the matrix; see _mean_ratings_of
+        self._meal_totals: Optional[Tuple[np.ndarray, np.ndarray, float]] = None
+        # Database time up to which the in-app ratings are part of the matrix
+        self.ratings_until: Optional[datetime] = None
+        self.is_trained = False
+    
+    @property
+    def n_users(self) -> int:
+        return self.matrix.n_users if self.matrix is not None else len(self.user_ratings)
+    
+    @property
+    def n_meals(self) -> int:
+        return self.matrix.n_meals if self.matrix is not None else len(self.meal_ratings)
+    
+    def _own_ratings(self, user_id: str) -> Dict[int, float]:
+        """The user's ratings, from the sparse matrix (plus online updates) when it is built."""
+        if self.matrix is not None:
+            ratings = self.matrix.ratings_of(user_id)
+            ratings.update(self.rating_overlay.get(user_id, {}))
+            return ratings
+        return self.user_ratings.get(user_id, {})
+    
+    def apply_rating(self, user_id: str, meal_id: int, rating: float) -> None:
+        """
+        Apply one new or changed rating to the trained model in place.
+        
+        The rating is recorded in an overlay over the (possibly memory-mapped)
+        CSR matrix and the meal's popularity score is updated; the user's
+        cached neighbour list no longer matches the overlay, so it is
+        recomputed from the new ratings. compact() later merges the overlay
+        into the matrix.
+        
+        Requests read the model without a lock while this runs, so nothing a
+        reader may be iterating is changed in place: the new ratings and
+        statistics are built as new objects and published by assigning
+        them. Calls must not overlap (CFModelUpdater serializes them).
+        """
+        user_id, meal_id, rating = str(user_id), int(meal_id), float(rating)
+        previous = self._own_ratings(user_id).get(meal_id)
+        
+        if self.matrix is None:
+            user_ratings = defaultdict(dict, self.user_ratings)
+            user_ratings[user_id] = {**user_ratings.get(user_id, {}), meal_id: rating}
+            meal_ratings = defaultdict(dict, self.meal_ratings)
+            meal_ratings[meal_id] = {**meal_ratings.get(meal_id, {}), user_id: rating}
+            self.user_ratings, self.meal_ratings = user_ratings, meal_ratings
+        else:
+            overlay = dict(self.rating_overlay)
+            overlay[user_id] = {**overlay.get(user_id, {}), meal_id: rating}
+            self.rating_overlay = overlay
+        
+        self._update_popularity(meal_id, rating, previous)
+    
+    def _update_popularity(self, meal_id: int, rating: float, previous: Optional[float]) -> None:
+        """Incrementally update one meal's popularity (avg rating * log(count + 1))."""
+        if self.matrix is None:
+            ratings = self.meal_ratings[meal_id]
+            total, count = sum(ratings.values()), len(ratings)
+            meal_popularity = dict(self.meal_popularity)  # the dict engine ranks by iterating it
+        else:
+            stats = self._meal_stats.get(meal_id)
+            if stats is None:
+                meal_idx = self.matrix.meal_index(meal_id)
+                if meal_idx >= 0:
+                    start, end = self.matrix.meal_indptr[meal_idx], self.matrix.meal_indptr[meal_idx + 1]
+                    stats = (float(np.sum(self.matrix.meal_data[start:end])), int(end - start))
+                else:
+                    stats = (0.0, 0)
+            total, count = stats
+            if previous is None:
+                total, count = total + rating, count + 1
+            else:
+                total += rating - previous
+            self._meal_stats[meal_id] = (total, count)
+            meal_popularity = self.meal_popularity  # only read by key while serving
+        
+        popularity = (total / count) * math.log(count + 1)
+        meal_popularity[meal_id] = popularity
+        self.meal_popularity = meal_popularity
+        if self.matrix is not None:
+            meal_idx = self.matrix.meal_index(meal_id)
+            if meal_idx >= 0:
+                popularity_scores = np.array(self.popularity_scores)
+                popularity_scores[meal_idx] = popularity
+                self.popularity_scores = popularity_scores
+        self._popularity_version += 1
+    
+    def compact(self) -> None:
+        """
+        Merge the online rating overlay into the CSR matrix.
+        
+        Neighbour tables are re-indexed onto the grown id arrays, and the
+        rows of updated users and meals are recomputed against the new matrix
+        (keeping each table's own K). The new state is built aside and
+        published in one step; still, compaction is meant for a model that
+        is not being served (CFModelUpdater.snapshot compacts a private copy).
+        """
+        if self.matrix is None or not self.rating_overlay:
+            return
+        
+        overlay = self.rating_overlay
+        matrix, user_map, meal_map = self.matrix.with_ratings(overlay)
+        touched_meals = {meal_id for ratings in overlay.values() for meal_id in ratings}
+        
+        user_neighbours = meal_neighbours = None
+        if self.user_neighbours is not None:
+            user_neighbours = self.user_neighbours.remapped(matrix.user_ids, user_map)
+            for user_id in overlay:
+                user_idx = matrix.user_index(user_id)
+                user_neighbours.set_row(user_idx, matrix.user_similarities(user_idx))
+        if self.meal_neighbours is not None:
+            meal_neighbours = self.meal_neighbours.remapped(matrix.meal_ids, meal_map)
+            for meal_id in touched_meals:
+                meal_idx = matrix.meal_index(meal_id)
+                meal_neighbours.set_row(meal_idx, matrix.meal_similarities(meal_idx))
+        
+        popularity_scores = np.array(
+            [self.meal_popularity.get(meal_id, 3.0) for meal_id in matrix.meal_ids.tolist()],
+            dtype=np.float64
+        )
+        user_lsh = self.user_lsh
+        if user_lsh is not None:
+            # User indices shift as users are added, so re-hash against the new matrix
+            user_lsh = RandomProjectionLSH.build(matrix, user_lsh.n_tables, **user_lsh.params())
+        version = self._popularity_version + 1
+        self.__dict__.update(
+            matrix=matrix,
+            popularity_scores=popularity_scores,
+            popularity_facets=self._remapped_popularity_facets(matrix.n_meals, meal_map),
+            _ranked_popularity=(version, self._rank_popularity(matrix.meal_ids, popularity_scores)),
+            _popularity_version=version,
+            user_neighbours=user_neighbours,
+            meal_neighbours=meal_neighbours,
+            user_lsh=user_lsh,
+            rating_overlay={},
+            _neighbour_cache={},
+            _meal_stats={},
+            _meal_totals=None,
+        )
+    
+    def cosine_similarity(self, user1_ratings: Dict, user2_ratings: Dict) -> float:
+        """Calculate cosine similarity between two users."""
+        # Get common meals
+        common_meals = set(user1_ratings.keys()) & set(user2_ratings.keys())
+        
+        if not common_meals:
+            return 0.0
+        
+        # Calculate dot product and magnitudes
+        dot_product = sum(user1_ratings[meal] * user2_ratings[meal] for meal in common_meals)
+        mag1 = sum(r ** 2 for r in user1_ratings.values()) ** 0.5
+        mag2 = sum(r ** 2 for r in user2_ratings.values()) ** 0.5
+        
+        if mag1 == 0 or mag2 == 0:
+            return 0.0
+        
+        return dot_product / (mag1 * mag2)
+    
+    def build_sparse_matrix(self):
+        """Intern ids and build the CSR rating matrix used by the sparse engine."""
+        logger.info("Building sparse rating matrix...")
+        self.matrix = SparseRatingMatrix.from_ratings(self.user_ratings)
+        self._meal_totals = None
+        self.popularity_scores = np.array(
+            [self.meal_popularity.get(int(meal_id), 3.0) for meal_id in self.matrix.meal_ids],
+            dtype=np.float64
+        )
+        logger.info(
+            f"Sparse matrix: {self.matrix.n_users:,} users x {self.matrix.n_meals:,} meals, "
+            f"{len(self.matrix.data):,} ratings"
+        )
+    
+    def find_similar_users(self, user_id: str, k: int = 50) -> List[Tuple[str, float]]:
+        """Find k most similar users to given user."""
+        overlay = self.rating_overlay.get(user_id) if self.matrix is not None else None
+        if overlay is not None:
+            # Ratings changed online: search from the merged ratings and cache the
+            # result with the overlay it was computed from
+            cached = self._neighbour_cache.get(user_id)
+            if cached is None or cached[0] is not overlay or len(cached[1]) < k:
+                ratings = self.matrix.ratings_of(user_id)
+                ratings.update(overlay)
+                user_idx = self.matrix.user_index(user_id)
+                if self.user_lsh is not None and self.user_lsh.pays_off(self.matrix):
+                    neighbours, scores = self.user_lsh.query(self.matrix, ratings, max(k, 50), exclude=user_idx)
+                else:
+                    similarities = self.matrix.similarities_to_ratings(ratings)
+                    if user_idx >= 0:
+                        similarities[user_idx] = 0.0
+                    neighbours = top_k_indices(similarities, max(k, 50))
+                    scores = similarities[neighbours]
+                cached = (overlay, [
+                    (str(self.matrix.user_ids[idx]), float(score))
+                    for idx, score in zip(neighbours, scores)
+                ])
+                self._neighbour_cache[user_id] = cached
+            return cached[1][:k]
+        
+        if self.matrix is not None:
+            user_idx = self.matrix.user_index(user_id)
+            if user_idx < 0:
+                return []
+            if self.user_neighbours is not None:
+                return self.user_neighbours.lookup(user_id, k)
+            if self.user_lsh is not None and self.user_lsh.pays_off(self.matrix):
+                neighbours, scores = self.user_lsh.query(
+                    self.matrix, self.matrix.ratings_of(user_id), k, exclude=user_idx
+                )
+                return [
+                    (str(self.matrix.user_ids[idx]), float(score))
+                    for idx, score in zip(neighbours, scores)
+                ]
+            similarities = self.matrix.user_similarities(user_idx)
+            return [
+                (str(self.matrix.user_ids[idx]), float(similarities[idx]))
+                for idx in top_k_indices(similarities, k)
+            ]
+        
+        if user_id not in self.user_ratings:
+            return []
+        
+        if self.user_neighbours is not None:
+            return self.user_neighbours.lookup(user_id, k)
+        
+        user_ratings = self.user_ratings[user_id]
+        similarities = []
+        
+        for other_user_id, other_ratings in self.user_ratings.items():
+            if other_user_id == user_id:
+                continue
+            
+            similarity = self.cosine_similarity(user_ratings, other_ratings)
+            if similarity > 0:
+                similarities.append((other_user_id, similarity))
+        
+        # Sort by similarity and return top k
+        similarities.sort(key=lambda x: x[1], reverse=True)
+        return similarities[:k]
+    
+    def find_similar_meals(self, meal_id: int, k: int = 50) -> List[Tuple[int, float]]:
+        """Find k most similar meals to given meal (by co-rating cosine)."""
+        if self.meal_neighbours is not None:
+            return self.meal_neighbours.lookup(int(meal_id), k)
+        
+        if self.matrix is None:
+            return []
+        meal_idx = self.matrix.meal_index(meal_id)
+        if meal_idx < 0:
+            return []
+        similarities = self.matrix.meal_similarities(meal_idx)
+        return [
+            (int(self.matrix.meal_ids[idx]), float(similarities[idx]))
+            for idx in top_k_indices(similarities, k)
+        ]
+    
+    def predict_rating(self, user_id: str, meal_id: int) -> float:
+        """
+        Predict rating for a user-meal pair using collaborative filtering.
+        Falls back to the meal's shrunk mean rating if no neighbour rated it.
+        """
+        # If user has rated this meal, return that rating
+        own_ratings = self._own_ratings(user_id)
+        if meal_id in own_ratings:
+            return own_ratings[meal_id]
+        
+        return float(self.predict_ratings(user_id, [meal_id])[0])
+    
+    def _predict_from_neighbours(
+        self, meal_id: int, similar_users: List[Tuple[str, float]], fallback: float
+    ) -> float:
+        """Weighted average of the neighbours' ratings for one meal (fallback if none rated it)."""
+        if not similar_users:
+            return fallback
+        
+        # Weighted average of similar users' ratings
+        total_weight = 0.0
+        weighted_sum = 0.0
+        
+        for similar_user_id, similarity in similar_users:
+            if meal_id in self.user_ratings[similar_user_id]:
+                rating = self.user_ratings[similar_user_id][meal_id]
+                weighted_sum += rating * similarity
+                total_weight += abs(similarity)
+        
+        if total_weight > 0:
+            predicted = weighted_sum / total_weight
+            # Ensure rating is in [1, 5] range
+            return max(1.0, min(5.0, predicted))
+        else:
+            return fallback
+    
+    def predict_ratings(self, user_id: str, meal_ids: List[int]) -> np.ndarray:
+        """
+        Predict ratings for many meals at once.
+        
+        The neighbourhood is searched once and every meal is then scored
+        from the same neighbour set, giving the same values as calling
+        predict_rating for each meal. Meals no neighbour rated fall back to
+        their shrunk mean rating (see _mean_ratings_of), which is on the
+        same 1-5 scale as the neighbour predictions.
+        """
+        meal_ids = np.asarray(meal_ids, dtype=np.int64)
+        own_ratings = self._own_ratings(user_id)
+        similar_users = self.find_similar_users(user_id, k=20)
+        fallback = self._mean_ratings_of(meal_ids)
+        
+        if self.matrix is None:
+            return np.array([
+                own_ratings[meal_id] if meal_id in own_ratings
+                else self._predict_from_neighbours(meal_id, similar_users, fallback[position])
+                for position, meal_id in enumerate(meal_ids.tolist())
+            ], dtype=np.float64)
+        
+        matrix = self.matrix
+        meal_idx = matrix.meal_indices_of(meal_ids)
+        known = meal_idx >= 0
+        
+        if not similar_users:
+            predictions = fallback
+        else:
+            # One neighbour-weighted sum over the neighbours' rating rows
+            neighbours = np.array([matrix.user_index(uid) for uid, _ in similar_users])
+            similarities = np.array([sim for _, sim in similar_users])
+            positions = _gather_positions(matrix.indptr, neighbours)
+            lengths = matrix.indptr[neighbours + 1] - matrix.indptr[neighbours]
+            meals = matrix.indices[positions]
+            weights = np.repeat(similarities, lengths)
+            weighted_sum = np.bincount(
+                meals, weights=matrix.data[positions] * weights, minlength=matrix.n_meals
+            )
+            total_weight = np.bincount(meals, weights=np.abs(weights), minlength=matrix.n_meals)
+            
+            totals = np.where(known, total_weight[meal_idx], 0.0)
+            sums = np.where(known, weighted_sum[meal_idx], 0.0)
+            predictions = np.where(
+                totals > 0,
+                np.clip(np.divide(sums, totals, out=np.zeros_like(sums), where=totals > 0), 1.0, 5.0),
+                fallback
+            )
+        
+        if own_ratings:
+            rated = np.array([meal_id in own_ratings for meal_id in meal_ids.tolist()], dtype=bool)
+            predictions[rated] = [own_ratings[meal_id] for meal_id in meal_ids[rated].tolist()]
+        return predictions
+    
+    # Pseudo-ratings at the global mean added to every meal's mean rating
+    FALLBACK_PRIOR_COUNT = 5
+    
+    def _mean_ratings_of(self, meal_ids: np.ndarray) -> np.ndarray:
+        """
+        Fallback prediction per meal: its mean rating, shrunk toward the
+        global mean by FALLBACK_PRIOR_COUNT pseudo-ratings (the global
+        mean for unknown meals).
+        
+        The per-meal totals of the matrix are cached until the matrix is
+        replaced; ratings applied online since then come from _meal_stats.
+        """
+        prior = self.FALLBACK_PRIOR_COUNT
+        if self.matrix is None:
+            ratings = [self.meal_ratings.get(meal_id, {}) for meal_id in meal_ids.tolist()]
+            all_ratings = [rating for meal in self.meal_ratings.values() for rating in meal.values()]
+            global_mean = float(np.mean(all_ratings)) if all_ratings else 3.0
+            totals = np.array([sum(meal.values()) for meal in ratings], dtype=np.float64)
+            counts = np.array([len(meal) for meal in ratings], dtype=np.float64)
+            return (totals + prior * global_mean) / (counts + prior)
+        
+        if self._meal_totals is None:
+            matrix = self.matrix
+            counts = np.diff(matrix.meal_indptr).astype(np.float64)
+            totals = np.bincount(matrix.indices, weights=matrix.data, minlength=matrix.n_meals)
+            global_mean = float(matrix.data.mean()) if len(matrix.data) else 3.0
+            self._meal_totals = (totals, counts, global_mean)
+        all_totals, all_counts, global_mean = self._meal_totals
+        
+        meal_idx = self.matrix.meal_indices_of(meal_ids)
+        known = meal_idx >= 0
+        totals = np.where(known, all_totals[meal_idx], 0.0)
+        counts = np.where(known, all_counts[meal_idx], 0.0)
+        if self._meal_stats:
+            # Meals rated online since the matrix was built
+            for position, meal_id in enumerate(meal_ids.tolist()):
+                stats = self._meal_stats.get(meal_id)
+                if stats is not None:
+                    totals[position], counts[position] = stats
+        return (totals + prior * global_mean) / (counts + prior)
+    
+    def get_recommendations(self, user_id: str, all_meal_ids: List[int], 
+                           limit: int = 10) -> List[Tuple[int, float]]:
+        """
+        Get top recommendations for a user.
+        Returns list of (meal_id, predicted_rating) tuples.
+        
+        All candidate meals are scored in one batched pass (see
+        predict_ratings) and only the top `limit` are returned.
+        """
+        # Get meals user hasn't rated
+        user_rated = set(self._own_ratings(user_id).keys())
+        candidate_meals = [mid for mid in all_meal_ids if mid not in user_rated]
+        
+        if not candidate_meals:
+            # User has rated everything, return the best-rated meals
+            mean_ratings = self._mean_ratings_of(np.asarray(all_meal_ids, dtype=np.int64))
+            top = top_k_indices(mean_ratings, limit, positive_only=False)
+            return [(all_meal_ids[i], float(mean_ratings[i])) for i in top]
+        
+        # Predict ratings for all candidate meals at once
+        predictions = self.predict_ratings(user_id, candidate_meals)
+        
+        # Best predicted ratings, keeping candidate order on ties
+        top = top_k_indices(predictions, limit, positive_only=False)
+        
+        return [(candidate_meals[i], float(predictions[i])) for i in top]
+    
+    def save(self, model_file: Path):
+        """Save trained model."""
+        logger.info(f"Saving model to: {model_file}")
+        
+        model_data = {
+            'user_ratings': dict(self.user_ratings),
+            'meal_ratings': dict(self.meal_ratings),
+            'meal_popularity': self.meal_popularity,
+            'user_neighbours': self.user_neighbours.to_dict() if self.user_neighbours else None,
+            'meal_neighbours': self.meal_neighbours.to_dict() if self.meal_neighbours else None,
+            'is_trained': self.is_trained
+        }
+        
+        with open(model_file, 'wb') as f:
+            pickle.dump(model_data, f)
+        
+        logger.info("✅ Model saved!")
+    
+    def save_bundle(self, bundle_dir: Path):
+        """
+        Save the model as a versioned, memory-mappable array bundle.
+        
+        Holds the interned id maps, both CSR layouts with their norms, the
+        popularity array and the neighbour tables; nothing is pickled.
+        """
+        logger.info(f"Saving model bundle to: {bundle_dir}")
+        if self.matrix is None:
+            self.build_sparse_matrix()
+        if self.rating_overlay:
+            logger.warning("Online rating updates are not saved until compact() is called")
+        
+        arrays = self.matrix.to_arrays()
+        arrays['popularity'] = self.popularity_scores
+        for name, table in (('user', self.user_neighbours), ('meal', self.meal_neighbours)):
+            if table is not None:
+                arrays[f'{name}_neighbours'] = table.neighbours
+                arrays[f'{name}_neighbour_similarities'] = table.similarities
+        if self.user_lsh is not None:
+            arrays.update(self.user_lsh.to_arrays())
+        arrays.update(self._popularity_ranking_arrays())
+        facets = self.popularity_facets or {}
+        
+        write_array_bundle(bundle_dir, arrays, {
+            'model_class': type(self).__name__,
+            'is_trained': self.is_trained,
+            'user_lsh': self.user_lsh.params() if self.user_lsh is not None else None,
+            'popularity_categories': facets.get('categories', []),
+            'popularity_diet_flags': facets.get('diet_flags', []),
+            'ratings_until': self.ratings_until.isoformat() if self.ratings_until is not None else None,
+        })
+        logger.info("✅ Model saved!")
+    
+    @classmethod
+    def load_bundle(cls, bundle_dir: Path, mmap: bool = True):
+        """Load a model bundle; arrays are memory-mapped unless mmap=False."""
+        logger.info(f"Loading model bundle from: {bundle_dir}")
+        arrays, metadata = read_array_bundle(bundle_dir, mmap=mmap)
+        
+        model = cls(engine="sparse")
+        model.matrix = SparseRatingMatrix.from_arrays(arrays)
+        model.popularity_scores = arrays['popularity']
+        model.meal_popularity = dict(zip(
+            model.matrix.meal_ids.tolist(), model.popularity_scores.tolist()
+        ))
+        if 'user_neighbours' in arrays:
+            model.user_neighbours = NeighbourTable(
+                model.matrix.user_ids, arrays['user_neighbours'], arrays['user_neighbour_similarities']
+            )
+        if 'meal_neighbours' in arrays:
+            model.meal_neighbours = NeighbourTable(
+                model.matrix.meal_ids, arrays['meal_neighbours'], arrays['meal_neighbour_similarities']
+            )
+        if metadata.get('user_lsh'):
+            model.user_lsh = RandomProjectionLSH.from_arrays(arrays, metadata['user_lsh'])
+        model._restore_popularity_ranking(
+            arrays, metadata.get('popularity_categories', []), metadata.get('popularity_diet_flags', [])
+        )
+        model.is_trained = metadata.get('is_trained', True)
+        if metadata.get('ratings_until'):
+            model.ratings_until = datetime.fromisoformat(metadata['ratings_until'])
+        
+        logger.info("✅ Model loaded!")
+        return model
+    
+    @classmethod
+    def load(cls, model_file: Path, engine: str = "sparse"):
+        """Load trained model (array bundle directory or legacy pickle)."""
+        if Path(model_file).is_dir():
+            return cls.load_bundle(model_file)
+        
+        logger.info(f"Loading model from: {model_file}")
+        
+        with open(model_file, 'rb') as f:
+            model_data = pickle.load(f)
+        
+        model = cls(engine=engine)
+        model.user_ratings = defaultdict(dict, model_data['user_ratings'])
+        model.meal_ratings = defaultdict(dict, model_data['meal_ratings'])
+        model.meal_popularity = model_data['meal_popularity']
+        model.is_trained = model_data['is_trained']
+        if model_data.get('user_neighbours'):
+            model.user_neighbours = NeighbourTable.from_dict(model_data['user_neighbours'])
+        if model_data.get('meal_neighbours'):
+            model.meal_neighbours = NeighbourTable.from_dict(model_data['meal_neighbours'])
+        
+        # Convert nested dicts back to defaultdicts
+        for user_id, ratings in model.user_ratings.items():
+            model.user_ratings[user_id] = dict(ratings)
+        for meal_id, ratings in model.meal_ratings.items():
+            model.meal_ratings[meal_id] = dict(ratings)
+        
+        if engine == "sparse" and model.user_ratings:
+            model.build_sparse_matrix()
+        
+        logger.info("✅ Model loaded!")
+        return model
+
+
+class ItemItemCollaborativeFilteringModel(CollaborativeFilteringModel):
+    """
+    Item-item collaborative filtering model.
+    
+    Builds a truncated meal-meal similarity table at training time and
+    scores candidates from the meals the user has rated: each rated meal
+    spreads its rating over its top-K similar meals. Serving cost depends
+    on the length of the user's history, not on the number of users.
+    """
+    
+    def predict_rating(self, user_id: str, meal_id: int) -> float:
+        """Predict rating for a user-meal pair from the user's rated meals."""
+        return float(self.predict_ratings(user_id, [meal_id])[0])
+    
+    def predict_ratings(self, user_id: str, meal_ids: List[int]) -> np.ndarray:
+        """
+        Predict ratings for many meals at once.
+        
+        Weighted average of the user's own ratings over the rated meals
+        whose similarity lists contain the candidate. Meals no rated meal
+        points at fall back to their shrunk mean rating (see
+        _mean_ratings_of), which is on the same 1-5 scale, so a meal
+        similar to ones the user liked can outrank one that is merely
+        often rated.
+        """
+        meal_ids = np.asarray(meal_ids, dtype=np.int64)
+        own_ratings = self._own_ratings(user_id)
+        predictions = self._mean_ratings_of(meal_ids)
+        
+        if not own_ratings:
+            return predictions
+        
+        if self.meal_neighbours is not None:
+            table = self.meal_neighbours
+            rated_rows = table.rows_of(list(own_ratings.keys()))
+            ratings = np.array(list(own_ratings.values()), dtype=np.float64)[rated_rows >= 0]
+            rated_rows = rated_rows[rated_rows >= 0]
+            
+            neighbours = table.neighbours[rated_rows]
+            similarities = table.similarities[rated_rows].astype(np.float64)
+            valid = neighbours >= 0
+            targets = neighbours[valid]
+            weights = similarities[valid]
+            weighted_sum = np.bincount(
+                targets, weights=weights * np.repeat(ratings, valid.sum(axis=1)),
+                minlength=len(table.ids)
+            )
+            total_weight = np.bincount(targets, weights=np.abs(weights), minlength=len(table.ids))
+            
+            rows = table.rows_of(meal_ids)
+            totals = np.where(rows >= 0, total_weight[rows], 0.0)
+            sums = np.where(rows >= 0, weighted_sum[rows], 0.0)
+            scored = totals > 0
+            predictions[scored] = np.clip(sums[scored] / totals[scored], 1.0, 5.0)
+        
+        rated = np.array([meal_id in own_ratings for meal_id in meal_ids.tolist()], dtype=bool)
+        predictions[rated] = [own_ratings[meal_id] for meal_id in meal_ids[rated].tolist()]
+        return predictions
+
+
+class MatrixFactorizationModel(PopularityRankingMixin):
+    """
+    Latent-factor recommendation model trained with alternating least squares.
+    
+    Ratings are modelled as global_mean + user_factors[u] . meal_factors[m]
+    and fitted on the observed ratings only (explicit feedback). Scoring
+    every meal for one user is a single dense matrix-vector product over
+    the (n_meals x factors) float32 meal factor matrix, so serving needs no
+    neighbour search. Users that are not in the training set are folded in
+    from their known ratings with one regularized least-squares solve.
+    """
+    
+    supports_fold_in = True
+    
+    def __init__(self, factors: int = 32, regularization: float = 0.1, iterations: int = 15):
+        self.factors = factors
+        self.regularization = regularization
+        self.iterations = iterations
+        self.matrix: Optional[SparseRatingMatrix] = None  # Training ratings (CSR)
+        self.user_factors: Optional[np.ndarray] = None  # (n_users, factors) float32
+        self.meal_factors: Optional[np.ndarray] = None  # (n_meals, factors) float32
+        self.global_mean = 3.0
+        self.meal_popularity = {}  # Meal popularity scores
+        self.popularity_scores: Optional[np.ndarray] = None  # Aligned with matrix.meal_ids
+        # (rating totals, rating counts) of the matrix; see _mean_ratings_of
+        self._meal_totals: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self.is_trained = False
+    
+    @property
+    def n_users(self) -> int:
+        return self.matrix.n_users if self.matrix is not None else 0
+    
+    @property
+    def n_meals(self) -> int:
+        return self.matrix.n_meals if self.matrix is not None else 0
+    
+    def _solve_one(self, fixed_rows: np.ndarray, ratings: np.ndarray, identity: np.ndarray) -> np.ndarray:
+        """Regularized least squares for one row (lambda scaled by its rating count)."""
+        residuals = ratings.astype(np.float64) - self.global_mean
+        gram = fixed_rows.T @ fixed_rows + self.regularization * len(ratings) * identity
+        return np.linalg.solve(gram, fixed_rows.T @ residuals)
+    
+    def fold_in(self, ratings: Dict[int, float]) -> Optional[np.ndarray]:
+        """
+        Compute factors for a user outside the training set.
+        
+        Args:
+            ratings: {meal_id: rating} for the user
+        
+        Returns:
+            Factor vector, or None if none of the rated meals are in the model
+        """
+        if not ratings:
+            return None
+        meal_idx = self.matrix.meal_indices_of(list(ratings.keys()))
+        known = meal_idx >= 0
+        if not known.any():
+            return None
+        values = np.array(list(ratings.values()), dtype=np.float64)[known]
+        fixed_rows = self.meal_factors[meal_idx[known]].astype(np.float64)
+        return self._solve_one(fixed_rows, values, np.eye(self.factors))
+    
+    def _user_vector(self, user_id: str, user_ratings: Optional[Dict[int, float]]) -> Optional[np.ndarray]:
+        """Trained factors for known users, folded-in factors otherwise."""
+        user_idx = self.matrix.user_index(user_id)
+        if user_idx >= 0:
+            return self.user_factors[user_idx]
+        return self.fold_in(user_ratings or {})
+    
+    def _rated_meals(self, user_id: str, user_ratings: Optional[Dict[int, float]]) -> Dict[int, float]:
+        """The user's known ratings (training set first, then supplied ratings)."""
+        if self.matrix.user_index(user_id) >= 0:
+            return self.matrix.ratings_of(user_id)
+        return dict(user_ratings or {})
+    
+    # Pseudo-ratings at the global mean added to every meal's mean rating
+    FALLBACK_PRIOR_COUNT = CollaborativeFilteringModel.FALLBACK_PRIOR_COUNT
+    
+    def _mean_ratings_of(self, meal_ids: np.ndarray) -> np.ndarray:
+        """
+        Fallback prediction per meal: its mean rating, shrunk toward the
+        global mean by FALLBACK_PRIOR_COUNT pseudo-ratings (the global
+        mean for unknown meals).
+        """
+        if self._meal_totals is None:
+            # Counted from the user-major side, the only one load() restores
+            matrix = self.matrix
+            self._meal_totals = (
+                np.bincount(matrix.indices, weights=matrix.data, minlength=matrix.n_meals),
+                np.bincount(matrix.indices, minlength=matrix.n_meals).astype(np.float64)
+            )
+        all_totals, all_counts = self._meal_totals
+        
+        meal_idx = self.matrix.meal_indices_of(meal_ids)
+        known = meal_idx >= 0
+        totals = np.where(known, all_totals[meal_idx], 0.0)
+        counts = np.where(known, all_counts[meal_idx], 0.0)
+        prior = self.FALLBACK_PRIOR_COUNT
+        return (totals + prior * self.global_mean) / (counts + prior)
+    
+    def predict_ratings(
+        self,
+        user_id: str,
+        meal_ids: List[int],
+        user_ratings: Optional[Dict[int, float]] = None
+    ) -> np.ndarray:
+        """
+        Predict ratings for many meals with one matrix-vector product.
+        
+        Users without factors (unseen and nothing to fold in) get each
+        meal's shrunk mean rating (see _mean_ratings_of), on the same 1-5
+        scale as the factor predictions.
+        
+        Args:
+            user_id: User ID (string, as in the training data)
+            meal_ids: Meals to score
+            user_ratings: Known {meal_id: rating} used to fold in unseen users
+        """
+        meal_ids = np.asarray(meal_ids, dtype=np.int64)
+        meal_idx = self.matrix.meal_indices_of(meal_ids)
+        known = meal_idx >= 0
+        predictions = self._mean_ratings_of(meal_ids)
+        
+        user_vector = self._user_vector(user_id, user_ratings)
+        if user_vector is not None:
+            scores = self.global_mean + self.meal_factors @ user_vector.astype(np.float32)
+            predictions[known] = np.clip(scores[meal_idx[known]], 1.0, 5.0)
+        return predictions
+    
+    def predict_rating(self, user_id: str, meal_id: int,
+                       user_ratings: Optional[Dict[int, float]] = None) -> float:
+        """Predict rating for a user-meal pair."""
+        return float(self.predict_ratings(user_id, [meal_id], user_ratings)[0])
+    
+    def get_recommendations(self, user_id: str, all_meal_ids: List[int], limit: int = 10,
+                            user_ratings: Optional[Dict[int, float]] = None) -> List[Tuple[int, float]]:
+        """
+        Get top recommendations for a user.
+        Returns list of (meal_id, predicted_rating) tuples.
+        """
+        user_rated = self._rated_meals(user_id, user_ratings)
+        candidate_meals = [mid for mid in all_meal_ids if mid not in user_rated]
+        
+        if not candidate_meals:
+            # User has rated everything, return the best-rated meals
+            mean_ratings = self._mean_ratings_of(np.asarray(all_meal_ids, dtype=np.int64))
+            top = top_k_indices(mean_ratings, limit, positive_only=False)
+            return [(all_meal_ids[i], float(mean_ratings[i])) for i in top]
+        
+        predictions = self.predict_ratings(user_id, candidate_meals, user_ratings)
+        top = top_k_indices(predictions, limit, positive_only=False)
+        return [(candidate_meals[i], float(predictions[i])) for i in top]
+    
+    def save(self, model_file: Path):
+        """Save trained model as an uncompressed .npz of float32 factors and CSR arrays."""
+        logger.info(f"Saving model to: {model_file}")
+        
+        # Written next to the target and renamed into place, so readers never see a partial file
+        model_file = Path(model_file)
+        tmp_file = model_file.with_name(f"{model_file.name}.tmp-{os.getpid()}")
+        matrix = self.matrix
+        facets = self.popularity_facets or {}
+        with open(tmp_file, 'wb') as f:
+            np.savez(
+                f,
+                user_ids=matrix.user_ids,
+                meal_ids=matrix.meal_ids,
+                indptr=matrix.indptr,
+                indices=matrix.indices,
+                data=matrix.data,
+                user_factors=self.user_factors,
+                meal_factors=self.meal_factors,
+                popularity=self.popularity_scores.astype(np.float32),
+                params=np.array([self.global_mean, self.regularization], dtype=np.float64),
+                facet_categories=np.array(facets.get('categories', []), dtype=str),
+                facet_diet_flags=np.array(facets.get('diet_flags', []), dtype=str),
+                **self._popularity_ranking_arrays()
+            )
+        os.replace(tmp_file, model_file)
+        
+        logger.info("✅ Model saved!")
+    
+    @classmethod
+    def load(cls, model_file: Path):
+        """Load trained model."""
+        logger.info(f"Loading model from: {model_file}")
+        
+        with np.load(model_file) as arrays:
+            user_factors = arrays['user_factors']
+            model = cls(factors=user_factors.shape[1])
+            model.global_mean, model.regularization = (float(v) for v in arrays['params'])
+            model.user_factors = user_factors
+            model.meal_factors = arrays['meal_factors']
+            
+            # Only the user-major side is needed to look up a user's ratings
+            meal_ids = arrays['meal_ids']
+            model.matrix = SparseRatingMatrix(
+                arrays['user_ids'], meal_ids,
+                arrays['indptr'], arrays['indices'], arrays['data'],
+                np.zeros(len(meal_ids) + 1, dtype=np.int64),
+                np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+            )
+            model.popularity_scores = arrays['popularity'].astype(np.float64)
+            model._restore_popularity_ranking(
+                {name: arrays[name] for name in ('popularity_ranking', 'meal_category_codes', 'meal_diet_bits')
+                 if name in arrays},
+                arrays['facet_categories'].tolist() if 'facet_categories' in arrays else [],
+                arrays['facet_diet_flags'].tolist() if 'facet_diet_flags' in arrays else []
+            )
+        
+        model.meal_popularity = dict(zip(model.matrix.meal_ids.tolist(), model.popularity_scores.tolist()))
+        model.is_trained = True
+        
+        logger.info("✅ Model loaded!")
+        return model
+
+
+__all__ = [
+    "SparseRatingMatrix",
+    "NeighbourTable",
+    "CollaborativeFilteringModel",
+    "ItemItemCollaborativeFilteringModel",
+    "MatrixFactorizationModel",
+    "top_k_indices",
+    "write_array_bundle",
+    "read_array_bundle",
+]
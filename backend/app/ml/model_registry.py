@@ -0,0 +1,265 @@
+"""
+Versioned, hot-reloadable registry of the recommendation models.
+
+Training publishes artifacts into models/ either in place (e.g.
+collaborative_filtering_model) or as numbered versions next to it
+(collaborative_filtering_model.v3, matrix_factorization_model.v3.npz).
+ModelRegistry serves the newest artifact per algorithm, and a background
+watcher reloads it whenever a newer or replaced artifact appears. A new
+model is loaded off to the side and the served reference is swapped in
+one assignment, so a request that already fetched a model finishes on
+that version.
+"""
+import re
+import time
+import shutil
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _split_name(path: Path) -> Tuple[str, str]:
+    """Split an artifact path into (stem, suffix); bundle directories have no suffix."""
+    return (path.stem, path.suffix) if path.suffix else (path.name, "")
+
+
+def artifact_versions(base_path: Path) -> List[Tuple[int, Path]]:
+    """
+    All existing artifacts for a base path, oldest first.
+    
+    The unversioned base path counts as version 0.
+    """
+    base_path = Path(base_path)
+    stem, suffix = _split_name(base_path)
+    pattern = re.compile(rf"^{re.escape(stem)}\.v(\d+){re.escape(suffix)}$")
+    
+    versions = [(0, base_path)] if base_path.exists() else []
+    if base_path.parent.exists():
+        for path in base_path.parent.iterdir():
+            match = pattern.match(path.name)
+            if match:
+                versions.append((int(match.group(1)), path))
+    return sorted(versions, key=lambda version: version[0])
+
+
+def next_version_path(base_path: Path) -> Path:
+    """Path to publish the next numbered version of an artifact at."""
+    base_path = Path(base_path)
+    stem, suffix = _split_name(base_path)
+    versions = artifact_versions(base_path)
+    number = versions[-1][0] + 1 if versions else 1
+    return base_path.with_name(f"{stem}.v{number}{suffix}")
+
+
+def prune_versions(base_path: Path, keep: int, grace_seconds: float = 0.0) -> List[Path]:
+    """
+    Delete all but the newest keep numbered versions of an artifact.
+    
+    Other processes may have just picked an older version and be about to
+    open it, so at least one version behind the newest is always kept, and
+    a version is only removed once the version after it has existed for
+    grace_seconds. The unversioned base path is never removed.
+    
+    Returns:
+        Paths removed
+    """
+    numbered = [path for version, path in artifact_versions(base_path) if version > 0]
+    cutoff = time.time() - grace_seconds
+    removed = []
+    for path, successor in zip(numbered[:max(len(numbered) - max(keep, 2), 0)], numbered[1:]):
+        try:
+            superseded_at = successor.stat().st_mtime
+        except OSError:
+            continue
+        if superseded_at <= cutoff:
+            removed.append(path)
+    for path in removed:
+        if path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            path.unlink(missing_ok=True)
+    return removed
+
+
+def _signature(path: Path) -> Optional[Tuple]:
+    """Identity of an artifact on disk; changes when it is replaced or rewritten."""
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return (str(path), stat.st_ino, stat.st_mtime_ns)
+
+
+class ModelRegistry:
+    """
+    Serves the newest model artifact per algorithm and hot-reloads it.
+    
+    Unlike a load-once cache, a missing artifact is not remembered: the
+    watcher (or the next refresh) picks up a model trained later.
+    
+    Usage:
+        registry = ModelRegistry({"user_user": (CollaborativeFilteringModel, (bundle, pickle))})
+        registry.start_watcher()
+        model = registry.get("user_user")
+    """
+    
+    # Loads tried per refresh when the chosen version disappears meanwhile
+    LOAD_ATTEMPTS = 3
+    
+    def __init__(
+        self,
+        artifacts: Dict[str, Tuple[Any, Tuple[Path, ...]]],
+        on_load: Optional[Callable[[str, Any, Path], None]] = None,
+        poll_interval_seconds: float = 30.0
+    ):
+        """
+        Args:
+            artifacts: {algorithm: (model class, candidate base paths in order of preference)}
+            on_load: Called as on_load(algorithm, model, path) after each (re)load
+            poll_interval_seconds: How often the watcher scans for new artifacts
+        """
+        self.artifacts = artifacts
+        self.on_load = on_load
+        self.poll_interval_seconds = poll_interval_seconds
+        self._models: Dict[str, Any] = {}
+        self._paths: Dict[str, Path] = {}
+        self._signatures: Dict[str, Tuple] = {}
+        self._failed: Dict[str, Tuple] = {}  # signatures that failed to load
+        self._attempted: set = set()  # algorithms whose first load has finished
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+    
+    def get(self, algorithm: str) -> Optional[Any]:
+        """
+        Model currently served for an algorithm (None if none is available).
+        
+        The first call loads synchronously, and concurrent first callers
+        wait for that load instead of seeing no model; later calls only
+        read the reference, which the watcher replaces when a new version
+        appears.
+        """
+        if algorithm not in self._attempted:
+            with self._reload_lock:
+                if algorithm not in self._attempted:
+                    self._refresh_locked(algorithm)
+        return self._models.get(algorithm)
+    
+    def path(self, algorithm: str) -> Optional[Path]:
+        """Artifact the served model was loaded from."""
+        return self._paths.get(algorithm)
+    
+    def is_current(self, algorithm: str) -> bool:
+        """True if the served model was loaded from the newest artifact on disk."""
+        path = self._paths.get(algorithm)
+        return path is not None and path == self._newest_artifact(algorithm)
+    
+    def _newest_artifact(self, algorithm: str) -> Optional[Path]:
+        """Highest-versioned existing artifact; ties go to the earlier candidate."""
+        _, base_paths = self.artifacts[algorithm]
+        best = None
+        for preference, base_path in enumerate(base_paths):
+            for version, path in artifact_versions(base_path):
+                key = (version, -preference)
+                if best is None or key > best[0]:
+                    best = (key, path)
+        return best[1] if best else None
+    
+    def refresh(self, algorithm: Optional[str] = None) -> bool:
+        """
+        Load and swap in newer artifacts.
+        
+        Args:
+            algorithm: Algorithm to check (default: every algorithm loaded so far)
+        
+        Returns:
+            True if any model was swapped
+        """
+        algorithms = [algorithm] if algorithm else list(self._attempted)
+        swapped = False
+        with self._reload_lock:
+            for name in algorithms:
+                swapped = self._refresh_locked(name) or swapped
+        return swapped
+    
+    def _refresh_locked(self, algorithm: str) -> bool:
+        """_refresh_one, marking the first load done once it has finished (caller holds _reload_lock)."""
+        try:
+            return self._refresh_one(algorithm)
+        finally:
+            self._attempted.add(algorithm)
+    
+    def _refresh_one(self, algorithm: str) -> bool:
+        first_attempt = algorithm not in self._attempted
+        if algorithm not in self.artifacts:
+            logger.warning(f"Unknown ML algorithm '{algorithm}'")
+            return False
+        
+        model_class, base_paths = self.artifacts[algorithm]
+        for attempt in range(self.LOAD_ATTEMPTS):
+            path = self._newest_artifact(algorithm)
+            if path is None:
+                if first_attempt:
+                    logger.warning(f"ML model not found at {base_paths[0]}. Using content-based only.")
+                return False
+            
+            signature = _signature(path)
+            if signature is None:
+                continue  # pruned since it was listed
+            if signature in (self._signatures.get(algorithm), self._failed.get(algorithm)):
+                return False
+            
+            # The caller's _reload_lock keeps this the only load in flight; get() reads
+            # the current reference without a lock, so requests keep using it meanwhile
+            try:
+                model = model_class.load(path)
+                break
+            except Exception as e:
+                if not path.exists():
+                    # Another worker pruned it while it loaded: retry with the newest
+                    logger.info(f"{path.name} was removed while loading; retrying with the newest version")
+                    continue
+                self._failed[algorithm] = signature
+                logger.warning(f"Error loading ML model from {path}: {e}")
+                return False
+        else:
+            return False
+        
+        if self.on_load is not None:
+            self.on_load(algorithm, model, path)
+        
+        with self._lock:
+            self._models[algorithm] = model
+            self._paths[algorithm] = path
+            self._signatures[algorithm] = signature
+        logger.info(f"✅ ML model loaded successfully ({algorithm}: {path.name})")
+        return True
+    
+    def start_watcher(self) -> None:
+        """Start the background thread that polls for new artifacts (idempotent)."""
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name="model-registry-watcher", daemon=True)
+        self._watcher.start()
+    
+    def stop_watcher(self) -> None:
+        """Stop the watcher thread."""
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+    
+    def _watch(self) -> None:
+        while not self._stop.wait(self.poll_interval_seconds):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning(f"Model registry refresh failed: {e}")
+
+
+__all__ = ["ModelRegistry", "artifact_versions", "next_version_path", "prune_versions"]
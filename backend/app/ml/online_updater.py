@@ -0,0 +1,214 @@
+"""
+Incremental online updates for a served collaborative-filtering model.
+
+Ratings written through the rating repositories are published as
+"meal_rated" events. CFModelUpdater applies them to the in-memory model
+(see CollaborativeFilteringModel.apply_rating) so recommendations reflect
+new feedback without a full offline retrain.
+
+The database, not any one process, holds the online updates: every model
+bundle records the database time its ratings are complete up to
+(ratings_until), and each worker replays the ratings made since then when
+it loads a bundle. Periodically a single snapshot writer, elected with a
+file lock, folds those ratings into a new bundle version next to the
+trained ones. Every worker then hot-reloads it through the model registry,
+so served models stay memory-mapped (shared between workers) plus a small
+overlay, and a restart loses nothing.
+"""
+import time
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, IO, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, every process may write snapshots
+    fcntl = None
+
+from app.core.observer import Observer
+from app.ml.model_registry import ModelRegistry, next_version_path, prune_versions
+
+logger = logging.getLogger(__name__)
+
+
+class CFModelUpdater(Observer):
+    """
+    Observer that feeds "meal_rated" events into a registry-served CF model.
+    
+    The updater follows the model the registry currently serves. A newly
+    loaded model is handed to prepare() before it is served: the ratings
+    stored since its bundle was written are replayed onto it, and events
+    arriving until the registry swaps it in are applied to both models.
+    """
+    
+    def __init__(
+        self,
+        registry: ModelRegistry,
+        algorithm: str,
+        replay_ratings: Callable[[Any], Optional[datetime]],
+        snapshot_path: Optional[Path] = None,
+        snapshot_every: int = 500,
+        snapshot_interval_seconds: float = 600.0,
+        keep_snapshots: int = 3
+    ):
+        """
+        Args:
+            registry: Registry serving the model
+            algorithm: Algorithm the model is registered under
+            replay_ratings: Applies the stored ratings newer than model.ratings_until
+                to a model; returns the database time they are complete up to
+                (None if they could not be read)
+            snapshot_path: Base path of the model bundles the registry watches; each
+                snapshot is written as its next version (None disables snapshots)
+            snapshot_every: Try a snapshot after this many ratings ...
+            snapshot_interval_seconds: ... or once this much time has passed since the last one
+            keep_snapshots: Bundle versions kept on disk; older ones are deleted once
+                peer workers have had time to move past them (see prune_versions)
+        """
+        self.registry = registry
+        self.algorithm = algorithm
+        self._replay_ratings = replay_ratings
+        self.snapshot_path = snapshot_path
+        self.snapshot_every = snapshot_every
+        self.snapshot_interval_seconds = snapshot_interval_seconds
+        self.keep_snapshots = keep_snapshots
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._last_snapshot = time.monotonic()
+        self._snapshot_thread: Optional[threading.Thread] = None
+        self._incoming: Any = None  # Loaded model not yet served by the registry
+        self._incoming_backlog: Optional[List[Tuple[str, int, float]]] = None
+        self._writer_lock: Optional[IO] = None
+    
+    def prepare(self, model: Any) -> None:
+        """
+        Bring a freshly loaded model up to date before the registry serves it.
+        
+        Events that arrive while the stored ratings are replayed are queued
+        and applied after them, so the newest rating of a meal wins.
+        """
+        with self._lock:
+            self._incoming = model
+            self._incoming_backlog = []
+        try:
+            self._replay_ratings(model)
+        finally:
+            with self._lock:
+                backlog, self._incoming_backlog = self._incoming_backlog, None
+                if self._incoming is model:
+                    for rating in backlog:
+                        model.apply_rating(*rating)
+    
+    def update(self, event_type: str, data: Any) -> None:
+        """
+        Handle a "meal_rated" event.
+        
+        Args:
+            event_type: Should be "meal_rated"
+            data: Dictionary with user_id, meal_id, rating
+        """
+        if event_type != "meal_rated":
+            return
+        
+        rating = (str(data["user_id"]), int(data["meal_id"]), float(data["rating"]))
+        served = self.registry.get(self.algorithm)
+        with self._lock:
+            if served is not None and served is self._incoming:
+                self._incoming = None  # swapped in; it is the served model now
+            if hasattr(served, "apply_rating"):
+                served.apply_rating(*rating)
+            if self._incoming is not None:
+                if self._incoming_backlog is not None:
+                    self._incoming_backlog.append(rating)
+                else:
+                    self._incoming.apply_rating(*rating)
+            self._pending += 1
+            due = (
+                self._pending >= self.snapshot_every
+                or time.monotonic() - self._last_snapshot >= self.snapshot_interval_seconds
+            )
+        
+        if due and self.snapshot_path is not None:
+            self._start_snapshot()
+    
+    def _start_snapshot(self) -> None:
+        """Run snapshot() on a background thread unless one is already running."""
+        if self._snapshot_thread is not None and self._snapshot_thread.is_alive():
+            return
+        self._snapshot_thread = threading.Thread(target=self._snapshot_safely, daemon=True)
+        self._snapshot_thread.start()
+    
+    def _snapshot_safely(self) -> None:
+        try:
+            self.snapshot()
+        except Exception as e:
+            logger.warning(f"CF model snapshot failed: {e}")
+    
+    def _is_writer(self) -> bool:
+        """
+        Whether this process writes the snapshots.
+        
+        The first process to take the lock file keeps it until it exits,
+        when the operating system releases it for another worker.
+        """
+        if self._writer_lock is not None or fcntl is None:
+            return True
+        lock_file = open(self.snapshot_path.with_name(f".{self.snapshot_path.name}.lock"), "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._writer_lock = lock_file
+        return True
+    
+    def snapshot(self) -> Optional[Path]:
+        """
+        Fold the ratings stored since the served bundle into its next version.
+        
+        The served bundle is loaded again (memory-mapped, so its pages are
+        shared) with none of this process's online state, the stored ratings
+        are replayed onto it and compacted, and the result is published for
+        the registries of every worker to pick up. Only the snapshot writer
+        does this; in other processes it is a no-op.
+        
+        Returns:
+            Path of the bundle written, or None if no snapshot was taken
+        """
+        with self._lock:
+            self._pending = 0
+            self._last_snapshot = time.monotonic()
+        if self.snapshot_path is None or not self._is_writer():
+            return None
+        
+        path = self.registry.path(self.algorithm)
+        if path is None or not self.registry.is_current(self.algorithm):
+            return None  # the registry has not loaded the newest bundle yet
+        model_class, _ = self.registry.artifacts[self.algorithm]
+        model = model_class.load(path)
+        if getattr(model, "matrix", None) is None or model.ratings_until is None:
+            logger.info(f"{path.name} does not record when its ratings end; retrain it to enable snapshots")
+            return None
+        
+        ratings_until = self._replay_ratings(model)
+        if ratings_until is None or not model.rating_overlay:
+            return None
+        model.compact()
+        model.ratings_until = ratings_until
+        
+        if not self.registry.is_current(self.algorithm):
+            return None  # a retrained model was published meanwhile
+        snapshot_path = next_version_path(self.snapshot_path)
+        model.save_bundle(snapshot_path)
+        # Peers may still be opening an older version they picked just before this one
+        prune_versions(
+            self.snapshot_path, self.keep_snapshots, grace_seconds=2 * self.registry.poll_interval_seconds
+        )
+        logger.info(f"CF model snapshot written to {snapshot_path}")
+        self.registry.refresh(self.algorithm)
+        return snapshot_path
+
+
+__all__ = ["CFModelUpdater"]
@@ -1,8 +1,9 @@
 """Meal model."""
-from sqlalchemy import Column, Integer, String, Float, Text, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Text, Boolean, ForeignKey, event
 from sqlalchemy.orm import relationship
 from app.models.base import Base
 from app.models.abstract_models import RatedMixin, OwnedMixin
+from app.enums import DietaryRestriction
 
 
 class Meal(Base, RatedMixin, OwnedMixin):
@@ -48,15 +49,29 @@ class Meal(Base, RatedMixin, OwnedMixin):
     is_nut_free = Column(Boolean, default=False)
     is_halal = Column(Boolean, default=False)
     is_kosher = Column(Boolean, default=False)
+    # The dietary tags packed into one integer (see DietaryRestriction.mask_of),
+    # recomputed on every insert/update
+    diet_mask = Column(Integer, nullable=False, default=0, server_default="0", index=True)
     
     # Relationships
     user_meals = relationship("UserMeal", back_populates="meal")
     saved_by_users = relationship("SavedMeal", back_populates="meal")
     ratings = relationship("MealRating", back_populates="meal")
     
+    def compute_diet_mask(self) -> int:
+        """Dietary bitmask of the is_<restriction> flags."""
+        return DietaryRestriction.mask_of(self, prefix="is_")
+    
     def __repr__(self):
         return f"<Meal(id={self.id}, name={self.name}, calories={self.calories})>"
 
 
+@event.listens_for(Meal, "before_insert")
+@event.listens_for(Meal, "before_update")
+def _sync_diet_mask(mapper, connection, target):
+    """Keep diet_mask in sync with the dietary tags."""
+    target.diet_mask = target.compute_diet_mask()
+
+
 
 
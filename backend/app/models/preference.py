@@ -2,6 +2,7 @@
 from sqlalchemy import Column, Integer, ForeignKey, String, Boolean, Float
 from sqlalchemy.orm import relationship
 from app.models.base import Base
+from app.enums import DietaryRestriction
 
 
 class Preference(Base):
@@ -34,6 +35,10 @@ class Preference(Base):
     # Relationship
     user = relationship("User", back_populates="preferences")
     
+    def required_diet_mask(self) -> int:
+        """Dietary bitmask a meal must contain to satisfy these restrictions."""
+        return DietaryRestriction.mask_of(self)
+    
     def __repr__(self):
         return f"<Preference(user_id={self.user_id})>"
 
@@ -0,0 +1,90 @@
+"""Read access to every in-app rating, across both rating tables.
+
+Users rate meals through two tables, meal_ratings and recipe_ratings.
+Training, model fold-in and online replay all need the same merged view of
+them, so it is defined once here: both tables in one UNION ALL ordered by
+rating time, where the most recent rating of a (user, meal) pair wins.
+"""
+from datetime import datetime
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, literal, select, union_all
+from sqlalchemy.orm import Session
+
+from app.models.meal_rating import MealRating
+from app.models.recipe_rating import RecipeRating
+
+
+class AppRatingRepository:
+    """Repository for the merged meal_ratings/recipe_ratings view."""
+    
+    @staticmethod
+    def _ratings_statement(since: Optional[datetime] = None, user_id: Optional[int] = None):
+        """(user_id, meal_id, rating) of both tables, oldest first (recipe ratings win ties)."""
+        sources = []
+        for priority, model in enumerate((MealRating, RecipeRating)):
+            rated_at = func.coalesce(model.updated_at, model.created_at)
+            source = select(
+                model.user_id.label('user_id'),
+                model.meal_id.label('meal_id'),
+                model.rating.label('rating'),
+                rated_at.label('rated_at'),
+                literal(priority).label('priority'),
+            ).where(model.rating.between(1, 5))
+            if since is not None:
+                source = source.where(rated_at >= since)
+            if user_id is not None:
+                source = source.where(model.user_id == user_id)
+            sources.append(source)
+        ratings = union_all(*sources).subquery()
+        return select(
+            ratings.c.user_id, ratings.c.meal_id, ratings.c.rating
+        ).order_by(ratings.c.rated_at, ratings.c.priority)
+    
+    @staticmethod
+    def iter_ratings(
+        db: Session,
+        chunk_size: int = 10000,
+        since: Optional[datetime] = None
+    ) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Stream in-app ratings, oldest first, in chunks.
+        
+        Rows are fetched with a server-side cursor (yield_per), so the
+        tables are never materialised as Python objects. When a user rated
+        a meal in both tables the most recent rating comes last.
+        
+        Args:
+            db: Database session
+            chunk_size: Rows fetched per round trip
+            since: Only ratings created or updated at or after this database time
+        
+        Yields:
+            (user_ids, meal_ids, ratings) arrays of up to chunk_size rows
+        """
+        statement = AppRatingRepository._ratings_statement(since)
+        result = db.execute(statement.execution_options(yield_per=chunk_size))
+        for partition in result.partitions():
+            user_ids, meal_ids, values = zip(*partition)
+            yield (
+                np.fromiter(user_ids, dtype=np.int64, count=len(partition)),
+                np.fromiter(meal_ids, dtype=np.int64, count=len(partition)),
+                np.fromiter(values, dtype=np.float32, count=len(partition)),
+            )
+    
+    @staticmethod
+    def database_time(db: Session) -> datetime:
+        """
+        Current time on the database server.
+        
+        Rating timestamps are set by the database, so cutoffs compared
+        against them (see iter_ratings(since=...)) are taken from it too.
+        """
+        return db.execute(select(func.now())).scalar()
+    
+    @staticmethod
+    def get_user_ratings(db: Session, user_id: int) -> Dict[int, float]:
+        """A user's current rating per meal, from both tables ({meal_id: rating})."""
+        statement = AppRatingRepository._ratings_statement(user_id=user_id)
+        return {meal_id: float(rating) for _, meal_id, rating in db.execute(statement)}
@@ -1,7 +1,8 @@
 """Database connection and session management."""
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
+from app.enums import DietaryRestriction
 
 # Create database engine
 engine = create_engine(
@@ -24,6 +25,22 @@ def init_db():
     # Only create tables if they don't exist - DO NOT drop existing tables
     # This preserves all existing data
     Base.metadata.create_all(bind=engine)
+    _add_diet_mask_column()
+
+
+def _add_diet_mask_column():
+    """Add and backfill meals.diet_mask on databases created before the column existed."""
+    if "diet_mask" in {column["name"] for column in inspect(engine).get_columns("meals")}:
+        return
+    
+    mask = " + ".join(
+        f"(CASE WHEN is_{restriction} THEN {1 << bit} ELSE 0 END)"
+        for bit, restriction in enumerate(DietaryRestriction.list())
+    )
+    with engine.begin() as connection:
+        connection.execute(text("ALTER TABLE meals ADD COLUMN diet_mask INTEGER NOT NULL DEFAULT 0"))
+        connection.execute(text(f"UPDATE meals SET diet_mask = {mask}"))
+        connection.execute(text("CREATE INDEX ix_meals_diet_mask ON meals (diet_mask)"))
 
 
 def get_db():
@@ -9,6 +9,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy import and_, func
 from app.models.meal_rating import MealRating
 from app.exceptions import RatingValidationException
+from app.core.observer import EventManager
 
 
 class MealRatingRepository:
@@ -48,18 +49,20 @@ class MealRatingRepository:
             existing.review = review
             db.commit()
             db.refresh(existing)
-            return existing
+            meal_rating = existing
+        else:
+            # Create new rating
+            meal_rating = MealRating(
+                user_id=user_id,
+                meal_id=meal_id,
+                rating=rating,
+                review=review
+            )
+            db.add(meal_rating)
+            db.commit()
+            db.refresh(meal_rating)
         
-        # Create new rating
-        meal_rating = MealRating(
-            user_id=user_id,
-            meal_id=meal_id,
-            rating=rating,
-            review=review
-        )
-        db.add(meal_rating)
-        db.commit()
-        db.refresh(meal_rating)
+        EventManager().notify("meal_rated", {"user_id": user_id, "meal_id": meal_id, "rating": rating})
         return meal_rating
     
     @staticmethod
@@ -9,6 +9,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy import or_
 from app.models.meal import Meal
 from app.core.base_repository import BaseRepository
+from app.core.observer import EventManager
 
 
 class MealRepository(BaseRepository[Meal]):
@@ -32,6 +33,14 @@ class MealRepository(BaseRepository[Meal]):
         """Get meal by ID."""
         return db.query(Meal).filter(Meal.id == meal_id).first()
     
+    @staticmethod
+    def get_by_ids(db: Session, meal_ids: List[int]) -> List[Meal]:
+        """Get several meals in one query, in the order of meal_ids (missing IDs are skipped)."""
+        if not meal_ids:
+            return []
+        meals = {meal.id: meal for meal in db.query(Meal).filter(Meal.id.in_(meal_ids)).all()}
+        return [meals[meal_id] for meal_id in meal_ids if meal_id in meals]
+    
     @staticmethod
     def get_all(db: Session, skip: int = 0, limit: int = 100) -> List[Meal]:
         """Get all meals with pagination."""
@@ -80,6 +89,25 @@ class MealRepository(BaseRepository[Meal]):
         
         return query.offset(skip).limit(limit).all()
     
+    @staticmethod
+    def get_filtered(db: Session, category: Optional[str] = None, diet_mask: int = 0, limit: int = 100) -> List[Meal]:
+        """
+        Get meals of a category that satisfy a dietary bitmask.
+        
+        Args:
+            db: Database session
+            category: Only meals of this category (None for any)
+            diet_mask: Only meals whose diet_mask contains these bits
+                (see DietaryRestriction.mask_of_values)
+            limit: Maximum number of meals
+        """
+        query = db.query(Meal)
+        if category:
+            query = query.filter(Meal.category == category)
+        if diet_mask:
+            query = query.filter(Meal.diet_mask.op("&")(diet_mask) == diet_mask)
+        return query.limit(limit).all()
+    
     @staticmethod
     def create(db: Session, meal_data: dict) -> Meal:
         """Create a new meal."""
@@ -87,6 +115,7 @@ class MealRepository(BaseRepository[Meal]):
         db.add(meal)
         db.commit()
         db.refresh(meal)
+        EventManager().notify("meal_created", {"meal_id": meal.id})
         return meal
     
     @staticmethod
@@ -98,6 +127,7 @@ class MealRepository(BaseRepository[Meal]):
                 setattr(meal, key, value)
             db.commit()
             db.refresh(meal)
+            EventManager().notify("meal_updated", {"meal_id": meal_id})
         return meal
     
     @staticmethod
@@ -107,5 +137,6 @@ class MealRepository(BaseRepository[Meal]):
         if meal:
             db.delete(meal)
             db.commit()
+            EventManager().notify("meal_deleted", {"meal_id": meal_id})
             return True
         return False
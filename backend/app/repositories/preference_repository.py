@@ -8,6 +8,7 @@ from typing import Optional, List
 from sqlalchemy.orm import Session
 from app.models.preference import Preference
 from app.core.base_repository import BaseRepository
+from app.core.observer import EventManager
 
 
 class PreferenceRepository(BaseRepository[Preference]):
@@ -45,6 +46,7 @@ class PreferenceRepository(BaseRepository[Preference]):
         db.add(preference)
         db.commit()
         db.refresh(preference)
+        EventManager().notify("preferences_updated", {"user_id": preference.user_id})
         return preference
     
     @staticmethod
@@ -56,6 +58,7 @@ class PreferenceRepository(BaseRepository[Preference]):
                 setattr(preference, key, value)
             db.commit()
             db.refresh(preference)
+            EventManager().notify("preferences_updated", {"user_id": user_id})
         return preference
     
     @staticmethod
@@ -63,8 +66,10 @@ class PreferenceRepository(BaseRepository[Preference]):
         """Delete a preference by ID."""
         preference = PreferenceRepository.get_by_id(db, preference_id)
         if preference:
+            user_id = preference.user_id
             db.delete(preference)
             db.commit()
+            EventManager().notify("preferences_updated", {"user_id": user_id})
             return True
         return False
     
@@ -4,6 +4,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy import func
 from app.models.recipe_rating import RecipeRating
 from app.models.meal import Meal
+from app.core.observer import EventManager
 
 
 class RecipeRatingRepository:
@@ -68,6 +69,7 @@ class RecipeRatingRepository:
         # Update meal's average rating
         RecipeRatingRepository._update_meal_rating(db, meal_id)
         
+        EventManager().notify("meal_rated", {"user_id": user_id, "meal_id": meal_id, "rating": rating})
         return rating_obj
     
     @staticmethod
@@ -11,6 +11,7 @@ from sqlalchemy import func
 from app.models.user_meal import UserMeal
 from app.models.user import User
 from app.core.base_repository import BaseRepository
+from app.core.observer import EventManager
 
 
 class UserMealRepository(BaseRepository[UserMeal]):
@@ -80,6 +81,7 @@ class UserMealRepository(BaseRepository[UserMeal]):
         db.add(user_meal)
         db.commit()
         db.refresh(user_meal)
+        EventManager().notify("user_meal_logged", {"user_id": user_meal.user_id, "meal_id": user_meal.meal_id})
         return user_meal
     
     @staticmethod
@@ -91,6 +93,7 @@ class UserMealRepository(BaseRepository[UserMeal]):
                 setattr(user_meal, key, value)
             db.commit()
             db.refresh(user_meal)
+            EventManager().notify("user_meal_logged", {"user_id": user_meal.user_id, "meal_id": user_meal.meal_id})
         return user_meal
     
     @staticmethod
@@ -98,7 +101,9 @@ class UserMealRepository(BaseRepository[UserMeal]):
         """Delete a user meal entry."""
         user_meal = UserMealRepository.get_by_id(db, user_meal_id)
         if user_meal:
+            user_id, meal_id = user_meal.user_id, user_meal.meal_id
             db.delete(user_meal)
             db.commit()
+            EventManager().notify("user_meal_logged", {"user_id": user_id, "meal_id": meal_id})
             return True
         return False
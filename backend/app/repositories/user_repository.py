@@ -8,6 +8,7 @@ from typing import List, Optional
 from sqlalchemy.orm import Session
 from app.models.user import User
 from app.core.base_repository import BaseRepository
+from app.core.observer import EventManager
 
 
 class UserRepository(BaseRepository[User]):
@@ -64,6 +65,7 @@ class UserRepository(BaseRepository[User]):
                 setattr(user, key, value)
             db.commit()
             db.refresh(user)
+            EventManager().notify("user_updated", {"user_id": user_id})
         return user
     
     @staticmethod
@@ -73,5 +75,6 @@ class UserRepository(BaseRepository[User]):
         if user:
             db.delete(user)
             db.commit()
+            EventManager().notify("user_updated", {"user_id": user_id})
             return True
         return False
@@ -0,0 +1,804 @@
+"""
+Storage backends for the result cache in cache_service.
+
+A backend stores serialized results under tuple keys, together with their
+soft and hard expiry times (epoch seconds) and an optional tag, and keeps
+one generation counter per tag that invalidate_tag bumps. Three backends:
+
+- MemoryCacheBackend: in-process LRU dict (one copy per worker)
+- SQLiteCacheBackend: one SQLite file shared by every worker on a machine
+- RedisCacheBackend: any server speaking the Redis protocol (RESP)
+
+With a shared backend, entries written by one uvicorn worker are hits in
+the others, and an invalidation run by the worker that handled a write
+removes the entries for every worker.
+
+Values are stored as compact pickles: SQLAlchemy instances are reduced to
+their column values and rebuilt as transient instances when read, so no
+session state or lazy-loading proxies are ever cached.
+"""
+import hashlib
+import importlib
+import pickle
+import socket
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional
+from urllib.parse import unquote, urlparse
+
+from sqlalchemy import inspect as sqlalchemy_inspect
+from sqlalchemy.orm import InstanceState
+
+
+class CacheRecord(NamedTuple):
+    """A stored result with its expiry times (epoch seconds)."""
+    payload: bytes  # encode_value output
+    stale_at: float  # soft TTL: served, but refreshed in the background
+    expires_at: float  # hard TTL
+
+
+# Serialization
+
+class _OrmRow(NamedTuple):
+    """Column values of a SQLAlchemy instance, e.g. a Meal in a recommendation."""
+    cls: str  # "module:QualName"
+    columns: tuple  # ((attribute, value), ...)
+
+
+_COMPRESS_ABOVE = 512  # bytes
+
+
+def _plain(value: Any) -> Any:
+    """Replace ORM instances (at any depth) with _OrmRow."""
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_plain(item) for item in value]
+    if isinstance(value, tuple) and not hasattr(value, "_fields"):
+        return tuple(_plain(item) for item in value)
+    state = sqlalchemy_inspect(value, raiseerr=False)
+    if isinstance(state, InstanceState):
+        cls = type(value)
+        return _OrmRow(
+            f"{cls.__module__}:{cls.__qualname__}",
+            tuple((column.key, getattr(value, column.key)) for column in state.mapper.column_attrs)
+        )
+    if hasattr(value, "item") and getattr(value, "shape", None) == ():  # numpy scalars
+        return value.item()
+    return value
+
+
+def _rebuild(value: Any) -> Any:
+    """Inverse of _plain: _OrmRow becomes a transient (session-less) instance."""
+    if isinstance(value, _OrmRow):
+        module, qualname = value.cls.split(":")
+        cls = importlib.import_module(module)
+        for name in qualname.split("."):
+            cls = getattr(cls, name)
+        instance = sqlalchemy_inspect(cls).class_manager.new_instance()
+        for key, item in value.columns:
+            setattr(instance, key, item)
+        return instance
+    if isinstance(value, dict):
+        return {key: _rebuild(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_rebuild(item) for item in value]
+    if isinstance(value, tuple) and not hasattr(value, "_fields"):
+        return tuple(_rebuild(item) for item in value)
+    return value
+
+
+def encode_value(value: Any) -> bytes:
+    """Serialize a cached result (pickle of plain values, zlib-compressed when large)."""
+    data = pickle.dumps(_plain(value), protocol=pickle.HIGHEST_PROTOCOL)
+    if len(data) > _COMPRESS_ABOVE:
+        return b"z" + zlib.compress(data, 1)
+    return b"p" + data
+
+
+def decode_value(payload: bytes) -> Any:
+    """Inverse of encode_value."""
+    data = zlib.decompress(payload[1:]) if payload[:1] == b"z" else payload[1:]
+    return _rebuild(pickle.loads(data))
+
+
+def key_label(key: tuple) -> str:
+    """Readable form of a cache key, e.g. 'get_popular_meals:10:None'."""
+    return ":".join(str(part) for part in key)
+
+
+def storage_key(key: tuple) -> str:
+    """
+    Text key for the shared backends: the label plus a digest of the key's
+    repr, so keys whose labels coincide (1 vs "1") stay apart.
+    
+    The label and function name are kept next to the entry, so no code
+    path ever has to parse a stored key back into a tuple.
+    """
+    return f"{key_label(key)}#{hashlib.sha1(repr(key).encode()).hexdigest()[:16]}"
+
+
+def _label_of(stored_key: str) -> str:
+    return stored_key.rsplit("#", 1)[0]
+
+
+# Backends
+
+class CacheBackend(ABC):
+    """Storage interface used by cache_service."""
+    
+    name: str = "abstract"
+    
+    @abstractmethod
+    def get(self, key: tuple) -> Optional[CacheRecord]:
+        """Record for key, or None if absent or past its hard TTL."""
+        pass
+    
+    @abstractmethod
+    def set(self, key: tuple, record: CacheRecord, tag: Optional[str] = None, generation: int = 0) -> bool:
+        """
+        Store a record, unless its tag has been invalidated since generation.
+        
+        Returns:
+            True if the record was stored
+        """
+        pass
+    
+    @abstractmethod
+    def tag_generation(self, tag: Optional[str]) -> int:
+        """Current generation of a tag (0 if never invalidated)."""
+        pass
+    
+    @abstractmethod
+    def invalidate_tag(self, tag: str) -> int:
+        """Bump a tag's generation and drop its entries; returns entries removed."""
+        pass
+    
+    @abstractmethod
+    def delete_function(self, qualname: str) -> int:
+        """Drop every entry of one cached function; returns entries removed."""
+        pass
+    
+    @abstractmethod
+    def delete_matching(self, predicate: Callable[[str], bool]) -> int:
+        """Drop the entries whose key label satisfies predicate; returns entries removed."""
+        pass
+    
+    @abstractmethod
+    def clear(self) -> int:
+        """Drop every entry; returns entries removed."""
+        pass
+    
+    @abstractmethod
+    def sweep_expired(self) -> int:
+        """Drop every entry past its hard TTL; returns entries removed."""
+        pass
+    
+    @abstractmethod
+    def keys(self, limit: int = 10) -> List[str]:
+        """Labels of a sample of stored keys."""
+        pass
+    
+    @abstractmethod
+    def stats(self) -> dict:
+        """Backend statistics (size, bytes, ...)."""
+        pass
+
+
+class _MemoryEntry(NamedTuple):
+    record: CacheRecord
+    tag: Optional[str]
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    Bounded in-process LRU store (one copy per worker process).
+    
+    Holds at most max_entries entries and max_bytes of payload, evicting
+    the least recently used first. Expired entries are dropped when read
+    and by a sweep over the whole store every sweep_interval_seconds.
+    """
+    
+    name = "memory"
+    
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024, sweep_interval_seconds: float = 60):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sweep_interval_seconds = sweep_interval_seconds
+        self._entries: "OrderedDict[tuple, _MemoryEntry]" = OrderedDict()  # oldest first
+        self._tags: Dict[str, set] = {}
+        self._generations: Dict[str, int] = {}
+        self._bytes = 0
+        self._evictions = 0
+        self._last_sweep = time.time()
+        self._lock = threading.RLock()
+    
+    def _remove(self, key: tuple) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self._bytes -= len(entry.record.payload)
+        if entry.tag is not None:
+            keys = self._tags.get(entry.tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[entry.tag]
+        return True
+    
+    def get(self, key: tuple) -> Optional[CacheRecord]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.record.expires_at <= time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry.record
+    
+    def set(self, key: tuple, record: CacheRecord, tag: Optional[str] = None, generation: int = 0) -> bool:
+        if len(record.payload) > self.max_bytes:
+            return False  # would evict everything else and still not fit
+        with self._lock:
+            if tag is not None and self._generations.get(tag, 0) != generation:
+                return False
+            self._remove(key)
+            self._entries[key] = _MemoryEntry(record, tag)
+            self._bytes += len(record.payload)
+            if tag is not None:
+                self._tags.setdefault(tag, set()).add(key)
+            
+            if time.time() - self._last_sweep >= self.sweep_interval_seconds:
+                self.sweep_expired()
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+        return True
+    
+    def tag_generation(self, tag: Optional[str]) -> int:
+        return self._generations.get(tag, 0)
+    
+    def invalidate_tag(self, tag: str) -> int:
+        with self._lock:
+            self._generations[tag] = self._generations.get(tag, 0) + 1
+            keys = list(self._tags.get(tag, ()))
+            for key in keys:
+                self._remove(key)
+        return len(keys)
+    
+    def delete_function(self, qualname: str) -> int:
+        with self._lock:
+            keys = [key for key in self._entries if key[0] == qualname]
+            for key in keys:
+                self._remove(key)
+        return len(keys)
+    
+    def delete_matching(self, predicate: Callable[[str], bool]) -> int:
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key_label(key))]
+            for key in keys:
+                self._remove(key)
+        return len(keys)
+    
+    def clear(self) -> int:
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+            self._tags.clear()
+            self._bytes = 0
+        return count
+    
+    def sweep_expired(self) -> int:
+        with self._lock:
+            now = time.time()
+            expired = [key for key, entry in self._entries.items() if entry.record.expires_at <= now]
+            for key in expired:
+                self._remove(key)
+            self._last_sweep = now
+        return len(expired)
+    
+    def keys(self, limit: int = 10) -> List[str]:
+        with self._lock:
+            return [key_label(key) for key in list(self._entries.keys())[:limit]]
+    
+    def stats(self) -> dict:
+        return {
+            'backend': self.name,
+            'size': len(self._entries),
+            'bytes': self._bytes,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'evictions': self._evictions,
+            'tags': len(self._tags),
+        }
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    Cache in one SQLite file, shared by every worker process on a machine.
+    
+    The file runs in WAL mode, so readers in one worker never block on a
+    writer in another. Each thread uses its own connection. Triggers keep
+    the entry count and byte total in cache_totals; a write that pushes
+    either past its bound evicts least recently used entries (by last
+    access time, updated at most once per touch_interval_seconds per
+    entry) down to evict_to_fraction of the bounds, so a full cache pays
+    for one eviction per batch of writes rather than per write.
+    """
+    
+    name = "sqlite"
+    
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 10000,
+        max_bytes: int = 64 * 1024 * 1024,
+        sweep_interval_seconds: float = 60,
+        touch_interval_seconds: float = 10,
+        evict_to_fraction: float = 0.9
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sweep_interval_seconds = sweep_interval_seconds
+        self.touch_interval_seconds = touch_interval_seconds
+        self.evict_to_fraction = evict_to_fraction
+        self._last_sweep = time.time()
+        self._local = threading.local()
+        with self._connection() as db:
+            columns = {row[1] for row in db.execute("PRAGMA table_info(cache_entries)")}
+            if columns and "label" not in columns:
+                # Entries from before labels were stored; a cache can simply start over
+                db.execute("DROP TABLE cache_entries")
+                db.execute("DROP TABLE IF EXISTS cache_totals")
+            db.executescript("""
+                BEGIN IMMEDIATE;
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    key TEXT PRIMARY KEY,
+                    function TEXT NOT NULL,
+                    label TEXT NOT NULL,
+                    tag TEXT,
+                    payload BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    stale_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS ix_cache_entries_function ON cache_entries (function);
+                CREATE INDEX IF NOT EXISTS ix_cache_entries_tag ON cache_entries (tag);
+                CREATE INDEX IF NOT EXISTS ix_cache_entries_expires_at ON cache_entries (expires_at);
+                CREATE INDEX IF NOT EXISTS ix_cache_entries_accessed_at ON cache_entries (accessed_at);
+                CREATE TABLE IF NOT EXISTS cache_tags (
+                    tag TEXT PRIMARY KEY,
+                    generation INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS cache_totals (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    entries INTEGER NOT NULL,
+                    bytes INTEGER NOT NULL
+                );
+                INSERT OR IGNORE INTO cache_totals
+                    SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries;
+                CREATE TRIGGER IF NOT EXISTS cache_entries_added AFTER INSERT ON cache_entries
+                BEGIN
+                    UPDATE cache_totals SET entries = entries + 1, bytes = bytes + NEW.size;
+                END;
+                CREATE TRIGGER IF NOT EXISTS cache_entries_removed AFTER DELETE ON cache_entries
+                BEGIN
+                    UPDATE cache_totals SET entries = entries - 1, bytes = bytes - OLD.size;
+                END;
+                COMMIT;
+            """)
+    
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+    
+    def get(self, key: tuple) -> Optional[CacheRecord]:
+        db = self._connection()
+        text = storage_key(key)
+        row = db.execute(
+            "SELECT payload, stale_at, expires_at, accessed_at FROM cache_entries WHERE key = ?", (text,)
+        ).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if row[2] <= now:
+            with db:
+                db.execute("DELETE FROM cache_entries WHERE key = ? AND expires_at <= ?", (text, now))
+            return None
+        if now - row[3] >= self.touch_interval_seconds:
+            with db:
+                db.execute("UPDATE cache_entries SET accessed_at = ? WHERE key = ?", (now, text))
+        return CacheRecord(row[0], row[1], row[2])
+    
+    def set(self, key: tuple, record: CacheRecord, tag: Optional[str] = None, generation: int = 0) -> bool:
+        if len(record.payload) > self.max_bytes:
+            return False
+        db = self._connection()
+        now = time.time()
+        with db:
+            # BEGIN IMMEDIATE: the generation check and the insert see no concurrent invalidation
+            db.execute("BEGIN IMMEDIATE")
+            if tag is not None and self._generation(db, tag) != generation:
+                return False
+            text = storage_key(key)
+            # Delete, then insert: REPLACE would skip the delete trigger and the totals would drift
+            db.execute("DELETE FROM cache_entries WHERE key = ?", (text,))
+            db.execute(
+                "INSERT INTO cache_entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (text, key[0], key_label(key), tag, record.payload, len(record.payload),
+                 record.stale_at, record.expires_at, now)
+            )
+            if now - self._last_sweep >= self.sweep_interval_seconds:
+                db.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (now,))
+                self._last_sweep = now
+            entries, total = self._totals(db)
+            if entries <= self.max_entries and total <= self.max_bytes:
+                return True
+            # Least recently used entries beyond the low-water marks
+            db.execute(
+                """
+                DELETE FROM cache_entries WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key,
+                               ROW_NUMBER() OVER recent AS position,
+                               SUM(size) OVER recent AS total
+                        FROM cache_entries
+                        WINDOW recent AS (ORDER BY accessed_at DESC, key)
+                    ) WHERE position > ? OR total > ?
+                )
+                """,
+                (int(self.max_entries * self.evict_to_fraction), int(self.max_bytes * self.evict_to_fraction))
+            )
+        return True
+    
+    @staticmethod
+    def _totals(db: sqlite3.Connection) -> tuple:
+        return db.execute("SELECT entries, bytes FROM cache_totals").fetchone()
+    
+    @staticmethod
+    def _generation(db: sqlite3.Connection, tag: str) -> int:
+        row = db.execute("SELECT generation FROM cache_tags WHERE tag = ?", (tag,)).fetchone()
+        return row[0] if row else 0
+    
+    def tag_generation(self, tag: Optional[str]) -> int:
+        return self._generation(self._connection(), tag) if tag is not None else 0
+    
+    def invalidate_tag(self, tag: str) -> int:
+        db = self._connection()
+        with db:
+            db.execute(
+                "INSERT INTO cache_tags VALUES (?, 1) "
+                "ON CONFLICT (tag) DO UPDATE SET generation = generation + 1",
+                (tag,)
+            )
+            return db.execute("DELETE FROM cache_entries WHERE tag = ?", (tag,)).rowcount
+    
+    def delete_function(self, qualname: str) -> int:
+        db = self._connection()
+        with db:
+            return db.execute("DELETE FROM cache_entries WHERE function = ?", (qualname,)).rowcount
+    
+    def delete_matching(self, predicate: Callable[[str], bool]) -> int:
+        db = self._connection()
+        keys = [(text,) for text, label in db.execute("SELECT key, label FROM cache_entries") if predicate(label)]
+        with db:
+            db.executemany("DELETE FROM cache_entries WHERE key = ?", keys)
+        return len(keys)
+    
+    def clear(self) -> int:
+        db = self._connection()
+        with db:
+            return db.execute("DELETE FROM cache_entries").rowcount
+    
+    def sweep_expired(self) -> int:
+        db = self._connection()
+        now = time.time()
+        with db:
+            removed = db.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (now,)).rowcount
+        self._last_sweep = now
+        return removed
+    
+    def keys(self, limit: int = 10) -> List[str]:
+        rows = self._connection().execute(
+            "SELECT label FROM cache_entries ORDER BY accessed_at LIMIT ?", (limit,)
+        )
+        return [label for (label,) in rows]
+    
+    def stats(self) -> dict:
+        size, total = self._totals(self._connection())
+        return {
+            'backend': self.name,
+            'path': self.path,
+            'size': size,
+            'bytes': total,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+        }
+
+
+class RedisError(Exception):
+    """Error reply from a Redis-protocol server."""
+    pass
+
+
+class RespConnection:
+    """
+    Minimal blocking client for the Redis serialization protocol (RESP2).
+    
+    Only sends commands as arrays of bulk strings and parses the five RESP2
+    reply types, so any server implementing the commands used by
+    RedisCacheBackend (GET, SET PX, DEL, SADD, SMEMBERS, PTTL, PEXPIRE,
+    INCR, HINCRBY, HGETALL, SCAN, plus AUTH/SELECT) works, including a local stand-in.
+    """
+    
+    def __init__(self, host: str = "localhost", port: int = 6379, db: int = 0,
+                 password: Optional[str] = None, timeout: float = 5.0):
+        self._socket = socket.create_connection((host, port), timeout=timeout)
+        self._reader = self._socket.makefile("rb")
+        if password:
+            self.command("AUTH", password)
+        if db:
+            self.command("SELECT", db)
+    
+    @classmethod
+    def from_url(cls, url: str) -> "RespConnection":
+        """Connect to redis://[:password@]host[:port][/db]."""
+        parsed = urlparse(url)
+        return cls(
+            host=parsed.hostname or "localhost",
+            port=parsed.port or 6379,
+            db=int(parsed.path.lstrip("/") or 0),
+            password=unquote(parsed.password) if parsed.password else None
+        )
+    
+    def command(self, *args: Any) -> Any:
+        """Send one command and return its decoded reply."""
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        self._socket.sendall(b"".join(parts))
+        return self._read_reply()
+    
+    def _read_reply(self) -> Any:
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by the cache server")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode()
+        if kind == b"-":
+            raise RedisError(body.decode())
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(body)
+            return None if length < 0 else [self._read_reply() for _ in range(length)]
+        raise RedisError(f"Unexpected reply: {line!r}")
+    
+    def close(self) -> None:
+        self._reader.close()
+        self._socket.close()
+
+
+def _glob_escape(text: str) -> str:
+    """Escape Redis MATCH pattern characters."""
+    return "".join("\\" + char if char in "*?[]\\" else char for char in text)
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Cache on a Redis-protocol server, shared by every worker and machine.
+    
+    Entries are strings holding the expiry header and payload, written with
+    the hard TTL as PX so the server expires them itself; tags are sets of
+    entry keys. Size bounds and LRU eviction are left to the server
+    (maxmemory with an allkeys-lru policy).
+    
+    Hit, miss, write and removal counts live in one hash shared by all
+    workers; each process adds its own counts to it at most once per
+    stats_flush_interval_seconds (and whenever stats() is read), so
+    neither lookups nor stats() walk the keyspace.
+    """
+    
+    name = "redis"
+    
+    _HEADER = 16  # two big-endian doubles: stale_at, expires_at
+    _COUNTERS = ("hits", "misses", "writes", "removed")
+    
+    def __init__(self, url: str, prefix: str = "nutrichef:cache:", stats_flush_interval_seconds: float = 5):
+        self.url = url
+        self.prefix = prefix
+        self.stats_flush_interval_seconds = stats_flush_interval_seconds
+        self._local = threading.local()
+        self._counts = dict.fromkeys(self._COUNTERS, 0)
+        self._counts_lock = threading.Lock()
+        self._last_flush = time.time()
+    
+    def _command(self, *args: Any) -> Any:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = RespConnection.from_url(self.url)
+        try:
+            return connection.command(*args)
+        except (ConnectionError, OSError):
+            # Reconnect once, e.g. after the server restarted
+            connection.close()
+            self._local.connection = RespConnection.from_url(self.url)
+            return self._local.connection.command(*args)
+    
+    def _entry_key(self, key: tuple) -> str:
+        return f"{self.prefix}e:{storage_key(key)}"
+    
+    def _tag_key(self, tag: str) -> str:
+        return f"{self.prefix}t:{tag}"
+    
+    def _generation_key(self, tag: str) -> str:
+        return f"{self.prefix}g:{tag}"
+    
+    def _stats_key(self) -> str:
+        return f"{self.prefix}stats"
+    
+    def _count(self, counter: str, amount: int = 1) -> None:
+        with self._counts_lock:
+            self._counts[counter] += amount
+            if time.time() - self._last_flush < self.stats_flush_interval_seconds:
+                return
+        self._flush_counts()
+    
+    def _flush_counts(self) -> None:
+        with self._counts_lock:
+            pending = {counter: amount for counter, amount in self._counts.items() if amount}
+            self._counts = dict.fromkeys(self._COUNTERS, 0)
+            self._last_flush = time.time()
+        for counter, amount in pending.items():
+            self._command("HINCRBY", self._stats_key(), counter, amount)
+    
+    def _scan(self, pattern: str) -> Iterator[bytes]:
+        cursor = b"0"
+        while True:
+            cursor, keys = self._command("SCAN", cursor, "MATCH", pattern, "COUNT", 500)
+            yield from keys
+            if cursor in (b"0", 0):
+                return
+    
+    def _delete(self, entry_keys: List[Any]) -> int:
+        removed = 0
+        for start in range(0, len(entry_keys), 500):
+            removed += self._command("DEL", *entry_keys[start:start + 500])
+        if removed:
+            self._count("removed", removed)
+        return removed
+    
+    def get(self, key: tuple) -> Optional[CacheRecord]:
+        data = self._command("GET", self._entry_key(key))
+        if data is None:
+            self._count("misses")
+            return None
+        stale_at, expires_at = struct.unpack("!dd", data[:self._HEADER])
+        if expires_at <= time.time():
+            self._count("misses")
+            return None
+        self._count("hits")
+        return CacheRecord(data[self._HEADER:], stale_at, expires_at)
+    
+    def set(self, key: tuple, record: CacheRecord, tag: Optional[str] = None, generation: int = 0) -> bool:
+        ttl_ms = int((record.expires_at - time.time()) * 1000)
+        if ttl_ms <= 0:
+            return False
+        entry_key = self._entry_key(key)
+        if tag is not None and self.tag_generation(tag) != generation:
+            return False
+        self._command("SET", entry_key, struct.pack("!dd", record.stale_at, record.expires_at) + record.payload, "PX", ttl_ms)
+        if tag is not None:
+            tag_key = self._tag_key(tag)
+            self._command("SADD", tag_key, entry_key)
+            if self._command("PTTL", tag_key) < ttl_ms:  # only ever extend the set's lifetime
+                self._command("PEXPIRE", tag_key, ttl_ms)
+            # An invalidation that ran between the generation check and SADD
+            # has bumped the generation; undo the write then
+            if self.tag_generation(tag) != generation:
+                self._command("DEL", entry_key)
+                return False
+        self._count("writes")
+        return True
+    
+    def tag_generation(self, tag: Optional[str]) -> int:
+        if tag is None:
+            return 0
+        value = self._command("GET", self._generation_key(tag))
+        return int(value) if value is not None else 0
+    
+    def invalidate_tag(self, tag: str) -> int:
+        # Bump first, so writers racing with this invalidation undo their entry
+        self._command("INCR", self._generation_key(tag))
+        tag_key = self._tag_key(tag)
+        entry_keys = self._command("SMEMBERS", tag_key) or []
+        self._command("DEL", tag_key)
+        return self._delete(entry_keys)
+    
+    def delete_function(self, qualname: str) -> int:
+        # Labels of one function are "<qualname>" or "<qualname>:<args>"
+        pattern = f"{_glob_escape(self.prefix)}e:{_glob_escape(qualname)}[:#]*"
+        return self._delete(list(self._scan(pattern)))
+    
+    def delete_matching(self, predicate: Callable[[str], bool]) -> int:
+        offset = len(f"{self.prefix}e:")
+        return self._delete([
+            entry_key for entry_key in self._scan(f"{_glob_escape(self.prefix)}e:*")
+            if predicate(_label_of(entry_key.decode()[offset:]))
+        ])
+    
+    def clear(self) -> int:
+        return self._delete(list(self._scan(f"{_glob_escape(self.prefix)}[et]:*")))
+    
+    def sweep_expired(self) -> int:
+        return 0  # the server expires entries itself
+    
+    def keys(self, limit: int = 10) -> List[str]:
+        offset = len(f"{self.prefix}e:")
+        keys = []
+        for entry_key in self._scan(f"{_glob_escape(self.prefix)}e:*"):
+            keys.append(_label_of(entry_key.decode()[offset:]))
+            if len(keys) >= limit:
+                break
+        return keys
+    
+    def stats(self) -> dict:
+        self._flush_counts()
+        reply = self._command("HGETALL", self._stats_key()) or []
+        counts = {field.decode(): int(value) for field, value in zip(reply[::2], reply[1::2])}
+        return {
+            'backend': self.name,
+            'url': self.url,
+            **{counter: counts.get(counter, 0) for counter in self._COUNTERS},
+        }
+
+
+def create_backend(settings) -> CacheBackend:
+    """
+    Backend selected by settings.CACHE_BACKEND ("memory", "sqlite" or "redis").
+    
+    Raises:
+        ValueError: For an unknown backend name
+    """
+    kind = settings.CACHE_BACKEND.lower()
+    if kind == "memory":
+        return MemoryCacheBackend(
+            settings.CACHE_MAX_ENTRIES, settings.CACHE_MAX_BYTES, settings.CACHE_SWEEP_INTERVAL_SECONDS
+        )
+    if kind == "sqlite":
+        return SQLiteCacheBackend(
+            settings.CACHE_SQLITE_PATH,
+            settings.CACHE_MAX_ENTRIES, settings.CACHE_MAX_BYTES, settings.CACHE_SWEEP_INTERVAL_SECONDS
+        )
+    if kind == "redis":
+        return RedisCacheBackend(settings.CACHE_REDIS_URL, settings.CACHE_KEY_PREFIX)
+    raise ValueError(f"Unknown CACHE_BACKEND '{settings.CACHE_BACKEND}' (expected memory, sqlite or redis)")
+
+
+__all__ = [
+    "CacheBackend", "CacheRecord", "MemoryCacheBackend", "SQLiteCacheBackend", "RedisCacheBackend",
+    "RespConnection", "RedisError", "create_backend", "encode_value", "decode_value",
+    "key_label", "storage_key",
+]
@@ -1,60 +1,417 @@
 """
 Simple caching service for recommendations.
-Uses in-memory cache with TTL.
+Uses a TTL cache in a pluggable storage backend.
+
+Entries can also be tagged (e.g. "user:42" for one user's
+recommendations) and dropped by tag. Writes that change what a user
+should be recommended publish events on the EventManager, and the
+entries tagged with that user are invalidated as they happen.
+
+With a soft TTL (stale-while-revalidate), an entry past it but within
+its hard TTL is still served at once while a worker thread recomputes it.
+
+Storage is chosen by CACHE_BACKEND (see cache_backends): "memory" keeps a
+bounded LRU cache per worker process; "sqlite" and "redis" share entries,
+and invalidations, between all uvicorn workers. Results are stored
+serialized, so every hit returns its own copy, with ORM instances rebuilt
+from their column values.
 """
 
-from typing import Optional, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Any, Hashable, Sequence, Tuple
 from datetime import datetime, timedelta
 from functools import wraps
-import hashlib
-import json
+from threading import Event, RLock
+import asyncio
+import inspect
+import logging
+import time
 
-# Simple in-memory cache
-_cache = {}
-_cache_ttl = timedelta(minutes=30)  # Cache for 30 minutes
+from sqlalchemy.orm import Session
 
+from app.config import settings
+from app.core.observer import EventManager
+from app.services.cache_backends import (
+    CacheBackend, CacheRecord, create_backend, decode_value, encode_value, key_label as _key_label
+)
+
+logger = logging.getLogger(__name__)
+
+_backend: Optional[CacheBackend] = None
+_lock = RLock()
+
+
+class _Flight:
+    """A computation in progress that concurrent callers of the same key wait on."""
+    
+    def __init__(self):
+        self.done = Event()
+        self.payload: Optional[bytes] = None  # the result, encoded
+        self.result: Any = None  # the result itself if it could not be encoded
+        self.error: Optional[BaseException] = None
+    
+    def wait(self) -> Any:
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return decode_value(self.payload) if self.payload is not None else self.result
+
+
+# Computations in progress in this process: {(key, tag generation): _Flight};
+# coroutine functions share asyncio tasks instead, per event loop
+_flights: Dict[tuple, _Flight] = {}
+_async_flights: Dict[tuple, "asyncio.Task"] = {}
+# Keys with a background refresh scheduled or running
+_refreshing: set = set()
+_refresh_executor: Optional[ThreadPoolExecutor] = None
+_background_tasks: set = set()
+
+# Events published after writes that change a user's recommendations;
+# each carries {"user_id": ...}
+USER_EVENTS = ("meal_rated", "user_meal_logged", "preferences_updated", "user_updated")
+_subscribed = False
+
+
+def get_backend() -> CacheBackend:
+    """Storage backend in use, created from settings on first use."""
+    global _backend
+    if _backend is None:
+        with _lock:
+            if _backend is None:
+                _backend = create_backend(settings)
+                logger.info(f"Cache backend: {_backend.name}")
+    return _backend
+
+
+def set_backend(backend: CacheBackend) -> None:
+    """Replace the storage backend (entries in the previous one are not moved)."""
+    global _backend
+    with _lock:
+        _backend = backend
 
-def get_cache_key(*args, **kwargs) -> str:
-    """Generate cache key from function arguments."""
-    key_data = {
-        'args': args,
-        'kwargs': kwargs
-    }
-    key_str = json.dumps(key_data, sort_keys=True, default=str)
-    return hashlib.md5(key_str.encode()).hexdigest()
 
+def _lookup(key: tuple) -> Optional[Tuple[CacheRecord, Any]]:
+    """(record, decoded value) for a hit, None for a miss."""
+    record = get_backend().get(key)
+    if record is None:
+        return None
+    try:
+        return record, decode_value(record.payload)
+    except Exception as e:
+        # e.g. written by an older version of a cached class
+        logger.warning(f"Discarding unreadable cache entry {_key_label(key)}: {e}")
+        return None
 
-def cached(ttl_seconds: int = 1800):
+
+def _executor() -> ThreadPoolExecutor:
+    """Worker threads for background refreshes, started on first use."""
+    global _refresh_executor
+    with _lock:
+        if _refresh_executor is None:
+            _refresh_executor = ThreadPoolExecutor(
+                max_workers=settings.CACHE_REFRESH_WORKERS, thread_name_prefix="cache-refresh"
+            )
+    return _refresh_executor
+
+
+def sweep_expired() -> int:
+    """
+    Drop every expired entry.
+    
+    Returns:
+        Number of entries removed
+    """
+    return get_backend().sweep_expired()
+
+
+def _freeze(value: Any) -> Hashable:
+    """Turn an argument into a hashable key part (lists/sets/dicts become tuples)."""
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(_freeze(item) for item in value))
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    return value
+
+
+def user_tag(user_id: Any) -> str:
+    """Tag carried by the cache entries computed for one user."""
+    return f"user:{user_id}"
+
+
+def cached(
+    ttl_seconds: int = 1800,
+    key_params: Optional[Sequence[str]] = None,
+    user_param: Optional[str] = None,
+    daily: bool = False,
+    clear_on: Sequence[str] = (),
+    single_flight: bool = False,
+    soft_ttl_seconds: Optional[int] = None,
+    session_factory: Optional[Callable[[], Session]] = None
+):
     """
     Decorator for caching function results.
     
+    The key is a plain tuple of the function name and the key parameter
+    values, so equal calls hit across requests; database sessions and
+    other per-request context never take part in it.
+    
     Args:
-        ttl_seconds: Time to live in seconds (default: 30 minutes)
+        ttl_seconds: Time to live in seconds (default: 30 minutes); the
+            hard TTL when soft_ttl_seconds is set
+        key_params: Parameters that identify a result (default: every
+            parameter except Session arguments)
+        user_param: Parameter holding the user id; entries are tagged with
+            user_tag(user_id) and dropped when one of USER_EVENTS is
+            published for that user
+        daily: Also expire entries at midnight (for results that depend
+            on what the user logged today)
+        clear_on: Events that drop every entry of the function (e.g. meal
+            catalog writes)
+        single_flight: On a miss, let one caller compute the result while
+            concurrent callers with the same key wait for it instead of
+            computing it too (threads for sync functions, tasks on the
+            same event loop for coroutine functions)
+        soft_ttl_seconds: Age after which a hit is still returned but
+            recomputed in the background (on a worker thread for sync
+            functions, as a task for coroutine functions)
+        session_factory: Opens the Session a background refresh runs
+            with, in place of the caller's; required with
+            soft_ttl_seconds when the function takes a Session
+    
+    Example:
+        @cached(ttl_seconds=600, key_params=("user_id", "limit"), user_param="user_id")
+        def get_recommendations(db: Session, user_id: int, limit: int = 10): ...
     """
     def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            # Generate cache key
-            cache_key = f"{func.__name__}:{get_cache_key(*args, **kwargs)}"
-            
-            # Check cache
-            if cache_key in _cache:
-                cached_value, cached_time = _cache[cache_key]
-                age = datetime.now() - cached_time
+        signature = inspect.signature(func)
+        for name in (*(key_params or ()), *((user_param,) if user_param else ())):
+            if name not in signature.parameters:
+                raise ValueError(f"{func.__qualname__} has no parameter '{name}' to cache on")
+        if soft_ttl_seconds is not None and session_factory is None and any(
+            parameter.annotation is Session for parameter in signature.parameters.values()
+        ):
+            raise ValueError(f"{func.__qualname__} takes a Session; soft_ttl_seconds needs a session_factory")
+        if user_param:
+            _subscribe_user_events()
+        for event_type in clear_on:
+            EventManager().subscribe(event_type, lambda event_type, data: _clear_function(func.__qualname__))
+        # Positions and defaults resolved once, so building a key needs no signature binding
+        parameters = [
+            parameter for parameter in signature.parameters.values()
+            if parameter.kind not in (parameter.VAR_POSITIONAL, parameter.VAR_KEYWORD)
+        ]
+        positions = {
+            parameter.name: index for index, parameter in enumerate(parameters)
+            if parameter.kind != parameter.KEYWORD_ONLY
+        }
+        defaults = {parameter.name: parameter.default for parameter in parameters}
+        
+        def argument(name, args, kwargs):
+            if name in kwargs:
+                return kwargs[name]
+            index = positions.get(name, len(args))
+            return args[index] if index < len(args) else defaults[name]
+        
+        def make_key(args, kwargs) -> tuple:
+            names = key_params
+            if names is None:
+                names = [name for name in defaults if not isinstance(argument(name, args, kwargs), Session)]
+            return (func.__qualname__,) + tuple(_freeze(argument(name, args, kwargs)) for name in names)
+        
+        def store(cache_key, result, tag, generation) -> Optional[bytes]:
+            """Write a result to the backend; returns it encoded (None if it cannot be)."""
+            try:
+                payload = encode_value(result)
+            except Exception as e:
+                logger.warning(f"Result of {_key_label(cache_key)} cannot be cached: {e}")
+                return None
+            now = time.time()
+            expires_at = now + ttl_seconds
+            if daily:
+                midnight = datetime.combine(datetime.now().date() + timedelta(days=1), datetime.min.time())
+                expires_at = min(expires_at, midnight.timestamp())
+            stale_at = expires_at
+            if soft_ttl_seconds is not None:
+                stale_at = min(stale_at, now + soft_ttl_seconds)
+            # Not stored if the user's data changed while computing
+            get_backend().set(cache_key, CacheRecord(payload, stale_at, expires_at), tag, generation)
+            return payload
+        
+        def fresh_sessions(args, kwargs, opened):
+            """The call's arguments with every Session replaced by a new one."""
+            def swap(value):
+                if isinstance(value, Session) and session_factory is not None:
+                    opened.append(session_factory())
+                    return opened[-1]
+                return value
+            return [swap(value) for value in args], {name: swap(value) for name, value in kwargs.items()}
+        
+        def claim_refresh(cache_key, record) -> bool:
+            """Whether the caller should schedule a refresh of a stale entry."""
+            if soft_ttl_seconds is None or record.stale_at > time.time():
+                return False
+            with _lock:
+                if cache_key in _refreshing:
+                    return False
+                _refreshing.add(cache_key)
+            return True
+        
+        def refresh(cache_key, tag, args, kwargs) -> None:
+            opened = []
+            try:
+                generation = get_backend().tag_generation(tag)
+                args, kwargs = fresh_sessions(args, kwargs, opened)
+                store(cache_key, func(*args, **kwargs), tag, generation)
+            except Exception as e:
+                logger.warning(f"Background refresh of {_key_label(cache_key)} failed: {e}")
+            finally:
+                for session in opened:
+                    session.close()
+                with _lock:
+                    _refreshing.discard(cache_key)
+        
+        async def refresh_async(cache_key, tag, args, kwargs) -> None:
+            opened = []
+            try:
+                generation = get_backend().tag_generation(tag)
+                args, kwargs = fresh_sessions(args, kwargs, opened)
+                store(cache_key, await func(*args, **kwargs), tag, generation)
+            except Exception as e:
+                logger.warning(f"Background refresh of {_key_label(cache_key)} failed: {e}")
+            finally:
+                for session in opened:
+                    session.close()
+                with _lock:
+                    _refreshing.discard(cache_key)
+        
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                cache_key = make_key(args, kwargs)
+                tag = user_tag(argument(user_param, args, kwargs)) if user_param else None
+                
+                hit = _lookup(cache_key)
+                if hit is not None:
+                    record, value = hit
+                    if claim_refresh(cache_key, record):
+                        task = asyncio.get_running_loop().create_task(refresh_async(cache_key, tag, args, kwargs))
+                        _background_tasks.add(task)  # keeps the task referenced until it is done
+                        task.add_done_callback(_background_tasks.discard)
+                    return value
+                
+                async def compute(generation):
+                    result = await func(*args, **kwargs)
+                    return result, store(cache_key, result, tag, generation)
+                
+                generation = get_backend().tag_generation(tag)
+                if not single_flight:
+                    result, _ = await compute(generation)
+                    return result
                 
-                if age.total_seconds() < ttl_seconds:
-                    return cached_value
-            
-            # Call function and cache result
-            result = func(*args, **kwargs)
-            _cache[cache_key] = (result, datetime.now())
-            
-            return result
+                loop = asyncio.get_running_loop()
+                flight_key = (cache_key, generation, id(loop))
+                with _lock:
+                    task = _async_flights.get(flight_key)
+                    if task is None:
+                        task = loop.create_task(compute(generation))
+                        _async_flights[flight_key] = task
+                        task.add_done_callback(lambda _: _async_flights.pop(flight_key, None))
+                # Shielded so a cancelled waiter does not cancel the shared computation
+                result, payload = await asyncio.shield(task)
+                # Every waiter gets its own copy
+                return decode_value(payload) if payload is not None else result
+        else:
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                # Generate cache key
+                cache_key = make_key(args, kwargs)
+                
+                tag = user_tag(argument(user_param, args, kwargs)) if user_param else None
+                
+                # Check cache; a stale hit is served and refreshed in the background
+                hit = _lookup(cache_key)
+                if hit is not None:
+                    record, value = hit
+                    if claim_refresh(cache_key, record):
+                        _executor().submit(refresh, cache_key, tag, args, kwargs)
+                    return value
+                
+                generation = get_backend().tag_generation(tag)
+                if not single_flight:
+                    result = func(*args, **kwargs)
+                    store(cache_key, result, tag, generation)
+                    return result
+                
+                flight_key = (cache_key, generation)
+                with _lock:
+                    flight = _flights.get(flight_key)
+                    leader = flight is None
+                    if leader:
+                        flight = _flights[flight_key] = _Flight()
+                
+                if not leader:
+                    return flight.wait()
+                
+                try:
+                    # Re-check: another flight may have finished since the lookup above
+                    hit = _lookup(cache_key)
+                    if hit is not None:
+                        flight.payload = hit[0].payload
+                        return hit[1]
+                    result = func(*args, **kwargs)
+                    flight.payload = store(cache_key, result, tag, generation)
+                    flight.result = result
+                    return result
+                except BaseException as e:
+                    flight.error = e
+                    raise
+                finally:
+                    with _lock:
+                        _flights.pop(flight_key, None)
+                    flight.done.set()
         
+        wrapper.cache_key = lambda *args, **kwargs: make_key(args, kwargs)
         return wrapper
     return decorator
 
 
+def invalidate_tag(tag: str) -> int:
+    """
+    Drop every cache entry carrying a tag, in every worker sharing the backend.
+    
+    Args:
+        tag: Tag to invalidate, e.g. user_tag(42)
+    
+    Returns:
+        Number of entries removed
+    """
+    return get_backend().invalidate_tag(tag)
+
+
+def invalidate_user(event_type: Optional[str] = None, data=None) -> int:
+    """Drop a user's cached results (EventManager observer for USER_EVENTS)."""
+    user_id = data.get("user_id") if isinstance(data, dict) else data
+    if user_id is None:
+        return 0
+    return invalidate_tag(user_tag(user_id))
+
+
+def _subscribe_user_events() -> None:
+    """Subscribe invalidate_user to the user write events once per process."""
+    global _subscribed
+    if not _subscribed:
+        for event_type in USER_EVENTS:
+            EventManager().subscribe(event_type, invalidate_user)
+        _subscribed = True
+
+
+def _clear_function(qualname: str) -> int:
+    """Drop every cached result of one function."""
+    return get_backend().delete_function(qualname)
+
+
 def clear_cache(pattern: Optional[str] = None):
     """
     Clear cache entries.
@@ -63,24 +420,14 @@ def clear_cache(pattern: Optional[str] = None):
         pattern: Optional pattern to match keys (if None, clears all)
     """
     if pattern:
-        keys_to_remove = [key for key in _cache.keys() if pattern in key]
-        for key in keys_to_remove:
-            del _cache[key]
-        return len(keys_to_remove)
-    else:
-        count = len(_cache)
-        _cache.clear()
-        return count
+        return get_backend().delete_matching(lambda label: pattern in label)
+    return get_backend().clear()
 
 
 def get_cache_stats() -> dict:
     """Get cache statistics."""
+    backend = get_backend()
     return {
-        'size': len(_cache),
-        'keys': list(_cache.keys())[:10]  # First 10 keys as sample
+        **backend.stats(),
+        'keys': backend.keys(10)  # First 10 keys as sample
     }
-
-
-
-
-
@@ -0,0 +1,238 @@
+"""
+Process-wide columnar snapshot of the meal catalog.
+
+Recommendation and planning need to look at every meal, and
+loading them as ORM objects costs a full table read plus one Python object
+graph per meal on every request. MealCatalog holds the columns those code
+paths read as NumPy arrays (ids, nutrients, category codes, dietary
+bitmasks) and the text columns as compact object arrays. It is loaded once per
+process, shared by all requests, and reloaded after meals are created,
+updated or deleted (or once it is older than MEAL_CATALOG_MAX_AGE_SECONDS,
+which covers writes made by other processes). Meal search does not use
+it: search results must show every meal the moment it is written, so they
+come straight from the database.
+"""
+import time
+import logging
+from threading import Lock
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.core.observer import EventManager
+from app.enums import DietaryRestriction
+from app.models.meal import Meal
+
+logger = logging.getLogger(__name__)
+
+# Events published by MealRepository after meal writes
+MEAL_EVENTS = ("meal_created", "meal_updated", "meal_deleted")
+
+
+class MealRow(NamedTuple):
+    """
+    Read-only view of one catalog row.
+    
+    Has the attribute names of Meal for the columns the scoring and
+    planning code reads, so it can stand in for an ORM meal there.
+    """
+    id: int
+    name: str
+    description: Optional[str]
+    category: Optional[str]
+    ingredients: Optional[str]
+    calories: float
+    protein: float
+    carbohydrates: float
+    fat: float
+    is_vegetarian: bool
+    is_vegan: bool
+    is_gluten_free: bool
+    is_dairy_free: bool
+    is_nut_free: bool
+    is_halal: bool
+    is_kosher: bool
+
+
+class MealCatalog:
+    """
+    Immutable columnar snapshot of the meals table, ordered by meal id.
+    
+    Attributes:
+        ids: Meal ids (int64, ascending)
+        names, descriptions, ingredients: Text columns (object arrays)
+        categories: Distinct category names; category_codes indexes into
+            it per meal (-1 = no category)
+        calories, protein, carbohydrates, fat: Nutrients (float64)
+        diet_masks: Dietary bitmask per meal (Meal.diet_mask, int64)
+    """
+    
+    DIET_FLAGS: List[str] = DietaryRestriction.list()
+    
+    def __init__(self, rows: Sequence[tuple]):
+        """
+        Args:
+            rows: (id, name, description, category, ingredients, calories,
+                protein, carbohydrates, fat, diet_mask) tuples ordered by id
+        """
+        columns = list(zip(*rows)) if rows else [()] * 10
+        self.ids = np.array(columns[0], dtype=np.int64)
+        self.names = np.array(columns[1], dtype=object)
+        self.descriptions = np.array(columns[2], dtype=object)
+        self.ingredients = np.array(columns[4], dtype=object)
+        # Lower-cased once for the case-insensitive text matching
+        self._lower_names = [name.lower() for name in self.names]
+        self._lower_descriptions = [(description or "").lower() for description in self.descriptions]
+        
+        self.categories = sorted({category for category in columns[3] if category is not None})
+        codes = {category: code for code, category in enumerate(self.categories)}
+        self.category_codes = np.array([codes.get(category, -1) for category in columns[3]], dtype=np.int16)
+        
+        self.calories, self.protein, self.carbohydrates, self.fat = (
+            np.array(column, dtype=np.float64) for column in columns[5:9]
+        )
+        self.diet_masks = np.array(columns[9], dtype=np.int64)
+        # Compliant positions per required mask; at most 2^len(DIET_FLAGS) entries
+        self._compliant: Dict[int, np.ndarray] = {}
+        self.loaded_at = time.monotonic()
+    
+    @classmethod
+    def load(cls, db: Session) -> "MealCatalog":
+        """Read the catalog columns in one query, without building ORM objects."""
+        rows = db.query(
+            Meal.id, Meal.name, Meal.description, Meal.category, Meal.ingredients,
+            Meal.calories, Meal.protein, Meal.carbohydrates, Meal.fat, Meal.diet_mask
+        ).order_by(Meal.id).all()
+        return cls(rows)
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    def positions(self, meal_ids: Sequence[int]) -> np.ndarray:
+        """Catalog positions of meal ids (ids not in the catalog are dropped)."""
+        meal_ids = np.asarray(meal_ids, dtype=np.int64)
+        if not len(self.ids):
+            return np.empty(0, dtype=np.int64)
+        positions = np.searchsorted(self.ids, meal_ids).clip(max=len(self.ids) - 1)
+        return positions[self.ids[positions] == meal_ids]
+    
+    def in_category(self, category: str) -> np.ndarray:
+        """Positions of the meals in a category."""
+        if category not in self.categories:
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero(self.category_codes == self.categories.index(category))
+    
+    def compliant(self, required_mask: int) -> np.ndarray:
+        """
+        Positions of the meals carrying every dietary bit in required_mask.
+        
+        The result is cached per mask for the lifetime of the snapshot.
+        """
+        positions = self._compliant.get(required_mask)
+        if positions is None:
+            if required_mask:
+                positions = np.flatnonzero((self.diet_masks & required_mask) == required_mask)
+            else:
+                positions = np.arange(len(self.ids))
+            self._compliant[required_mask] = positions
+        return positions
+    
+    def satisfies(self, positions: np.ndarray, required_mask: int) -> np.ndarray:
+        """Mask of the meals at positions that carry every bit in required_mask."""
+        return (self.diet_masks[positions] & required_mask) == required_mask
+    
+    def text_contains(self, term: str) -> np.ndarray:
+        """Mask of meals whose name or description contains a lower-case term."""
+        return np.fromiter(
+            (term in name or term in description
+             for name, description in zip(self._lower_names, self._lower_descriptions)),
+            dtype=bool, count=len(self.ids)
+        )
+    
+    def row(self, position: int) -> MealRow:
+        """One meal as a MealRow."""
+        mask = int(self.diet_masks[position])
+        return MealRow(
+            int(self.ids[position]),
+            self.names[position],
+            self.descriptions[position],
+            self.categories[self.category_codes[position]] if self.category_codes[position] >= 0 else None,
+            self.ingredients[position],
+            float(self.calories[position]),
+            float(self.protein[position]),
+            float(self.carbohydrates[position]),
+            float(self.fat[position]),
+            *(bool(mask >> bit & 1) for bit in range(len(self.DIET_FLAGS)))
+        )
+    
+    def rows(self, positions: Optional[Sequence[int]] = None) -> List[MealRow]:
+        """Meals at positions (default: all) as MealRows."""
+        if positions is None:
+            positions = range(len(self.ids))
+        return [self.row(position) for position in positions]
+
+
+class MealCatalogService:
+    """
+    Access to the shared MealCatalog snapshot.
+    
+    Usage:
+        catalog = MealCatalogService.get(db)
+        meals = catalog.rows(catalog.in_category("lunch"))
+    """
+    
+    _catalog: Optional[MealCatalog] = None
+    _stale: bool = False
+    _subscribed: bool = False
+    _lock: Lock = Lock()
+    
+    @staticmethod
+    def get(db: Session) -> MealCatalog:
+        """
+        Current catalog snapshot, (re)loading it first if needed.
+        
+        Args:
+            db: Database session used when the snapshot has to be loaded
+        
+        Returns:
+            MealCatalog shared by every request in this process
+        """
+        catalog = MealCatalogService._catalog
+        if catalog is not None and not MealCatalogService._needs_reload(catalog):
+            return catalog
+        
+        with MealCatalogService._lock:
+            catalog = MealCatalogService._catalog
+            if catalog is None or MealCatalogService._needs_reload(catalog):
+                MealCatalogService._subscribe()
+                MealCatalogService._stale = False
+                try:
+                    catalog = MealCatalog.load(db)
+                except Exception:
+                    MealCatalogService._stale = True
+                    raise
+                MealCatalogService._catalog = catalog
+                logger.info(f"Meal catalog loaded ({len(catalog):,} meals)")
+        return catalog
+    
+    @staticmethod
+    def _needs_reload(catalog: MealCatalog) -> bool:
+        return (
+            MealCatalogService._stale
+            or time.monotonic() - catalog.loaded_at > settings.MEAL_CATALOG_MAX_AGE_SECONDS
+        )
+    
+    @staticmethod
+    def invalidate(event_type: Optional[str] = None, data=None) -> None:
+        """Reload the catalog on next access (EventManager observer for meal events)."""
+        MealCatalogService._stale = True
+    
+    @staticmethod
+    def _subscribe() -> None:
+        """Subscribe to meal write events once per process."""
+        if not MealCatalogService._subscribed:
+            for event_type in MEAL_EVENTS:
+                EventManager().subscribe(event_type, MealCatalogService.invalidate)
+            MealCatalogService._subscribed = True
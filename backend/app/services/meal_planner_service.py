@@ -9,7 +9,7 @@ from datetime import date, timedelta
 from sqlalchemy.orm import Session
 import random
 
-from app.repositories.meal_repository import MealRepository
+from app.services.meal_catalog import MealCatalogService
 from app.repositories.user_repository import UserRepository
 from app.repositories.preference_repository import PreferenceRepository
 from app.exceptions import UserNotFoundException
@@ -65,11 +65,11 @@ class MealPlannerService:
         
         preference = PreferenceRepository.get_by_user_id(db, user_id)
         
-        # Get all available meals
-        all_meals = MealRepository.get_all(db, skip=0, limit=5000)
+        # Get all available meals (plain rows from the shared catalog snapshot)
+        catalog = MealCatalogService.get(db)
         
         # Filter meals based on dietary restrictions
-        eligible_meals = MealPlannerService._filter_by_preferences(all_meals, preference)
+        eligible_meals = MealPlannerService._filter_by_preferences(catalog, preference)
         
         if len(eligible_meals) < 10:
             return {
@@ -133,39 +133,23 @@ class MealPlannerService:
         }
     
     @staticmethod
-    def _filter_by_preferences(meals: List, preference) -> List:
-        """Filter meals based on user dietary preferences."""
+    def _filter_by_preferences(catalog, preference) -> List:
+        """Filter catalog meals based on user dietary preferences."""
         if not preference:
-            return meals
+            return catalog.rows()
         
-        filtered = []
-        for meal in meals:
-            # Check dietary restrictions
-            if preference.vegetarian and not meal.is_vegetarian:
-                continue
-            if preference.vegan and not meal.is_vegan:
-                continue
-            if preference.gluten_free and not meal.is_gluten_free:
-                continue
-            if preference.dairy_free and not meal.is_dairy_free:
-                continue
-            if preference.nut_free and not meal.is_nut_free:
-                continue
-            if preference.halal and not meal.is_halal:
-                continue
-            if preference.kosher and not meal.is_kosher:
-                continue
-            
-            # Check disliked ingredients
-            if preference.disliked_ingredients and meal.ingredients:
-                disliked = [ing.strip().lower() for ing in preference.disliked_ingredients.split(',')]
-                meal_ingredients = meal.ingredients.lower()
-                if any(ing in meal_ingredients for ing in disliked):
-                    continue
-            
-            filtered.append(meal)
+        # Check dietary restrictions (candidates are cached per restriction bitmask)
+        meals = catalog.rows(catalog.compliant(preference.required_diet_mask()))
+        
+        # Check disliked ingredients
+        if preference.disliked_ingredients:
+            disliked = [ing.strip().lower() for ing in preference.disliked_ingredients.split(',')]
+            meals = [
+                meal for meal in meals
+                if not (meal.ingredients and any(ing in meal.ingredients.lower() for ing in disliked))
+            ]
         
-        return filtered
+        return meals
     
     @staticmethod
     def _categorize_meals(meals: List) -> Dict[str, List]:
@@ -6,29 +6,52 @@ This module provides the MLRecommendationService class which handles
 ML-based recommendation logic, implementing the IRecommendationEngine interface.
 """
 
-import os
-import pickle
 from pathlib import Path
 from typing import List, Dict, Optional
-from functools import lru_cache
 from sqlalchemy.orm import Session
 import logging
 
+import numpy as np
+
+from app.repositories.database import SessionLocal
 from app.repositories.meal_repository import MealRepository
 from app.repositories.user_repository import UserRepository
 from app.repositories.preference_repository import PreferenceRepository
 from app.repositories.user_meal_repository import UserMealRepository
-from app.services.nutrition_service import NutritionService
+from app.repositories.app_rating_repository import AppRatingRepository
 from app.services.recommendation_service import BaseRecommendationService, RecommendationService
 from app.services.cache_service import cached
+from app.services.meal_catalog import MEAL_EVENTS, MealCatalogService
 from app.exceptions import UserNotFoundException
-from datetime import date
+from app.enums import DietaryRestriction
+from app.config import settings
+from app.ml.cf_runtime import (
+    CollaborativeFilteringModel,
+    ItemItemCollaborativeFilteringModel,
+    MatrixFactorizationModel,
+    top_k_indices,
+)
+from app.ml.online_updater import CFModelUpdater
+from app.ml.model_registry import ModelRegistry
+from app.core.observer import EventManager
+from datetime import date, datetime, timedelta
 
 logger = logging.getLogger(__name__)
 
-# Model file path
+# Model file paths (CF models: memory-mappable bundle first, legacy pickle second)
 MODELS_DIR = Path(__file__).parent.parent.parent.parent / "models"
+ML_MODEL_BUNDLE = MODELS_DIR / "collaborative_filtering_model"
 ML_MODEL_FILE = MODELS_DIR / "collaborative_filtering_model.pkl"
+ITEM_ITEM_MODEL_BUNDLE = MODELS_DIR / "item_item_cf_model"
+ITEM_ITEM_MODEL_FILE = MODELS_DIR / "item_item_cf_model.pkl"
+MF_MODEL_FILE = MODELS_DIR / "matrix_factorization_model.npz"
+
+# Runtime model class and candidate artifacts per algorithm
+ML_ALGORITHMS = {
+    "user_user": (CollaborativeFilteringModel, (ML_MODEL_BUNDLE, ML_MODEL_FILE)),
+    "item_item": (ItemItemCollaborativeFilteringModel, (ITEM_ITEM_MODEL_BUNDLE, ITEM_ITEM_MODEL_FILE)),
+    "als": (MatrixFactorizationModel, (MF_MODEL_FILE,)),
+}
 
 
 class MLRecommendationService(BaseRecommendationService):
@@ -50,35 +73,103 @@ class MLRecommendationService(BaseRecommendationService):
     different algorithms.
     """
     
-    _ml_model = None
-    _model_loaded = False
+    _registry: Optional[ModelRegistry] = None  # Hot-reloadable models keyed by algorithm
+    _updaters: Dict[str, CFModelUpdater] = {}  # Online updaters keyed by algorithm
     
     @classmethod
-    def _load_ml_model(cls):
-        """Load ML model (lazy loading with caching)."""
-        if cls._model_loaded:
-            return cls._ml_model
+    def _get_registry(cls) -> ModelRegistry:
+        """Create the model registry (and start its watcher) on first use."""
+        if cls._registry is None:
+            cls._registry = ModelRegistry(
+                ML_ALGORITHMS,
+                on_load=cls._on_model_loaded,
+                poll_interval_seconds=settings.ML_MODEL_POLL_SECONDS
+            )
+            if settings.ML_MODEL_HOT_RELOAD:
+                cls._registry.start_watcher()
+        return cls._registry
+    
+    @classmethod
+    def _load_ml_model(cls, algorithm: Optional[str] = None):
+        """
+        Get the ML model currently served for an algorithm.
+        
+        Models come from the registry, which loads the newest artifact on
+        first use and hot-swaps in newer versions as they are published.
         
-        if not ML_MODEL_FILE.exists():
-            logger.warning(f"ML model not found at {ML_MODEL_FILE}. Using content-based only.")
-            cls._model_loaded = True
+        Args:
+            algorithm: "user_user", "item_item" or "als" (defaults to settings.ML_CF_ALGORITHM)
+        """
+        algorithm = algorithm or settings.ML_CF_ALGORITHM
+        if algorithm not in ML_ALGORITHMS:
+            logger.warning(f"Unknown ML algorithm '{algorithm}'. Using content-based only.")
             return None
+        return cls._get_registry().get(algorithm)
+    
+    @classmethod
+    def _on_model_loaded(cls, algorithm: str, model, model_file: Path):
+        """Prepare a freshly loaded model before the registry starts serving it."""
+        if getattr(model, "user_lsh", None) is not None:
+            model.user_lsh.probes = settings.ML_LSH_PROBES
+            model.user_lsh.min_users = settings.ML_LSH_MIN_USERS
+        if settings.ML_ONLINE_UPDATES and hasattr(model, "apply_rating"):
+            cls._attach_online_updater(algorithm).prepare(model)
+    
+    @classmethod
+    def _attach_online_updater(cls, algorithm: str) -> CFModelUpdater:
+        """
+        Feed "meal_rated" events into the served model (once per algorithm).
         
+        Snapshots are written as new versions of the algorithm's bundle, so
+        the registry of every worker hot-reloads them.
+        """
+        if algorithm not in cls._updaters:
+            _, base_paths = ML_ALGORITHMS[algorithm]
+            updater = CFModelUpdater(
+                cls._get_registry(),
+                algorithm,
+                replay_ratings=cls._replay_app_ratings,
+                snapshot_path=base_paths[0],
+                snapshot_every=settings.ML_SNAPSHOT_EVERY,
+                snapshot_interval_seconds=settings.ML_SNAPSHOT_INTERVAL_SECONDS
+            )
+            cls._updaters[algorithm] = updater
+            EventManager().subscribe("meal_rated", updater.update)
+        return cls._updaters[algorithm]
+    
+    @staticmethod
+    def _replay_app_ratings(model) -> Optional[datetime]:
+        """
+        Apply the in-app ratings made since the model's bundle was written.
+        
+        Replaying starts ML_RATINGS_REPLAY_OVERLAP_SECONDS before the
+        bundle's cutoff, to catch ratings committed after their timestamp;
+        ratings the model already has are applied again unchanged.
+        
+        Returns:
+            Database time the model's ratings are now complete up to, or None
+            if the model records no cutoff or the database is unavailable
+        """
+        if model.ratings_until is None:
+            logger.info("ML model does not record when its ratings end; not replaying in-app ratings")
+            return None
+        
+        since = model.ratings_until - timedelta(seconds=settings.ML_RATINGS_REPLAY_OVERLAP_SECONDS)
+        db = SessionLocal()
         try:
-            # Import the model class directly
-            import sys
-            scripts_path = Path(__file__).parent.parent / "scripts"
-            sys.path.insert(0, str(scripts_path))
-            from train_ml_model import CollaborativeFilteringModel
-            
-            cls._ml_model = CollaborativeFilteringModel.load(ML_MODEL_FILE)
-            cls._model_loaded = True
-            logger.info("✅ ML model loaded successfully")
-            return cls._ml_model
+            ratings_until = AppRatingRepository.database_time(db)
+            replayed = 0
+            for user_ids, meal_ids, ratings in AppRatingRepository.iter_ratings(db, since=since):
+                for rating in zip(user_ids.tolist(), meal_ids.tolist(), ratings.tolist()):
+                    model.apply_rating(*rating)
+                replayed += len(ratings)
         except Exception as e:
-            logger.warning(f"Error loading ML model: {e}. Using content-based only.")
-            cls._model_loaded = True
+            logger.warning(f"Could not replay in-app ratings onto the ML model: {e}")
             return None
+        finally:
+            db.close()
+        logger.info(f"Replayed {replayed:,} in-app ratings made since {model.ratings_until}")
+        return ratings_until
     
     @staticmethod
     def calculate_score(
@@ -98,13 +189,23 @@ class MLRecommendationService(BaseRecommendationService):
         )
     
     @staticmethod
-    @cached(ttl_seconds=1800)  # Cache for 30 minutes
+    @cached(
+        ttl_seconds=settings.recommendation_cache_ttl_seconds,
+        key_params=("user_id", "category", "limit", "use_ml", "algorithm"),
+        user_param="user_id",
+        daily=True,  # scores use today's logged nutrition
+        clear_on=MEAL_EVENTS,
+        single_flight=True,
+        soft_ttl_seconds=settings.RECOMMENDATION_CACHE_SOFT_TTL_SECONDS,
+        session_factory=SessionLocal
+    )
     def get_recommendations(
         db: Session,
         user_id: int,
         category: Optional[str] = None,
         limit: int = 10,
-        use_ml: bool = True
+        use_ml: bool = True,
+        algorithm: Optional[str] = None
     ) -> List[Dict]:
         """
         Generate personalized meal recommendations using hybrid approach.
@@ -115,6 +216,8 @@ class MLRecommendationService(BaseRecommendationService):
             category: Optional meal category filter
             limit: Number of recommendations to return
             use_ml: Whether to use ML model (default: True)
+            algorithm: Model algorithm, "user_user", "item_item" or "als"
+                (default: settings.ML_CF_ALGORITHM)
         
         Returns:
             List of recommended meals with scores and reasons
@@ -127,30 +230,42 @@ class MLRecommendationService(BaseRecommendationService):
         if not user:
             raise UserNotFoundException(user_id=user_id)
         
-        # Get all meals (or filtered by category)
+        # Candidate meals (or filtered by category) from the shared catalog snapshot;
+        # only the recommended meals are loaded as ORM objects. Dietary restrictions
+        # are a hard filter: candidates come from the cached compliant set for the
+        # preference's bitmask
+        preference = PreferenceRepository.get_by_user_id(db, user_id)
+        required_mask = preference.required_diet_mask() if preference else 0
+        catalog = MealCatalogService.get(db)
         if category:
-            all_meals = MealRepository.get_by_category(db, category)
+            positions = catalog.in_category(category)
+            positions = positions[catalog.satisfies(positions, required_mask)]
         else:
-            all_meals = MealRepository.get_all(db, skip=0, limit=50000)  # Get all
-        
-        if not all_meals:
+            positions = catalog.compliant(required_mask)
+        if not len(positions):
             return []
         
-        meal_ids = [meal.id for meal in all_meals]
+        meal_ids = catalog.ids[positions]
         
         # Try to use ML model
         ml_predictions = {}
         if use_ml:
-            ml_model = MLRecommendationService._load_ml_model()
+            ml_model = MLRecommendationService._load_ml_model(algorithm)
             if ml_model and ml_model.is_trained:
                 try:
                     # Convert user_id to string for ML model lookup
                     user_id_str = str(user_id)
-                    # Get ML recommendations
+                    # Models that support fold-in score unseen users from their in-app ratings
+                    extra_args = {}
+                    if getattr(ml_model, "supports_fold_in", False):
+                        # Same merged meal/recipe ratings the model was trained on
+                        extra_args["user_ratings"] = AppRatingRepository.get_user_ratings(db, user_id)
+                    # Get ML recommendations (all candidates scored in one batched pass)
                     ml_recommendations = ml_model.get_recommendations(
                         user_id_str, 
-                        meal_ids, 
-                        limit=limit * 3  # Get more candidates from ML
+                        meal_ids.tolist(), 
+                        limit=limit * 3,  # Get more candidates from ML
+                        **extra_args
                     )
                     # Convert to dict for easy lookup
                     ml_predictions = {meal_id: score for meal_id, score in ml_recommendations}
@@ -159,47 +274,43 @@ class MLRecommendationService(BaseRecommendationService):
                     logger.warning(f"ML prediction failed: {e}. Falling back to content-based.")
         
         # Get content-based scores
-        preference = PreferenceRepository.get_by_user_id(db, user_id)
         user_meals = UserMealRepository.get_user_meals(db, user_id)
         today_nutrition = UserMealRepository.get_daily_nutrition(db, user_id, date.today())
         
-        # Combine ML and content-based scores
-        scored_meals = []
-        for meal in all_meals:
-            # Content-based score (from existing service)
-            content_score = RecommendationService._calculate_meal_score(
-                meal, user, preference, user_meals, today_nutrition
-            )
-            
-            # Skip if content-based score is 0 (fails dietary restrictions)
-            if content_score == 0:
-                continue
-            
-            # ML prediction score (0-5 rating, normalize to 0-1)
-            ml_score = 0.0
-            if meal.id in ml_predictions:
-                # Normalize ML prediction from 1-5 to 0-1 scale
-                raw_ml_score = ml_predictions[meal.id]
-                # Clamp to [1, 5] range and normalize
-                raw_ml_score = max(1.0, min(5.0, raw_ml_score))
-                ml_score = (raw_ml_score - 1.0) / 4.0
-            
-            # Hybrid score: weighted combination
-            # ML weight: 0.6 (if available), Content weight: 0.4
-            # If ML not available, use content-based only
-            if ml_score > 0:
-                hybrid_score = ml_score * 0.6 + content_score * 0.4
-            else:
-                hybrid_score = content_score
-            
-            scored_meals.append((meal, hybrid_score, ml_score, content_score))
+        # Content-based scores for all candidates in one vectorized pass
+        content_scores = RecommendationService._calculate_meal_scores(
+            catalog, positions, user, preference, user_meals, today_nutrition
+        )
+        
+        # ML prediction score (0-5 rating, clamped to [1, 5] and normalized to 0-1)
+        # for the candidates the model scored
+        ml_scores = np.zeros(len(positions))
+        if ml_predictions:
+            predicted_ids = np.fromiter(ml_predictions.keys(), dtype=np.int64, count=len(ml_predictions))
+            raw_ml_scores = np.fromiter(ml_predictions.values(), dtype=np.float64, count=len(ml_predictions))
+            idx = np.searchsorted(meal_ids, predicted_ids).clip(max=len(meal_ids) - 1)
+            found = meal_ids[idx] == predicted_ids
+            ml_scores[idx[found]] = (np.clip(raw_ml_scores[found], 1.0, 5.0) - 1.0) / 4.0
         
-        # Sort by hybrid score
-        scored_meals.sort(key=lambda x: x[1], reverse=True)
+        # Hybrid score: weighted combination
+        # ML weight: 0.6 (if available), Content weight: 0.4
+        # If ML not available, use content-based only
+        hybrid_scores = np.where(ml_scores > 0, ml_scores * 0.6 + content_scores * 0.4, content_scores)
+        # Meals with a content score of 0 (failing dietary restrictions) are never recommended
+        hybrid_scores[content_scores == 0] = 0.0
         
-        # Get top recommendations
+        # Get top recommendations by hybrid score (partial selection, no full sort)
+        top = top_k_indices(hybrid_scores, limit)
+        top_meals = list(zip(
+            meal_ids[top].tolist(), hybrid_scores[top].tolist(),
+            ml_scores[top].tolist(), content_scores[top].tolist()
+        ))
+        orm_meals = {meal.id: meal for meal in MealRepository.get_by_ids(db, [meal_id for meal_id, *_ in top_meals])}
         recommendations = []
-        for meal, hybrid_score, ml_score, content_score in scored_meals[:limit]:
+        for meal_id, hybrid_score, ml_score, content_score in top_meals:
+            meal = orm_meals.get(meal_id)
+            if meal is None:
+                continue  # Deleted since the catalog snapshot was taken
             # Generate reason
             reason = MLRecommendationService._generate_reason(
                 meal, user, preference, user_meals, hybrid_score, 
@@ -265,31 +376,75 @@ class MLRecommendationService(BaseRecommendationService):
         return "; ".join(reasons)
     
     @staticmethod
-    @cached(ttl_seconds=3600)  # Cache popular meals for 1 hour
-    def get_popular_meals(db: Session, limit: int = 10) -> List[Dict]:
-        """Get popular meals based on ML model popularity scores."""
+    @cached(  # Popular meals are refreshed hourly and served for up to 6 hours
+        ttl_seconds=6 * 3600,
+        key_params=("limit", "category", "diet_flags"),
+        clear_on=MEAL_EVENTS,
+        single_flight=True,
+        soft_ttl_seconds=3600,
+        session_factory=SessionLocal
+    )
+    def get_popular_meals(
+        db: Session,
+        limit: int = 10,
+        category: Optional[str] = None,
+        diet_flags: Optional[List[str]] = None
+    ) -> List[Dict]:
+        """
+        Get popular meals based on ML model popularity scores.
+        
+        Args:
+            db: Database session
+            limit: Number of meals to return
+            category: Only meals of this category
+            diet_flags: Only meals satisfying all of these dietary restrictions
+                (e.g. ["vegan", "gluten_free"])
+        
+        Returns:
+            List of {"meal", "score", "reason"} dicts, most popular first
+        """
+        diet_flags = list(diet_flags or [])
+        filtered = bool(category or diet_flags)
         ml_model = MLRecommendationService._load_ml_model()
         
         if not ml_model or not ml_model.is_trained:
-            # Fallback: get meals by popularity (most in database)
-            meals = MealRepository.get_all(db, skip=0, limit=limit)
+            # Fallback: any meals with the requested category and dietary flags, filtered in SQL
+            meals = MealRepository.get_filtered(
+                db, category, DietaryRestriction.mask_of_values(diet_flags), limit
+            )
             return [{"meal": meal, "score": 1.0, "reason": "Popular meal"} for meal in meals]
         
-        # Sort meals by popularity score
-        meal_popularity = sorted(
-            ml_model.meal_popularity.items(),
-            key=lambda x: x[1],
-            reverse=True
-        )[:limit]
-        
-        popular_meals = []
-        for meal_id, popularity_score in meal_popularity:
-            meal = MealRepository.get_by_id(db, meal_id)
-            if meal:
-                popular_meals.append({
-                    "meal": meal,
-                    "score": round(popularity_score, 3),
-                    "reason": "Popular among all users"
-                })
+        # Walk the presorted ranking in growing windows until `limit` meals are
+        # found: meals deleted since training are skipped, and without facets
+        # the filters are applied to the loaded meals
+        use_facets = not filtered or ml_model.has_popularity_facets
+        facet_filters = {"category": category, "diet_flags": diet_flags} if use_facets else {}
+        scores, meals = {}, []
+        window = limit * 2 if use_facets else limit * 20
+        while len(meals) < limit:
+            ranked = ml_model.top_popular(window, **facet_filters)
+            batch = ranked[len(scores):]
+            scores.update(batch)
+            meals += [
+                meal for meal in MealRepository.get_by_ids(db, [meal_id for meal_id, _ in batch])
+                if use_facets or MLRecommendationService._matches_filters(meal, category, diet_flags)
+            ]
+            if len(ranked) < window:
+                break  # the whole ranking has been seen
+            window *= 2
         
-        return popular_meals
+        return [
+            {
+                "meal": meal,
+                "score": round(scores[meal.id], 3),
+                "reason": "Popular among all users"
+            }
+            for meal in meals[:limit]
+        ]
+    
+    @staticmethod
+    def _matches_filters(meal, category: Optional[str], diet_flags: List[str]) -> bool:
+        """Whether a meal has the category and every dietary flag asked for."""
+        if category and meal.category != category:
+            return False
+        return all(getattr(meal, f"is_{flag}", False) for flag in diet_flags)
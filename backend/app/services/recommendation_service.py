@@ -4,14 +4,18 @@ This module provides the RecommendationService class which handles
 recommendation logic, implementing the IRecommendationEngine interface.
 """
 from typing import List, Dict, Optional
+import numpy as np
 from sqlalchemy.orm import Session
 from app.repositories.meal_repository import MealRepository
 from app.repositories.user_repository import UserRepository
 from app.repositories.preference_repository import PreferenceRepository
 from app.repositories.user_meal_repository import UserMealRepository
 from app.services.nutrition_service import NutritionService
+from app.services.meal_catalog import MealCatalogService
 from app.core.interfaces.base_recommendation import IRecommendationEngine
 from app.exceptions import UserNotFoundException
+from app.enums import DietaryRestriction
+from app.ml.cf_runtime import top_k_indices
 from datetime import date
 from collections import Counter
 
@@ -92,27 +96,27 @@ class RecommendationService(BaseRecommendationService):
         # Get user's meal history
         user_meals = UserMealRepository.get_user_meals(db, user_id)
         
-        # Get all meals
-        all_meals = MealRepository.get_all(db, skip=0, limit=1000)
-        
-        if category:
-            all_meals = [m for m in all_meals if m.category == category]
+        # Get all meals from the shared catalog snapshot
+        catalog = MealCatalogService.get(db)
+        positions = catalog.in_category(category) if category else np.arange(len(catalog))
         
         # Get today's nutrition for scoring
         today_nutrition = UserMealRepository.get_daily_nutrition(db, user_id, date.today())
         
-        # Score each meal
-        scored_meals = []
-        for meal in all_meals:
-            score = RecommendationService.calculate_score(
-                meal, user, preference, user_meals, today_nutrition
-            )
-            scored_meals.append((meal, score))
+        # Score every meal in one vectorized pass
+        scores = RecommendationService._calculate_meal_scores(
+            catalog, positions, user, preference, user_meals, today_nutrition
+        )
         
-        # Sort by score (highest first) and return top recommendations
-        scored_meals.sort(key=lambda x: x[1], reverse=True)
+        # Select the top recommendations (highest first) without sorting every meal
+        top = top_k_indices(scores, limit, positive_only=False)
+        top_meals = list(zip(catalog.ids[positions[top]].tolist(), scores[top].tolist()))
+        orm_meals = {meal.id: meal for meal in MealRepository.get_by_ids(db, [meal_id for meal_id, _ in top_meals])}
         recommendations = []
-        for meal, score in scored_meals[:limit]:
+        for meal_id, score in top_meals:
+            meal = orm_meals.get(meal_id)
+            if meal is None:
+                continue  # Deleted since the catalog snapshot was taken
             reason = RecommendationService._get_recommendation_reason(
                 meal, user, preference, user_meals, score, today_nutrition
             )
@@ -238,6 +242,83 @@ class RecommendationService(BaseRecommendationService):
         
         return round(score, 3)
     
+    @staticmethod
+    def _calculate_meal_scores(
+        catalog,
+        positions: np.ndarray,
+        user,
+        preference: Optional,
+        user_meals: List,
+        today_nutrition: Dict
+    ) -> np.ndarray:
+        """
+        Calculate _calculate_meal_score for many catalog meals at once.
+        
+        Each term is computed for all meals as array operations and added
+        in the same order as in _calculate_meal_score, which stays the
+        reference implementation: every score equals the scalar result
+        exactly. Rounding uses Python's round, since np.round can differ
+        from it at ties.
+        
+        Args:
+            catalog: MealCatalog snapshot
+            positions: Catalog positions of the meals to score
+            user, preference, user_meals, today_nutrition: As for
+                _calculate_meal_score
+        
+        Returns:
+            Scores aligned with positions
+        """
+        calories = catalog.calories[positions]
+        protein = catalog.protein[positions]
+        score = np.zeros(len(positions))
+        
+        # 2. Nutritional fit (how well it fits daily targets)
+        if user.daily_calorie_target:
+            remaining_calories = max(0, user.daily_calorie_target - today_nutrition.get("total_calories", 0))
+            remaining_protein = max(0, (user.daily_protein_target or 0) - today_nutrition.get("total_protein", 0))
+            
+            if remaining_calories > 0:
+                calorie_fit = 1.0 - np.abs(calories - remaining_calories * 0.3) / remaining_calories
+                score += np.clip(calorie_fit, 0, 1) * 0.3
+            
+            if user.goal in ["muscle_gain", "weight_loss"] and remaining_protein > 0:
+                score += np.minimum(1.0, protein / (remaining_protein * 0.4)) * 0.2
+        
+        # 3. Preference similarity (content-based)
+        if preference:
+            if preference.preferred_cuisine:
+                matches = catalog.text_contains(preference.preferred_cuisine.lower())[positions]
+                score += np.where(matches, 0.2, 0.0)
+            
+            if preference.favorite_ingredients:
+                for ingredient in [i.strip().lower() for i in preference.favorite_ingredients.split(",")]:
+                    score += np.where(catalog.text_contains(ingredient)[positions], 0.1, 0.0)
+        
+        # 4. Historical preference (collaborative filtering)
+        if user_meals:
+            liked_categories = {um.meal.category for um in user_meals if um.meal.category}
+            liked_codes = [code for code, category in enumerate(catalog.categories) if category in liked_categories]
+            score += np.where(np.isin(catalog.category_codes[positions], liked_codes), 0.2, 0.0)
+            
+            eaten = np.isin(catalog.ids[positions], [um.meal_id for um in user_meals])
+            score += np.where(eaten, 0.3, 0.0)
+        
+        # 5. Nutritional density bonus
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dense = (calories > 0) & (protein / calories > 0.1)
+        score += np.where(dense, 0.1, 0.0)
+        
+        scores = np.array([round(value, 3) for value in score.tolist()])
+        
+        # 1. Dietary restrictions compliance (hard filter, one AND/compare on the bitmasks)
+        if preference:
+            required_mask = DietaryRestriction.mask_of(preference)
+            if required_mask:
+                scores[~catalog.satisfies(positions, required_mask)] = 0.0
+        
+        return scores
+    
     @staticmethod
     def _get_recommendation_reason(
         meal,
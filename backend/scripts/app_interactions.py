@@ -0,0 +1,128 @@
+"""
+In-app ratings as a training source for the CF model.
+
+Users rate meals in the app through two tables, meal_ratings and
+recipe_ratings. This module streams both from the database with
+server-side cursors (yield_per) and merges them with the offline Food.com
+interactions into one interaction store, which the trainer turns into the
+sparse rating matrix. The rating tables and an offline interaction store
+are copied chunk by chunk, so they can be far larger than RAM; an offline
+JSON file is loaded whole, so convert large datasets to an interaction
+store first (process_full_dataset.py).
+
+User ids: the service looks app users up in the model as str(user.id), so
+Food.com users are written with negated ids (Food.com id 1533 becomes
+user "-1533") and can never collide with an app user.
+"""
+
+import sys
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+import logging
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.repositories.app_rating_repository import AppRatingRepository
+from interaction_store import InteractionWriter, is_interaction_store, read_interactions
+
+logger = logging.getLogger(__name__)
+
+
+def offline_user_ids(user_ids: np.ndarray) -> np.ndarray:
+    """Namespace Food.com user ids away from app user ids (see module docstring)."""
+    return -np.abs(np.asarray(user_ids, dtype=np.int64))
+
+
+def iter_app_ratings(db: Session, chunk_size: int = 10000) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Stream every in-app rating, oldest first, in chunks.
+    
+    The same merged meal_ratings/recipe_ratings view the service uses for
+    fold-in (see AppRatingRepository.iter_ratings).
+    """
+    return AppRatingRepository.iter_ratings(db, chunk_size)
+
+
+def _copy_offline_interactions(source: Path, writer: InteractionWriter, chunk_size: int) -> int:
+    """Append the offline interactions (store or JSON) with namespaced user ids."""
+    if is_interaction_store(source):
+        columns = read_interactions(source)
+        count = len(columns['rating'])
+        for start in range(0, count, chunk_size):
+            stop = start + chunk_size
+            writer.extend(
+                offline_user_ids(columns['user_id'][start:stop]),
+                columns['meal_id'][start:stop],
+                columns['rating'][start:stop]
+            )
+        return count
+    
+    with open(source, 'r') as f:
+        interactions = json.load(f)
+    for interaction in interactions:
+        writer.append(-abs(int(interaction['user_id'])), int(interaction['meal_id']), float(interaction['rating']))
+    return len(interactions)
+
+
+def build_training_store(
+    store_dir: Path,
+    offline_source: Optional[Path] = None,
+    chunk_size: int = 65536
+) -> Tuple[int, int, Optional[datetime]]:
+    """
+    Write the offline and in-app interactions into one interaction store.
+    
+    In-app ratings are all-or-nothing: if the database fails mid-stream,
+    the ratings already copied are dropped again and the store holds the
+    offline interactions only.
+    
+    The database time is read before streaming starts: every rating made
+    before it is in the store, and the API replays the ones made after it
+    onto the trained model (see CollaborativeFilteringModel.ratings_until).
+    
+    Args:
+        store_dir: Interaction store to create (replaced if it exists)
+        offline_source: Food.com interaction store or JSON file (optional)
+        chunk_size: Rows per chunk for both copying and database fetches
+    
+    Returns:
+        (offline interactions written, in-app ratings written,
+         database time the in-app ratings are complete up to or None if they were unavailable)
+    """
+    # Imported here so the module can be used without a configured database
+    from app.repositories.database import SessionLocal
+    
+    offline_count = app_count = 0
+    ratings_until = None
+    with InteractionWriter(store_dir, chunk_size=chunk_size) as writer:
+        if offline_source is not None and Path(offline_source).exists():
+            offline_count = _copy_offline_interactions(Path(offline_source), writer, chunk_size)
+            logger.info(f"Copied {offline_count:,} offline interactions from {offline_source}")
+        
+        db = SessionLocal()
+        offline_end = writer.checkpoint()
+        try:
+            ratings_until = AppRatingRepository.database_time(db)
+            for user_ids, meal_ids, ratings in iter_app_ratings(db, chunk_size):
+                writer.extend(user_ids, meal_ids, ratings)
+                app_count += len(ratings)
+        except Exception as e:
+            dropped = writer.rollback(offline_end)
+            app_count = 0
+            ratings_until = None
+            logger.warning(
+                f"In-app ratings unavailable ({e}); dropped the {dropped:,} already read, "
+                f"training on offline interactions only"
+            )
+        else:
+            logger.info(f"Streamed {app_count:,} in-app ratings from meal_ratings/recipe_ratings")
+        finally:
+            db.close()
+    
+    return offline_count, app_count, ratings_until
@@ -0,0 +1,396 @@
+"""
+Offline evaluation and latency benchmark for the recommendation engines.
+
+Holds out part of every user's interactions, trains the CF models on the
+rest and loads them into a throwaway SQLite database together with the
+meals and users. Each engine then recommends for the evaluated users:
+
+- cf_user_user / cf_item_item / cf_als: the trained models directly
+- content: RecommendationService (content-based scoring)
+- hybrid: MLRecommendationService (CF + content)
+
+and is scored on the held-out ratings (precision@k, recall@k), query
+latency (p50/p95/p99) and peak traced memory. (Parity of the vectorized
+content scorer with the scalar reference is covered by
+tests/test_content_scoring.py.)
+
+Without --interactions a synthetic dataset is generated, so the suite
+runs without the Food.com download. With real interactions the meal
+attributes are still synthetic, so only the CF numbers are meaningful.
+
+Usage:
+    python scripts/benchmark_recommenders.py
+    python scripts/benchmark_recommenders.py --users 5000 --meals 2000 --k 10
+    python scripts/benchmark_recommenders.py --interactions ../models/interactions_full
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+import logging
+
+import numpy as np
+
+# Run against a throwaway database, never the configured one
+os.environ["DATABASE_URL"] = "sqlite://"
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.config import settings
+from app.models.base import Base
+from app.models import User, Meal, Preference, MealRating
+from app.ml.model_registry import ModelRegistry
+from app.services.cache_service import clear_cache
+from app.services.recommendation_service import RecommendationService
+from app.services.ml_recommendation_service import MLRecommendationService, ML_ALGORITHMS
+from interaction_store import is_interaction_store, read_interactions
+from train_ml_model import (
+    CollaborativeFilteringModel,
+    ItemItemCollaborativeFilteringModel,
+    MatrixFactorizationModel,
+)
+
+# Keep training and model-loading logs out of the results table
+logging.getLogger().setLevel(logging.WARNING)
+logger = logging.getLogger(__name__)
+
+CATEGORIES = ["breakfast", "lunch", "dinner", "snack"]
+DIET_FLAGS = ["vegetarian", "vegan", "gluten_free", "dairy_free", "nut_free", "halal", "kosher"]
+GOALS = ["weight_loss", "muscle_gain", "maintenance", "weight_gain"]
+CUISINES = ["italian", "mexican", "thai", "indian", "greek"]
+
+# A held-out rating at or above this counts as relevant
+RELEVANT_RATING = 4.0
+
+
+def generate_synthetic_data(
+    n_users: int = 2000,
+    n_meals: int = 1000,
+    n_clusters: int = 20,
+    ratings_per_user: int = 25,
+    seed: int = 42
+) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+    """
+    Generate meals, users and ratings with taste clusters.
+    
+    Each cluster favours one category and may follow one dietary
+    restriction; its users rate meals from the cluster's pool highly and
+    the occasional random meal lower.
+    
+    Returns:
+        (meals, users, interactions) as lists of dicts
+    """
+    rng = random.Random(seed)
+    # Separate stream so descriptions do not change the rest of the data
+    text_rng = random.Random(seed + 1)
+    
+    meals = []
+    for meal_id in range(1, n_meals + 1):
+        meal = {
+            'id': meal_id,
+            'name': f"Meal {meal_id}",
+            'category': rng.choice(CATEGORIES),
+            'calories': round(rng.uniform(150, 900), 1),
+            'protein': round(rng.uniform(5, 60), 1),
+            'carbohydrates': round(rng.uniform(10, 120), 1),
+            'fat': round(rng.uniform(2, 50), 1),
+            'fiber': round(rng.uniform(0, 15), 1),
+        }
+        meal['description'] = f"{text_rng.choice(CUISINES).title()} {meal['category']} dish"
+        for flag in DIET_FLAGS:
+            meal[f'is_{flag}'] = rng.random() < 0.4
+        meals.append(meal)
+    
+    clusters = []
+    for _ in range(n_clusters):
+        category = rng.choice(CATEGORIES)
+        restriction = rng.choice(DIET_FLAGS) if rng.random() < 0.3 else None
+        pool = [
+            meal['id'] for meal in meals
+            if meal['category'] == category and (restriction is None or meal[f'is_{restriction}'])
+        ]
+        clusters.append((restriction, pool or [meal['id'] for meal in meals]))
+    
+    users, interactions = [], []
+    for user_id in range(1, n_users + 1):
+        restriction, pool = clusters[rng.randrange(n_clusters)]
+        users.append({
+            'id': user_id,
+            'restriction': restriction,
+            'goal': rng.choice(GOALS),
+            'daily_calorie_target': rng.choice([1800.0, 2200.0, 2600.0]),
+            'daily_protein_target': rng.choice([90.0, 120.0, 150.0]),
+        })
+        rated = set()
+        for _ in range(ratings_per_user):
+            if rng.random() < 0.8:
+                meal_id, rating = rng.choice(pool), rng.choice([4.0, 5.0, 5.0, 3.0])
+            else:
+                meal_id, rating = rng.randint(1, n_meals), rng.choice([1.0, 2.0, 3.0])
+            if meal_id not in rated:
+                rated.add(meal_id)
+                interactions.append({'user_id': user_id, 'meal_id': meal_id, 'rating': rating})
+    
+    return meals, users, interactions
+
+
+def load_interactions(path: Path) -> List[Dict]:
+    """Read a JSON interactions file or columnar interaction store."""
+    if is_interaction_store(path):
+        columns = read_interactions(path)
+        return [
+            {'user_id': int(user_id), 'meal_id': int(meal_id), 'rating': float(rating)}
+            for user_id, meal_id, rating in zip(columns['user_id'], columns['meal_id'], columns['rating'])
+        ]
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def split_holdout(
+    interactions: List[Dict],
+    holdout_fraction: float = 0.2,
+    seed: int = 42
+) -> Tuple[List[Dict], Dict[int, Dict[int, float]]]:
+    """
+    Hold out a fraction of each user's interactions.
+    
+    Users with fewer than 2 interactions are kept entirely in training.
+    
+    Returns:
+        (training interactions, {user_id: {meal_id: rating}} held out)
+    """
+    rng = random.Random(seed)
+    by_user: Dict[int, List[Dict]] = {}
+    for interaction in interactions:
+        by_user.setdefault(int(interaction['user_id']), []).append(interaction)
+    
+    train, held_out = [], {}
+    for user_id, rows in by_user.items():
+        rng.shuffle(rows)
+        n_held = int(len(rows) * holdout_fraction) if len(rows) >= 2 else 0
+        held_out_rows, train_rows = rows[:n_held], rows[n_held:]
+        train.extend(train_rows)
+        if held_out_rows:
+            held_out[user_id] = {int(r['meal_id']): float(r['rating']) for r in held_out_rows}
+    return train, held_out
+
+
+def build_database(meals: List[Dict], users: List[Dict], train: List[Dict]):
+    """Create an in-memory SQLite database holding meals, users, preferences and training ratings."""
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    
+    session.add_all(Meal(**meal) for meal in meals)
+    for user in users:
+        session.add(User(
+            id=user['id'],
+            email=f"user{user['id']}@example.com",
+            username=f"user{user['id']}",
+            first_name="Bench",
+            last_name=str(user['id']),
+            goal=user['goal'],
+            daily_calorie_target=user['daily_calorie_target'],
+            daily_protein_target=user['daily_protein_target'],
+        ))
+        restriction = user.get('restriction')
+        session.add(Preference(user_id=user['id'], **({restriction: True} if restriction else {})))
+    session.flush()
+    session.add_all(
+        MealRating(user_id=int(r['user_id']), meal_id=int(r['meal_id']), rating=float(r['rating']))
+        for r in train
+    )
+    session.commit()
+    return session
+
+
+def ranking_metrics(recommended: List[int], relevant: set, k: int) -> Tuple[float, float]:
+    """precision@k and recall@k of one ranked list."""
+    hits = len(set(recommended[:k]) & relevant)
+    return hits / k, hits / len(relevant)
+
+
+def percentile_ms(timings: List[float], q: float) -> float:
+    return float(np.percentile(timings, q) * 1000) if timings else 0.0
+
+
+def evaluate_engine(
+    recommend: Callable[[int, int], List[int]],
+    held_out: Dict[int, Dict[int, float]],
+    train_items: Dict[int, set],
+    k: int,
+    memory_sample: int = 50
+) -> Dict:
+    """
+    Score one engine on the held-out ratings.
+    
+    Already-rated training meals are dropped from each ranked list
+    before it is cut to k. Latency is measured without tracing; peak
+    memory is measured in a second, traced pass over a sample of users.
+    
+    Args:
+        recommend: recommend(user_id, limit) -> ranked meal ids
+    """
+    precisions, recalls, timings = [], [], []
+    for user_id, ratings in held_out.items():
+        relevant = {meal_id for meal_id, rating in ratings.items() if rating >= RELEVANT_RATING}
+        if not relevant:
+            continue
+        seen = train_items.get(user_id, set())
+        
+        start = time.perf_counter()
+        ranked = recommend(user_id, k + len(seen))
+        timings.append(time.perf_counter() - start)
+        
+        ranked = [meal_id for meal_id in ranked if meal_id not in seen]
+        precision, recall = ranking_metrics(ranked, relevant, k)
+        precisions.append(precision)
+        recalls.append(recall)
+    
+    tracemalloc.start()
+    for user_id in list(held_out)[:memory_sample]:
+        recommend(user_id, k + len(train_items.get(user_id, set())))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    return {
+        'users': len(precisions),
+        'precision': float(np.mean(precisions)) if precisions else 0.0,
+        'recall': float(np.mean(recalls)) if recalls else 0.0,
+        'p50': percentile_ms(timings, 50),
+        'p95': percentile_ms(timings, 95),
+        'p99': percentile_ms(timings, 99),
+        'peak_mb': peak / 1024 / 1024,
+    }
+
+
+def train_models(train: List[Dict], model_dir: Path) -> Dict[str, Tuple[object, Path]]:
+    """Train every CF algorithm on the training split and save each artifact."""
+    interactions_file = model_dir / "interactions_train.json"
+    with open(interactions_file, 'w') as f:
+        json.dump(train, f)
+    
+    trained = {}
+    for algorithm, model_class, artifact in (
+        ("user_user", CollaborativeFilteringModel, "collaborative_filtering_model"),
+        ("item_item", ItemItemCollaborativeFilteringModel, "item_item_cf_model"),
+        ("als", MatrixFactorizationModel, "matrix_factorization_model.npz"),
+    ):
+        start = time.perf_counter()
+        model = model_class()
+        model.train(interactions_file)
+        path = model_dir / artifact
+        if hasattr(model, 'save_bundle'):
+            model.save_bundle(path)
+        else:
+            model.save(path)
+        print(f"Trained {algorithm} in {time.perf_counter() - start:.2f}s")
+        trained[algorithm] = (model, path)
+    return trained
+
+
+def build_engines(db, trained: Dict, all_meal_ids: List[int], hybrid_algorithm: str) -> Dict[str, Callable]:
+    """recommend(user_id, limit) callables for every engine."""
+    engines = {}
+    for algorithm, (model, _) in trained.items():
+        engines[f"cf_{algorithm}"] = (
+            lambda user_id, limit, model=model: [
+                meal_id for meal_id, _ in model.get_recommendations(str(user_id), all_meal_ids, limit)
+            ]
+        )
+    
+    engines["content"] = lambda user_id, limit: [
+        rec["meal"].id for rec in RecommendationService.get_recommendations(db, user_id, limit=limit)
+    ]
+    
+    # Serve the freshly trained artifacts through the real registry/load path
+    MLRecommendationService._registry = ModelRegistry(
+        {algorithm: (ML_ALGORITHMS[algorithm][0], (path,)) for algorithm, (_, path) in trained.items()},
+        on_load=MLRecommendationService._on_model_loaded
+    )
+    
+    def hybrid(user_id: int, limit: int) -> List[int]:
+        clear_cache()  # measure uncached requests
+        recommendations = MLRecommendationService.get_recommendations(
+            db, user_id, limit=limit, algorithm=hybrid_algorithm
+        )
+        return [rec["meal"].id for rec in recommendations]
+    
+    engines["hybrid"] = hybrid
+    return engines
+
+
+def main():
+    """Run the benchmark and print one row per engine."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--interactions", type=Path, help="JSON interactions file or interaction store")
+    parser.add_argument("--users", type=int, default=2000, help="Synthetic users")
+    parser.add_argument("--meals", type=int, default=1000, help="Synthetic meals")
+    parser.add_argument("--k", type=int, default=10, help="Cut-off for precision/recall")
+    parser.add_argument("--holdout", type=float, default=0.2, help="Fraction of each user's ratings held out")
+    parser.add_argument("--eval-users", type=int, default=300, help="Users evaluated per engine")
+    parser.add_argument("--engines", default="cf_user_user,cf_item_item,cf_als,content,hybrid")
+    parser.add_argument("--hybrid-algorithm", default="user_user", choices=sorted(ML_ALGORITHMS))
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    
+    settings.ML_ONLINE_UPDATES = False
+    
+    if args.interactions:
+        interactions = load_interactions(args.interactions)
+        meal_ids = sorted({int(r['meal_id']) for r in interactions})
+        user_ids = sorted({int(r['user_id']) for r in interactions})
+        synthetic_meals, synthetic_users, _ = generate_synthetic_data(
+            n_users=len(user_ids), n_meals=len(meal_ids), seed=args.seed
+        )
+        meals = [dict(meal, id=meal_id, name=f"Meal {meal_id}") for meal, meal_id in zip(synthetic_meals, meal_ids)]
+        users = [dict(user, id=user_id) for user, user_id in zip(synthetic_users, user_ids)]
+    else:
+        meals, users, interactions = generate_synthetic_data(
+            n_users=args.users, n_meals=args.meals, seed=args.seed
+        )
+    print(f"Dataset: {len(users):,} users, {len(meals):,} meals, {len(interactions):,} ratings")
+    
+    train, held_out = split_holdout(interactions, args.holdout, args.seed)
+    held_out = dict(list(held_out.items())[:args.eval_users])
+    train_items: Dict[int, set] = {}
+    for r in train:
+        train_items.setdefault(int(r['user_id']), set()).add(int(r['meal_id']))
+    
+    db = build_database(meals, users, train)
+    all_meal_ids = [meal['id'] for meal in meals]
+    
+    with tempfile.TemporaryDirectory() as model_dir:
+        trained = train_models(train, Path(model_dir))
+        engines = build_engines(db, trained, all_meal_ids, args.hybrid_algorithm)
+        
+        k = args.k
+        print(f"\n{'engine':<16}{'users':>7}{f'P@{k}':>9}{f'R@{k}':>9}"
+              f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak MB':>10}")
+        for name in args.engines.split(","):
+            if name not in engines:
+                print(f"{name:<16} unknown engine (choose from {', '.join(engines)})")
+                continue
+            result = evaluate_engine(engines[name], held_out, train_items, k)
+            print(f"{name:<16}{result['users']:>7}{result['precision']:>9.4f}{result['recall']:>9.4f}"
+                  f"{result['p50']:>10.2f}{result['p95']:>10.2f}{result['p99']:>10.2f}{result['peak_mb']:>10.2f}")
+    
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
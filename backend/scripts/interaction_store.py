@@ -0,0 +1,218 @@
+"""
+Streaming, columnar storage for rating interactions.
+
+An interaction store is a directory holding one raw little-endian array
+file per column (user ids, meal ids, ratings) plus a manifest. Writers
+append fixed-size chunks, so building a store from the Food.com CSV never
+holds more than one chunk in memory; readers memory-map the columns and
+the training code turns them straight into the CSR rating matrix.
+"""
+
+import os
+import sys
+import json
+import shutil
+from pathlib import Path
+from typing import Dict, Tuple
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.ml.cf_runtime import SparseRatingMatrix
+
+STORE_FORMAT = "interactions"
+STORE_VERSION = 1
+STORE_MANIFEST = "manifest.json"
+
+# Column name -> on-disk dtype
+COLUMNS = {
+    'user_id': np.dtype('<i8'),
+    'meal_id': np.dtype('<i8'),
+    'rating': np.dtype('<f4'),
+}
+
+
+def is_interaction_store(path: Path) -> bool:
+    """Whether path is an interaction store directory."""
+    return (Path(path) / STORE_MANIFEST).is_file()
+
+
+class InteractionWriter:
+    """
+    Append interactions to a store in fixed-size chunks.
+    
+    Use as a context manager; the store is written next to the target and
+    renamed into place on a clean exit, so readers never see a partial store.
+    
+    Example:
+        with InteractionWriter(MODELS_DIR / "interactions_full") as writer:
+            writer.append(user_id, meal_id, rating)
+    """
+    
+    def __init__(self, store_dir: Path, chunk_size: int = 65536):
+        self.store_dir = Path(store_dir)
+        self.chunk_size = chunk_size
+        self.count = 0
+        self._tmp_dir = self.store_dir.with_name(f"{self.store_dir.name}.tmp-{os.getpid()}")
+        self._buffers = {name: np.empty(chunk_size, dtype=dtype) for name, dtype in COLUMNS.items()}
+        self._buffered = 0
+        self._files = {}
+    
+    def __enter__(self) -> "InteractionWriter":
+        if self._tmp_dir.exists():
+            shutil.rmtree(self._tmp_dir)
+        self._tmp_dir.mkdir(parents=True)
+        self._files = {name: open(self._tmp_dir / f"{name}.bin", 'wb') for name in COLUMNS}
+        return self
+    
+    def append(self, user_id: int, meal_id: int, rating: float) -> None:
+        """Buffer one interaction, flushing the chunk when it is full."""
+        row = self._buffered
+        self._buffers['user_id'][row] = user_id
+        self._buffers['meal_id'][row] = meal_id
+        self._buffers['rating'][row] = rating
+        self._buffered += 1
+        if self._buffered == self.chunk_size:
+            self._flush()
+    
+    def extend(self, user_ids: np.ndarray, meal_ids: np.ndarray, ratings: np.ndarray) -> None:
+        """Append columns of interactions, a chunk at a time."""
+        for start in range(0, len(ratings), self.chunk_size):
+            stop = start + self.chunk_size
+            self._flush()
+            n = len(ratings[start:stop])
+            self._buffers['user_id'][:n] = user_ids[start:stop]
+            self._buffers['meal_id'][:n] = meal_ids[start:stop]
+            self._buffers['rating'][:n] = ratings[start:stop]
+            self._buffered = n
+        if self._buffered == self.chunk_size:
+            self._flush()
+    
+    def _flush(self) -> None:
+        """Append the buffered chunk to every column file."""
+        for name, buffer in self._buffers.items():
+            buffer[:self._buffered].tofile(self._files[name])
+        self.count += self._buffered
+        self._buffered = 0
+    
+    def checkpoint(self) -> int:
+        """Flush buffered interactions and return the count written so far (see rollback)."""
+        self._flush()
+        return self.count
+    
+    def rollback(self, checkpoint: int) -> int:
+        """
+        Drop every interaction appended after a checkpoint.
+        
+        Args:
+            checkpoint: Value returned by checkpoint()
+        
+        Returns:
+            Number of interactions dropped
+        """
+        self._buffered = 0
+        for name, f in self._files.items():
+            f.flush()
+            f.truncate(checkpoint * COLUMNS[name].itemsize)
+            f.seek(0, os.SEEK_END)
+        dropped, self.count = self.count - checkpoint, checkpoint
+        return dropped
+    
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self._flush()
+        for f in self._files.values():
+            f.close()
+        
+        if exc_type is not None:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+            return
+        
+        manifest = {
+            'format': STORE_FORMAT,
+            'version': STORE_VERSION,
+            'count': self.count,
+            'columns': {name: dtype.str for name, dtype in COLUMNS.items()},
+        }
+        with open(self._tmp_dir / STORE_MANIFEST, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        
+        if self.store_dir.exists():
+            shutil.rmtree(self.store_dir)
+        self._tmp_dir.rename(self.store_dir)
+
+
+def read_interactions(store_dir: Path) -> Dict[str, np.ndarray]:
+    """
+    Memory-map the columns of an interaction store.
+    
+    Returns:
+        {column name: read-only array}, all of the same length
+    """
+    store_dir = Path(store_dir)
+    with open(store_dir / STORE_MANIFEST, 'r') as f:
+        manifest = json.load(f)
+    
+    if manifest.get('format') != STORE_FORMAT:
+        raise ValueError(f"{store_dir} is not an {STORE_FORMAT} store")
+    if manifest.get('version') != STORE_VERSION:
+        raise ValueError(
+            f"Unsupported interaction store version {manifest.get('version')} "
+            f"(this code reads version {STORE_VERSION})"
+        )
+    
+    count = manifest['count']
+    columns = {}
+    for name, dtype in manifest['columns'].items():
+        if count == 0:
+            columns[name] = np.empty(0, dtype=dtype)
+        else:
+            columns[name] = np.memmap(store_dir / f"{name}.bin", dtype=dtype, mode='r', shape=(count,))
+    return columns
+
+
+def interactions_to_matrix(
+    user_ids: np.ndarray,
+    meal_ids: np.ndarray,
+    ratings: np.ndarray
+) -> SparseRatingMatrix:
+    """
+    Build the CSR rating matrix from interaction columns.
+    
+    Matches the dict loader: user ids become strings (interned in sorted
+    string order) and a repeated (user, meal) pair keeps its last rating.
+    """
+    numeric_users, user_rows = np.unique(user_ids, return_inverse=True)
+    user_labels = numeric_users.astype(str)
+    label_order = np.argsort(user_labels, kind='stable')
+    rank = np.empty(len(label_order), dtype=np.int64)
+    rank[label_order] = np.arange(len(label_order))
+    rows = rank[user_rows]
+    del user_rows
+    
+    interned_meals, cols = np.unique(meal_ids, return_inverse=True)
+    
+    # Keep the last occurrence of each (user, meal) pair
+    keys = rows * len(interned_meals) + cols
+    _, last_from_end = np.unique(keys[::-1], return_index=True)
+    keep = np.sort(len(keys) - 1 - last_from_end)
+    del keys
+    
+    return SparseRatingMatrix.from_coo(
+        user_labels[label_order], interned_meals.astype(np.int64),
+        rows[keep], cols[keep], np.asarray(ratings)[keep]
+    )
+
+
+def load_interaction_matrix(store_dir: Path) -> Tuple[SparseRatingMatrix, int]:
+    """
+    Load an interaction store as a CSR rating matrix.
+    
+    Returns:
+        (matrix, number of interactions read)
+    """
+    columns = read_interactions(store_dir)
+    matrix = interactions_to_matrix(columns['user_id'], columns['meal_id'], columns['rating'])
+    return matrix, len(columns['rating'])
@@ -2,19 +2,22 @@
 Retrain ML model with full interactions data.
 """
 
+import os
 import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
 import json
 import csv
-from collections import defaultdict
-from typing import Dict, List
+from typing import Dict
 import logging
 
 from app.repositories.database import SessionLocal
 from app.models.meal import Meal
-from train_ml_model import CollaborativeFilteringModel
+from app.ml.model_registry import next_version_path
+from interaction_store import InteractionWriter
+from app_interactions import build_training_store
+from train_ml_model import CollaborativeFilteringModel, load_meal_facets
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -33,8 +36,16 @@ def load_recipe_mappings():
         return json.load(f)
 
 
-def process_full_interactions(recipe_mappings: Dict, limit: int = 500000):
-    """Process full interactions file."""
+def process_full_interactions(recipe_mappings: Dict, store_dir: Path, limit: int = 500000) -> int:
+    """
+    Stream the full interactions CSV into a columnar interaction store.
+    
+    Rows are appended to the store in chunks as they are read, so memory
+    stays flat however many interactions are processed.
+    
+    Returns:
+        Number of interactions written
+    """
     logger.info("=" * 70)
     logger.info("Processing Full Interactions Dataset")
     logger.info("=" * 70)
@@ -43,11 +54,10 @@ def process_full_interactions(recipe_mappings: Dict, limit: int = 500000):
     
     if not interactions_file.exists():
         logger.error(f"Interactions file not found: {interactions_file}")
-        return []
+        return 0
     
     logger.info(f"Processing up to {limit:,} interactions...")
     
-    interactions = []
     processed = 0
     mapped = 0
     
@@ -59,7 +69,7 @@ def process_full_interactions(recipe_mappings: Dict, limit: int = 500000):
     finally:
         db.close()
     
-    with open(interactions_file, 'r', encoding='utf-8') as f:
+    with open(interactions_file, 'r', encoding='utf-8') as f, InteractionWriter(store_dir) as writer:
         reader = csv.DictReader(f)
         for idx, row in enumerate(reader):
             if idx >= limit:
@@ -83,16 +93,11 @@ def process_full_interactions(recipe_mappings: Dict, limit: int = 500000):
                 rating_val = float(rating) if rating else 0
                 if rating_val < 1 or rating_val > 5:
                     continue
+                user_id = int(user_id)
             except:
                 continue
             
-            interactions.append({
-                'user_id': user_id,
-                'recipe_id': recipe_id,
-                'meal_id': meal_id,
-                'rating': rating_val,
-                'date': row.get('date', '')
-            })
+            writer.append(user_id, meal_id, rating_val)
             
             mapped += 1
             
@@ -104,7 +109,7 @@ def process_full_interactions(recipe_mappings: Dict, limit: int = 500000):
     logger.info(f"\n✅ Processed {processed:,} interactions")
     logger.info(f"✅ Successfully mapped {mapped:,} interactions")
     
-    return interactions
+    return mapped
 
 
 def main():
@@ -117,18 +122,20 @@ def main():
     recipe_mappings = load_recipe_mappings()
     logger.info(f"Loaded {len(recipe_mappings):,} recipe mappings")
     
-    # Process full interactions
-    interactions = process_full_interactions(recipe_mappings, limit=500000)
+    # Stream full interactions into the columnar store
+    interactions_file = MODELS_DIR / "interactions_full"
+    count = process_full_interactions(recipe_mappings, interactions_file, limit=500000)
     
-    if not interactions:
+    if not count:
         logger.error("No interactions processed. Exiting.")
         return
     
-    # Save interactions
-    interactions_file = MODELS_DIR / "interactions_full.json"
-    with open(interactions_file, 'w') as f:
-        json.dump(interactions, f)
-    logger.info(f"💾 Saved {len(interactions):,} interactions to: {interactions_file}")
+    logger.info(f"💾 Saved {count:,} interactions to: {interactions_file}")
+    
+    # Merge in the ratings users gave in the app
+    training_file = MODELS_DIR / "interactions_training"
+    _, app_count, ratings_until = build_training_store(training_file, interactions_file)
+    logger.info(f"💾 Merged {app_count:,} in-app ratings into: {training_file}")
     
     # Train model
     logger.info("\n" + "=" * 70)
@@ -136,19 +143,20 @@ def main():
     logger.info("=" * 70)
     
     model = CollaborativeFilteringModel()
-    model.train(interactions_file)
+    model.train(training_file, workers=os.cpu_count() or 1, meal_facets=load_meal_facets())
     
-    # Save model
-    model_file = MODELS_DIR / "collaborative_filtering_model.pkl"
-    model.save(model_file)
+    # Publish as the next memory-mappable bundle version
+    model_file = next_version_path(MODELS_DIR / "collaborative_filtering_model")
+    model.ratings_until = ratings_until
+    model.save_bundle(model_file)
     
     logger.info("\n" + "=" * 70)
     logger.info("✅ Model Retraining Complete!")
     logger.info("=" * 70)
     logger.info(f"💾 Model saved to: {model_file}")
     logger.info(f"📊 Model statistics:")
-    logger.info(f"  - Users in model: {len(model.user_ratings):,}")
-    logger.info(f"  - Meals in model: {len(model.meal_ratings):,}")
+    logger.info(f"  - Users in model: {model.n_users:,}")
+    logger.info(f"  - Meals in model: {model.n_meals:,}")
     logger.info(f"  - Popularity scores: {len(model.meal_popularity):,}")
     logger.info("\n" + "=" * 70)
 
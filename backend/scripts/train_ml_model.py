@@ -1,19 +1,31 @@
 """
 Train ML-based recommendation model using collaborative filtering.
+
+The model data structures and prediction code live in app/ml/cf_runtime.py;
+this script adds the training stages on top of them.
 """
 
 import os
 import sys
 import json
-import pickle
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 import logging
-from collections import defaultdict
+
+import numpy as np
 
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent.parent))
 
+from app.enums import DietaryRestriction
+from app.ml import cf_runtime
+from app.ml.cf_runtime import SparseRatingMatrix, NeighbourTable, RandomProjectionLSH, top_k_indices
+from app.ml.model_registry import next_version_path
+from interaction_store import is_interaction_store, load_interaction_matrix
+from app_interactions import build_training_store
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
@@ -21,23 +33,187 @@ MODELS_DIR = Path(__file__).parent.parent.parent / "models"
 MODELS_DIR.mkdir(exist_ok=True)
 
 
-class CollaborativeFilteringModel:
+def compute_top_k_neighbours(
+    matrix: SparseRatingMatrix,
+    axis: str,
+    k: int,
+    start: int = 0,
+    stop: Optional[int] = None
+) -> Tuple[np.ndarray, np.ndarray]:
     """
-    Simple collaborative filtering recommendation model.
-    Uses user-item interaction matrix with cosine similarity.
+    Top-k most similar rows for rows [start, stop) of one axis.
+    
+    Args:
+        matrix: Rating matrix
+        axis: "users" or "meals"
+        k: Neighbours to keep per row
+        start, stop: Row range (defaults to every row)
+    
+    Returns:
+        (neighbours, similarities) arrays of shape (stop - start, k);
+        rows with fewer than k neighbours are padded with -1 / 0.0
     """
+    if axis == "users":
+        n_rows, similarity_fn = matrix.n_users, matrix.user_similarities
+    elif axis == "meals":
+        n_rows, similarity_fn = matrix.n_meals, matrix.meal_similarities
+    else:
+        raise ValueError(f"Unknown axis '{axis}'. Expected 'users' or 'meals'")
+    
+    stop = n_rows if stop is None else stop
+    neighbours = np.full((stop - start, k), -1, dtype=np.int32)
+    similarities = np.zeros((stop - start, k), dtype=np.float32)
     
-    def __init__(self):
-        self.user_ratings = defaultdict(dict)  # {user_id: {meal_id: rating}}
-        self.meal_ratings = defaultdict(dict)  # {meal_id: {user_id: rating}}
-        self.user_similarities = {}  # Cached user similarities
-        self.meal_popularity = {}  # Meal popularity scores
-        self.is_trained = False
+    for row in range(start, stop):
+        scores = similarity_fn(row)
+        top = top_k_indices(scores, k)
+        neighbours[row - start, :len(top)] = top
+        similarities[row - start, :len(top)] = scores[top]
+    
+    return neighbours, similarities
+
+
+# Rating matrix attached from shared memory in each similarity worker
+_worker_matrix: Optional[SparseRatingMatrix] = None
+_worker_segments: List[shared_memory.SharedMemory] = []
+
+
+def _share_arrays(arrays: Dict[str, np.ndarray]) -> Tuple[List[shared_memory.SharedMemory], List[Tuple]]:
+    """
+    Copy arrays into shared memory segments.
+    
+    Returns:
+        (segments, specs) where specs are (name, segment name, dtype, shape)
+        tuples a worker uses to attach to the same memory
+    """
+    segments, specs = [], []
+    try:
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            segments.append(segment)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)[...] = array
+            specs.append((name, segment.name, array.dtype.str, array.shape))
+    except Exception:
+        _release_segments(segments)
+        raise
+    return segments, specs
+
+
+def _release_segments(segments: List[shared_memory.SharedMemory]) -> None:
+    """Close and remove shared memory segments created by _share_arrays."""
+    for segment in segments:
+        segment.close()
+        segment.unlink()
+
+
+def _attach_worker_matrix(specs: List[Tuple]) -> None:
+    """Process pool initializer: rebuild the rating matrix over shared memory."""
+    global _worker_matrix
+    arrays = {}
+    for name, segment_name, dtype, shape in specs:
+        segment = shared_memory.SharedMemory(name=segment_name)
+        _worker_segments.append(segment)
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+    _worker_matrix = SparseRatingMatrix.from_arrays(arrays)
+
+
+def _neighbour_block(axis: str, k: int, start: int, stop: int) -> Tuple[int, np.ndarray, np.ndarray]:
+    """Worker task: top-k neighbours for one row block of the shared matrix."""
+    neighbours, similarities = compute_top_k_neighbours(_worker_matrix, axis, k, start, stop)
+    return start, neighbours, similarities
+
+
+def compute_top_k_neighbours_parallel(
+    matrix: SparseRatingMatrix,
+    axis: str,
+    k: int,
+    workers: int,
+    block_size: int = 2048
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    compute_top_k_neighbours split into row blocks across a process pool.
+    
+    The matrix is copied once into shared memory and every worker maps the
+    same segments, so it is not pickled per task. Each block returns its
+    rows' top-k lists, which are written into the full table at the
+    block's offset. Results are identical to the single-process version.
+    
+    Args:
+        matrix: Rating matrix
+        axis: "users" or "meals"
+        k: Neighbours to keep per row
+        workers: Worker processes (1 runs in-process)
+        block_size: Rows per task
+    
+    Returns:
+        (neighbours, similarities) arrays, as compute_top_k_neighbours
+    """
+    n_rows = matrix.n_users if axis == "users" else matrix.n_meals
+    if workers <= 1 or n_rows <= block_size:
+        return compute_top_k_neighbours(matrix, axis, k)
+    
+    neighbours = np.full((n_rows, k), -1, dtype=np.int32)
+    similarities = np.zeros((n_rows, k), dtype=np.float32)
+    blocks = [(start, min(start + block_size, n_rows)) for start in range(0, n_rows, block_size)]
+    
+    segments, specs = _share_arrays(matrix.to_arrays())
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_attach_worker_matrix, initargs=(specs,)
+        ) as executor:
+            futures = [executor.submit(_neighbour_block, axis, k, start, stop) for start, stop in blocks]
+            for done, future in enumerate(as_completed(futures), 1):
+                start, block_neighbours, block_similarities = future.result()
+                neighbours[start:start + len(block_neighbours)] = block_neighbours
+                similarities[start:start + len(block_similarities)] = block_similarities
+                if done % 50 == 0 or done == len(blocks):
+                    logger.info(f"  {axis}: {done}/{len(blocks)} blocks done")
+    finally:
+        _release_segments(segments)
+    
+    return neighbours, similarities
+
+
+def load_meal_facets() -> Optional[Dict[int, Dict]]:
+    """
+    Category and dietary flags of every meal in the database.
+    
+    Used to break the popularity ranking down by category and diet.
+    
+    Returns:
+        {meal_id: {"category": str, <restriction>: bool}}, or None when the
+        database is unreachable
+    """
+    flags = DietaryRestriction.list()
+    try:
+        from app.repositories.database import SessionLocal
+        from app.models.meal import Meal
+        
+        db = SessionLocal()
+        try:
+            columns = [Meal.id, Meal.category] + [getattr(Meal, f"is_{flag}") for flag in flags]
+            return {
+                row[0]: dict(zip(['category'] + flags, row[1:]))
+                for row in db.query(*columns).all()
+            }
+        finally:
+            db.close()
+    except Exception as e:
+        logger.warning(f"Meal facets unavailable ({e}); popularity ranking will not be faceted")
+        return None
+
+
+class CollaborativeFilteringTrainingMixin:
+    """Training stages shared by the user-user and item-item CF models."""
     
     def load_interactions(self, interactions_file: Path):
-        """Load interactions data."""
+        """Load interactions data (JSON list or columnar interaction store)."""
         logger.info(f"Loading interactions from: {interactions_file}")
         
+        if is_interaction_store(interactions_file):
+            return self.load_interaction_store(interactions_file)
+        
         with open(interactions_file, 'r') as f:
             interactions = json.load(f)
         
@@ -56,10 +232,46 @@ class CollaborativeFilteringModel:
         
         return len(interactions)
     
+    def load_interaction_store(self, store_dir: Path):
+        """
+        Load a columnar interaction store straight into the CSR matrix.
+        
+        No per-interaction Python objects are created, so memory stays
+        proportional to the typed arrays. The dict engine still gets its
+        nested dicts, filled from the matrix.
+        """
+        self.matrix, count = load_interaction_matrix(store_dir)
+        self._meal_totals = None
+        logger.info(f"Loaded {count:,} interactions")
+        
+        if self.engine == "dict":
+            for user_id in self.matrix.user_ids.tolist():
+                for meal_id, rating in self.matrix.ratings_of(user_id).items():
+                    self.user_ratings[user_id][meal_id] = rating
+                    self.meal_ratings[meal_id][user_id] = rating
+            self.matrix = None
+        
+        logger.info(f"Users: {self.n_users:,}")
+        logger.info(f"Meals with ratings: {self.n_meals:,}")
+        
+        return count
+    
     def calculate_popularity_scores(self):
         """Calculate popularity scores for meals."""
         logger.info("Calculating meal popularity scores...")
         
+        if self.matrix is not None and not self.meal_ratings:
+            # Loaded from an interaction store: compute from the meal-major CSR
+            counts = np.diff(self.matrix.meal_indptr)
+            meal_rows = np.repeat(np.arange(self.matrix.n_meals), counts)
+            totals = np.bincount(meal_rows, weights=self.matrix.meal_data, minlength=self.matrix.n_meals)
+            self.popularity_scores = (totals / counts) * np.log(counts + 1)
+            self.meal_popularity = dict(zip(
+                self.matrix.meal_ids.tolist(), self.popularity_scores.tolist()
+            ))
+            logger.info(f"Calculated popularity for {len(self.meal_popularity):,} meals")
+            return
+        
         for meal_id, ratings in self.meal_ratings.items():
             if ratings:
                 # Average rating weighted by number of ratings
@@ -72,106 +284,67 @@ class CollaborativeFilteringModel:
         
         logger.info(f"Calculated popularity for {len(self.meal_popularity):,} meals")
     
-    def cosine_similarity(self, user1_ratings: Dict, user2_ratings: Dict) -> float:
-        """Calculate cosine similarity between two users."""
-        # Get common meals
-        common_meals = set(user1_ratings.keys()) & set(user2_ratings.keys())
-        
-        if not common_meals:
-            return 0.0
-        
-        # Calculate dot product and magnitudes
-        dot_product = sum(user1_ratings[meal] * user2_ratings[meal] for meal in common_meals)
-        mag1 = sum(r ** 2 for r in user1_ratings.values()) ** 0.5
-        mag2 = sum(r ** 2 for r in user2_ratings.values()) ** 0.5
+    def build_neighbour_index(self, k: int = 50, workers: int = 1):
+        """
+        Precompute every user's and every meal's top-k neighbours.
         
-        if mag1 == 0 or mag2 == 0:
-            return 0.0
+        Ratings only change when the model is retrained, so neighbour
+        search is done once here and serving only looks the lists up.
         
-        return dot_product / (mag1 * mag2)
-    
-    def find_similar_users(self, user_id: str, k: int = 50) -> List[Tuple[str, float]]:
-        """Find k most similar users to given user."""
-        if user_id not in self.user_ratings:
-            return []
+        Args:
+            k: Neighbours kept per user/meal
+            workers: Processes used for the similarity computation
+        """
+        if self.matrix is None:
+            self.build_sparse_matrix()
         
-        user_ratings = self.user_ratings[user_id]
-        similarities = []
+        logger.info(f"Computing top-{k} neighbours for {self.matrix.n_users:,} users...")
+        neighbours, similarities = compute_top_k_neighbours_parallel(self.matrix, "users", k, workers)
+        self.user_neighbours = NeighbourTable(self.matrix.user_ids, neighbours, similarities)
         
-        for other_user_id, other_ratings in self.user_ratings.items():
-            if other_user_id == user_id:
-                continue
-            
-            similarity = self.cosine_similarity(user_ratings, other_ratings)
-            if similarity > 0:
-                similarities.append((other_user_id, similarity))
+        logger.info(f"Computing top-{k} neighbours for {self.matrix.n_meals:,} meals...")
+        neighbours, similarities = compute_top_k_neighbours_parallel(self.matrix, "meals", k, workers)
+        self.meal_neighbours = NeighbourTable(self.matrix.meal_ids, neighbours, similarities)
         
-        # Sort by similarity and return top k
-        similarities.sort(key=lambda x: x[1], reverse=True)
-        return similarities[:k]
+        logger.info("Neighbour index built")
     
-    def predict_rating(self, user_id: str, meal_id: int) -> float:
+    def build_user_lsh(self, n_tables: int = 32, n_bits: Optional[int] = None):
         """
-        Predict rating for a user-meal pair using collaborative filtering.
-        Falls back to popularity if user has no history.
+        Build the approximate (LSH) user index.
+        
+        Used for user search when no precomputed neighbour row exists,
+        e.g. for users whose ratings changed online or when the neighbour
+        index is disabled for very large user bases. n_bits defaults to
+        one sized from the candidate budget (RandomProjectionLSH.default_bits).
         """
-        # If user has rated this meal, return that rating
-        if user_id in self.user_ratings and meal_id in self.user_ratings[user_id]:
-            return self.user_ratings[user_id][meal_id]
-        
-        # Find similar users
-        similar_users = self.find_similar_users(user_id, k=20)
-        
-        if not similar_users:
-            # No similar users, use popularity
-            return self.meal_popularity.get(meal_id, 3.0)
-        
-        # Weighted average of similar users' ratings
-        total_weight = 0.0
-        weighted_sum = 0.0
-        
-        for similar_user_id, similarity in similar_users:
-            if meal_id in self.user_ratings[similar_user_id]:
-                rating = self.user_ratings[similar_user_id][meal_id]
-                weighted_sum += rating * similarity
-                total_weight += abs(similarity)
-        
-        if total_weight > 0:
-            predicted = weighted_sum / total_weight
-            # Ensure rating is in [1, 5] range
-            return max(1.0, min(5.0, predicted))
-        else:
-            # Fall back to popularity
-            return self.meal_popularity.get(meal_id, 3.0)
+        if self.matrix is None:
+            self.build_sparse_matrix()
+        
+        logger.info(f"Hashing {self.matrix.n_users:,} users into {n_tables} LSH tables...")
+        self.user_lsh = RandomProjectionLSH.build(self.matrix, n_tables=n_tables, n_bits=n_bits)
+        logger.info(f"LSH user index built ({self.user_lsh.n_bits} bits per table)")
     
-    def get_recommendations(self, user_id: str, all_meal_ids: List[int], 
-                           limit: int = 10) -> List[Tuple[int, float]]:
+    def train(
+        self,
+        interactions_file: Path,
+        neighbour_k: int = 50,
+        workers: int = 1,
+        lsh_tables: int = 0,
+        lsh_bits: Optional[int] = None,
+        meal_facets: Optional[Dict[int, Dict]] = None
+    ):
         """
-        Get top recommendations for a user.
-        Returns list of (meal_id, predicted_rating) tuples.
+        Train the model.
+        
+        Args:
+            interactions_file: JSON interactions file or interaction store directory
+            neighbour_k: Neighbours precomputed per user/meal (0 disables the index)
+            workers: Processes used to build the neighbour index
+            lsh_tables: Hash tables of the LSH user index (0 disables it)
+            lsh_bits: Bits per LSH bucket code (None sizes them from the candidate budget)
+            meal_facets: Meal categories/diet flags for the popularity ranking
+                (see load_meal_facets)
         """
-        # Get meals user hasn't rated
-        user_rated = set(self.user_ratings.get(user_id, {}).keys())
-        candidate_meals = [mid for mid in all_meal_ids if mid not in user_rated]
-        
-        if not candidate_meals:
-            # User has rated everything, return popular items
-            recommendations = [(mid, self.meal_popularity.get(mid, 3.0)) 
-                             for mid in all_meal_ids]
-            recommendations.sort(key=lambda x: x[1], reverse=True)
-            return recommendations[:limit]
-        
-        # Predict ratings for candidate meals
-        predictions = [(meal_id, self.predict_rating(user_id, meal_id)) 
-                      for meal_id in candidate_meals]
-        
-        # Sort by predicted rating
-        predictions.sort(key=lambda x: x[1], reverse=True)
-        
-        return predictions[:limit]
-    
-    def train(self, interactions_file: Path):
-        """Train the model."""
         logger.info("=" * 70)
         logger.info("Training Collaborative Filtering Model")
         logger.info("=" * 70)
@@ -182,74 +355,178 @@ class CollaborativeFilteringModel:
         # Calculate popularity
         self.calculate_popularity_scores()
         
-        self.is_trained = True
-        logger.info("✅ Model training complete!")
-    
-    def save(self, model_file: Path):
-        """Save trained model."""
-        logger.info(f"Saving model to: {model_file}")
+        if self.engine == "sparse" and self.matrix is None:
+            self.build_sparse_matrix()
         
-        model_data = {
-            'user_ratings': dict(self.user_ratings),
-            'meal_ratings': dict(self.meal_ratings),
-            'meal_popularity': self.meal_popularity,
-            'is_trained': self.is_trained
-        }
+        # Presort popularity, broken down by category and diet when facets are given
+        self.build_popularity_ranking(meal_facets, DietaryRestriction.list() if meal_facets else ())
         
-        with open(model_file, 'wb') as f:
-            pickle.dump(model_data, f)
+        # Precompute neighbour lists so serving never searches
+        if neighbour_k:
+            self.build_neighbour_index(neighbour_k, workers=workers)
         
-        logger.info("✅ Model saved!")
-    
-    @classmethod
-    def load(cls, model_file: Path):
-        """Load trained model."""
-        logger.info(f"Loading model from: {model_file}")
+        if lsh_tables and self.engine == "sparse":
+            self.build_user_lsh(lsh_tables, lsh_bits)
         
-        with open(model_file, 'rb') as f:
-            model_data = pickle.load(f)
+        self.is_trained = True
+        logger.info("✅ Model training complete!")
+
+
+class CollaborativeFilteringModel(CollaborativeFilteringTrainingMixin, cf_runtime.CollaborativeFilteringModel):
+    """User-user collaborative filtering model with training stages."""
+
+
+class ItemItemCollaborativeFilteringModel(
+    CollaborativeFilteringTrainingMixin, cf_runtime.ItemItemCollaborativeFilteringModel
+):
+    """Item-item collaborative filtering model with training stages."""
+    
+    def build_neighbour_index(self, k: int = 50, workers: int = 1):
+        """Precompute every meal's top-k similar meals (no user table needed)."""
+        if self.matrix is None:
+            self.build_sparse_matrix()
         
-        model = cls()
-        model.user_ratings = defaultdict(dict, model_data['user_ratings'])
-        model.meal_ratings = defaultdict(dict, model_data['meal_ratings'])
-        model.meal_popularity = model_data['meal_popularity']
-        model.is_trained = model_data['is_trained']
+        logger.info(f"Computing top-{k} neighbours for {self.matrix.n_meals:,} meals...")
+        neighbours, similarities = compute_top_k_neighbours_parallel(self.matrix, "meals", k, workers)
+        self.meal_neighbours = NeighbourTable(self.matrix.meal_ids, neighbours, similarities)
         
-        # Convert nested dicts back to defaultdicts
-        for user_id, ratings in model.user_ratings.items():
-            model.user_ratings[user_id] = dict(ratings)
-        for meal_id, ratings in model.meal_ratings.items():
-            model.meal_ratings[meal_id] = dict(ratings)
+        logger.info("Meal similarity table built")
+
+
+class MatrixFactorizationModel(cf_runtime.MatrixFactorizationModel):
+    """ALS matrix-factorization model with its training loop."""
+    
+    def _solve_rows(
+        self,
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        data: np.ndarray,
+        fixed: np.ndarray
+    ) -> np.ndarray:
+        """One ALS half-step: solve every row's factors against the fixed side."""
+        n_rows = len(indptr) - 1
+        solved = np.zeros((n_rows, self.factors), dtype=np.float64)
+        identity = np.eye(self.factors)
+        for row in range(n_rows):
+            start, end = indptr[row], indptr[row + 1]
+            if start == end:
+                continue
+            solved[row] = self._solve_one(fixed[indices[start:end]], data[start:end], identity)
+        return solved
+    
+    def train(self, interactions_file: Path, seed: int = 42, meal_facets: Optional[Dict[int, Dict]] = None):
+        """Train the model (meal_facets as in CollaborativeFilteringTrainingMixin.train)."""
+        logger.info("=" * 70)
+        logger.info("Training Matrix Factorization Model (ALS)")
+        logger.info("=" * 70)
         
-        logger.info("✅ Model loaded!")
-        return model
+        # Reuse the CF loader for interactions, popularity and the CSR matrix
+        source = CollaborativeFilteringModel()
+        source.load_interactions(interactions_file)
+        source.calculate_popularity_scores()
+        if source.matrix is None:
+            source.build_sparse_matrix()
+        self.matrix = source.matrix
+        self._meal_totals = None
+        self.meal_popularity = source.meal_popularity
+        self.popularity_scores = source.popularity_scores
+        self.build_popularity_ranking(meal_facets, DietaryRestriction.list() if meal_facets else ())
+        
+        matrix = self.matrix
+        self.global_mean = float(matrix.data.mean()) if len(matrix.data) else 3.0
+        rng = np.random.default_rng(seed)
+        user_factors = rng.normal(0, 0.1, (matrix.n_users, self.factors))
+        meal_factors = rng.normal(0, 0.1, (matrix.n_meals, self.factors))
+        
+        for iteration in range(1, self.iterations + 1):
+            user_factors = self._solve_rows(matrix.indptr, matrix.indices, matrix.data, meal_factors)
+            meal_factors = self._solve_rows(
+                matrix.meal_indptr, matrix.meal_indices, matrix.meal_data, user_factors
+            )
+            
+            rows = np.repeat(np.arange(matrix.n_users), np.diff(matrix.indptr))
+            predicted = self.global_mean + np.einsum(
+                'ij,ij->i', user_factors[rows], meal_factors[matrix.indices]
+            )
+            rmse = float(np.sqrt(np.mean((predicted - matrix.data) ** 2)))
+            logger.info(f"ALS iteration {iteration}/{self.iterations}: train RMSE {rmse:.4f}")
+        
+        self.user_factors = user_factors.astype(np.float32)
+        self.meal_factors = meal_factors.astype(np.float32)
+        self.is_trained = True
+        logger.info("✅ Model training complete!")
+
+
+# Trainable algorithms and the artifact each one is saved to
+ALGORITHMS = {
+    "user_user": (CollaborativeFilteringModel, "collaborative_filtering_model"),
+    "item_item": (ItemItemCollaborativeFilteringModel, "item_item_cf_model"),
+    "als": (MatrixFactorizationModel, "matrix_factorization_model.npz"),
+}
 
 
 def main():
     """Main training function."""
-    interactions_file = MODELS_DIR / "interactions_sample.json"
+    # Prefer the columnar store written by retrain_with_full_data.py
+    offline_file = MODELS_DIR / "interactions_full"
+    if not is_interaction_store(offline_file):
+        offline_file = MODELS_DIR / "interactions_sample.json"
     
-    if not interactions_file.exists():
-        logger.error(f"Interactions file not found: {interactions_file}")
-        logger.error("Run process_full_dataset.py first to generate interactions data.")
+    if not offline_file.exists():
+        logger.warning(f"Interactions file not found: {offline_file}")
+        logger.warning("Run process_full_dataset.py to add the Food.com interactions.")
+    
+    # Merge the offline interactions with the app's own ratings
+    interactions_file = MODELS_DIR / "interactions_training"
+    offline_count, app_count, ratings_until = build_training_store(interactions_file, offline_file)
+    if not offline_count + app_count:
+        logger.error("No interactions to train on.")
+        return
+    
+    # Algorithm to train: user_user (default), item_item or als
+    algorithm = sys.argv[1] if len(sys.argv) > 1 else "user_user"
+    if algorithm not in ALGORITHMS:
+        logger.error(f"Unknown algorithm '{algorithm}'. Choose from: {', '.join(ALGORITHMS)}")
         return
+    model_class, model_filename = ALGORITHMS[algorithm]
+    
+    # Processes for the neighbour index (defaults to every core)
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+    # LSH user index tables (0 = exact search only)
+    lsh_tables = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+    
+    # Categories and diet flags for the faceted popularity ranking
+    meal_facets = load_meal_facets()
     
     # Initialize and train model
-    model = CollaborativeFilteringModel()
-    model.train(interactions_file)
+    model = model_class()
+    if algorithm == "als":
+        model.train(interactions_file, meal_facets=meal_facets)
+    else:
+        model.train(interactions_file, workers=workers, lsh_tables=lsh_tables, meal_facets=meal_facets)
     
-    # Save model
-    model_file = MODELS_DIR / "collaborative_filtering_model.pkl"
-    model.save(model_file)
+    # Publish as the next model version (CF models as memory-mappable bundles,
+    # ALS as .npz); running API processes hot-swap it in
+    model_file = next_version_path(MODELS_DIR / model_filename)
+    if hasattr(model, 'save_bundle'):
+        # The API replays ratings made after this onto the model when it loads it
+        model.ratings_until = ratings_until
+        model.save_bundle(model_file)
+    else:
+        model.save(model_file)
     
     logger.info("\n" + "=" * 70)
     logger.info("✅ ML Model Training Complete!")
     logger.info("=" * 70)
     logger.info(f"💾 Model saved to: {model_file}")
     logger.info(f"📊 Model statistics:")
-    logger.info(f"  - Users in model: {len(model.user_ratings):,}")
-    logger.info(f"  - Meals in model: {len(model.meal_ratings):,}")
+    logger.info(f"  - Users in model: {model.n_users:,}")
+    logger.info(f"  - Meals in model: {model.n_meals:,}")
     logger.info(f"  - Popularity scores: {len(model.meal_popularity):,}")
+    if getattr(model, 'user_neighbours', None) is not None:
+        logger.info(f"  - Neighbours per user/meal: {model.user_neighbours.k}")
+    if getattr(model, 'user_lsh', None) is not None:
+        logger.info(f"  - LSH user index: {model.user_lsh.n_tables} tables x {model.user_lsh.n_bits} bits")
     logger.info("\n" + "=" * 70)
 
 
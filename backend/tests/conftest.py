@@ -0,0 +1,74 @@
+"""Shared pytest setup: an in-memory database and the scripts/ modules on sys.path."""
+import os
+import sys
+from pathlib import Path
+
+# Must be set before app.config is imported
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+sys.path.insert(0, str(BACKEND_DIR / "scripts"))
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.repositories.database import Base
+import app.models  # noqa: F401  (registers every table on Base)
+
+
+@pytest.fixture
+def session_factory():
+    """Session factory bound to a fresh in-memory SQLite database."""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def seeded_session_factory(session_factory):
+    """
+    session_factory over a small catalog: 30 meals across categories and
+    dietary flags, three users with preferences, and a few ratings.
+    """
+    from app.enums import DietaryRestriction
+    from app.models import Meal, MealRating, Preference, User
+    from app.services.meal_catalog import MealCatalogService
+    
+    flags = DietaryRestriction.list()
+    db = session_factory()
+    for meal_id in range(1, 31):
+        db.add(Meal(
+            id=meal_id,
+            name=f"Meal {meal_id}",
+            description=f"{['Spicy', 'Mild', 'Sweet'][meal_id % 3]} {['rice', 'pasta', 'salad'][meal_id % 4 % 3]} dish",
+            category=["breakfast", "lunch", "dinner", "snack"][meal_id % 4],
+            ingredients=", ".join(["rice", "chicken", "tomato", "peanuts", "milk"][meal_id % 5:meal_id % 5 + 2]),
+            calories=150.0 + 37 * meal_id,
+            protein=5.0 + meal_id,
+            carbohydrates=20.0 + 2 * meal_id,
+            fat=3.0 + meal_id % 7,
+            **{f"is_{flag}": bool(meal_id >> bit & 1) for bit, flag in enumerate(flags)}
+        ))
+    for user_id in (1, 2, 3):
+        db.add(User(
+            id=user_id, email=f"user{user_id}@example.com", username=f"user{user_id}",
+            first_name="Test", last_name=str(user_id), goal="maintenance",
+            daily_calorie_target=2000.0, daily_protein_target=100.0
+        ))
+        db.add(Preference(user_id=user_id, vegetarian=user_id == 2))
+    db.flush()
+    db.add_all(
+        MealRating(user_id=user_id, meal_id=meal_id, rating=float(1 + (user_id * meal_id) % 5))
+        for user_id in (1, 2, 3) for meal_id in range(1, 31, user_id + 2)
+    )
+    db.commit()
+    db.close()
+    
+    # The catalog snapshot is process-wide; make it reload from this database
+    MealCatalogService.invalidate()
+    yield session_factory
+    MealCatalogService.invalidate()
@@ -0,0 +1,81 @@
+"""Training store assembly from offline interactions plus in-app ratings."""
+import json
+from datetime import datetime
+
+import numpy as np
+
+import app_interactions
+from app.models import MealRating, RecipeRating
+from app.repositories.app_rating_repository import AppRatingRepository
+from interaction_store import read_interactions
+
+
+def _chunk(user_ids, meal_ids, ratings):
+    return (
+        np.array(user_ids, dtype=np.int64),
+        np.array(meal_ids, dtype=np.int64),
+        np.array(ratings, dtype=np.float32),
+    )
+
+
+def test_app_ratings_are_dropped_when_the_stream_fails(tmp_path, monkeypatch):
+    offline = tmp_path / "offline.json"
+    offline.write_text(json.dumps([
+        {"user_id": 1533, "meal_id": 1, "rating": 4.0},
+        {"user_id": 1534, "meal_id": 2, "rating": 5.0},
+        {"user_id": 1535, "meal_id": 3, "rating": 3.0},
+    ]))
+    
+    def failing_stream(db, chunk_size):
+        yield _chunk([1, 2], [1, 2], [5.0, 4.0])
+        yield _chunk([3], [3], [2.0])
+        raise ConnectionError("server closed the connection")
+    
+    monkeypatch.setattr(app_interactions, "iter_app_ratings", failing_stream)
+    
+    offline_count, app_count, ratings_until = app_interactions.build_training_store(
+        tmp_path / "store", offline, chunk_size=2
+    )
+    
+    columns = read_interactions(tmp_path / "store")
+    assert (offline_count, app_count, ratings_until) == (3, 0, None)
+    assert columns['user_id'].tolist() == [-1533, -1534, -1535]
+    assert columns['rating'].tolist() == [4.0, 5.0, 3.0]
+
+
+def test_app_ratings_follow_offline_interactions(tmp_path, monkeypatch):
+    offline = tmp_path / "offline.json"
+    offline.write_text(json.dumps([{"user_id": 1533, "meal_id": 1, "rating": 4.0}]))
+    monkeypatch.setattr(
+        app_interactions, "iter_app_ratings",
+        lambda db, chunk_size: iter([_chunk([1, 2, 3], [1, 2, 3], [5.0, 4.0, 2.0])])
+    )
+    
+    offline_count, app_count, ratings_until = app_interactions.build_training_store(
+        tmp_path / "store", offline, chunk_size=2
+    )
+    
+    assert (offline_count, app_count) == (1, 3)
+    assert isinstance(ratings_until, datetime)
+    assert read_interactions(tmp_path / "store")['user_id'].tolist() == [-1533, 1, 2, 3]
+
+
+def test_app_ratings_merge_both_tables_latest_first(seeded_session_factory):
+    db = seeded_session_factory()
+    db.query(MealRating).delete()
+    db.add_all([
+        MealRating(user_id=1, meal_id=1, rating=2.0, created_at=datetime(2026, 1, 1)),
+        MealRating(user_id=1, meal_id=2, rating=5.0, created_at=datetime(2026, 1, 3)),
+        RecipeRating(user_id=1, meal_id=1, rating=4.0, created_at=datetime(2026, 1, 2)),
+        RecipeRating(user_id=1, meal_id=2, rating=1.0, created_at=datetime(2026, 1, 1),
+                     updated_at=datetime(2026, 1, 2, 12)),
+        RecipeRating(user_id=2, meal_id=3, rating=3.0, created_at=datetime(2026, 1, 4)),
+    ])
+    db.commit()
+    
+    # The fold-in sees recipe ratings too, and the most recent rating wins
+    assert AppRatingRepository.get_user_ratings(db, 1) == {1: 4.0, 2: 5.0}
+    chunks = list(AppRatingRepository.iter_ratings(db, chunk_size=2, since=datetime(2026, 1, 2)))
+    assert [len(user_ids) for user_ids, _, _ in chunks] == [2, 2]
+    assert np.concatenate([meal_ids for _, meal_ids, _ in chunks]).tolist() == [1, 2, 2, 3]
+    db.close()
@@ -0,0 +1,316 @@
+"""Storage contract shared by the memory, SQLite and Redis cache backends."""
+import enum
+import re
+import socketserver
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+from app.services.cache_backends import (
+    CacheRecord, MemoryCacheBackend, RedisCacheBackend, SQLiteCacheBackend
+)
+
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+
+class Color(enum.Enum):
+    RED = "red"
+
+
+def _glob_to_regex(pattern: str) -> "re.Pattern":
+    """Redis MATCH glob (with backslash escapes and [...] classes) as a regex."""
+    parts, index = [], 0
+    while index < len(pattern):
+        char = pattern[index]
+        if char == "\\" and index + 1 < len(pattern):
+            parts.append(re.escape(pattern[index + 1]))
+            index += 2
+            continue
+        if char == "*":
+            parts.append(".*")
+        elif char == "?":
+            parts.append(".")
+        elif char == "[":
+            end = pattern.index("]", index + 1)
+            parts.append("[" + re.escape(pattern[index + 1:end]) + "]")
+            index = end
+        else:
+            parts.append(re.escape(char))
+        index += 1
+    return re.compile("".join(parts) + r"\Z", re.DOTALL)
+
+
+class _RespStore:
+    """In-memory keyspace with millisecond expiry, enough for RedisCacheBackend."""
+    
+    def __init__(self):
+        self.values = {}
+        self.expiry = {}
+        self.lock = threading.Lock()
+    
+    def alive(self, key):
+        if key in self.expiry and self.expiry[key] <= time.time():
+            self.values.pop(key, None)
+            self.expiry.pop(key, None)
+        return key in self.values
+    
+    def execute(self, command, args):
+        if command == "GET":
+            return self.values[args[0]] if self.alive(args[0]) else None
+        if command == "SET":
+            self.values[args[0]] = args[1]
+            self.expiry.pop(args[0], None)
+            if len(args) > 3 and args[2].upper() == b"PX":
+                self.expiry[args[0]] = time.time() + int(args[3]) / 1000
+            return "OK"
+        if command == "DEL":
+            removed = 0
+            for key in args:
+                if self.alive(key):
+                    del self.values[key]
+                    self.expiry.pop(key, None)
+                    removed += 1
+            return removed
+        if command == "SADD":
+            self.alive(args[0])
+            members = self.values.setdefault(args[0], set())
+            added = len(set(args[1:]) - members)
+            members.update(args[1:])
+            return added
+        if command == "SMEMBERS":
+            return sorted(self.values[args[0]]) if self.alive(args[0]) else []
+        if command == "PTTL":
+            if not self.alive(args[0]):
+                return -2
+            return int((self.expiry[args[0]] - time.time()) * 1000) if args[0] in self.expiry else -1
+        if command == "PEXPIRE":
+            if not self.alive(args[0]):
+                return 0
+            self.expiry[args[0]] = time.time() + int(args[1]) / 1000
+            return 1
+        if command == "INCR":
+            value = int(self.values[args[0]]) + 1 if self.alive(args[0]) else 1
+            self.values[args[0]] = str(value).encode()
+            return value
+        if command == "HINCRBY":
+            self.alive(args[0])
+            fields = self.values.setdefault(args[0], {})
+            fields[args[1]] = fields.get(args[1], 0) + int(args[2])
+            return fields[args[1]]
+        if command == "HGETALL":
+            if not self.alive(args[0]):
+                return []
+            return [item for field, value in self.values[args[0]].items() for item in (field, str(value).encode())]
+        if command == "SCAN":
+            regex = _glob_to_regex(args[args.index(b"MATCH") + 1].decode())
+            return [b"0", [key for key in list(self.values) if self.alive(key) and regex.match(key.decode())]]
+        if command in ("SELECT", "AUTH"):
+            return "OK"
+        raise ValueError(f"ERR unknown command '{command}'")
+
+
+def _encode_reply(value) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, str):
+        return b"+%s\r\n" % value.encode()
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(_encode_reply(item) for item in value)
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+class _RespHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        store = self.server.store
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = []
+            for _ in range(int(line[1:])):
+                length = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(length + 2)[:-2])
+            with store.lock:
+                try:
+                    reply = _encode_reply(store.execute(args[0].upper().decode(), args[1:]))
+                except ValueError as e:
+                    reply = b"-%s\r\n" % str(e).encode()
+            self.wfile.write(reply)
+
+
+class _RespServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+@pytest.fixture
+def resp_server():
+    """Local stand-in for a Redis server, on a free port; yields its URL."""
+    server = _RespServer(("127.0.0.1", 0), _RespHandler)
+    server.store = _RespStore()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"redis://127.0.0.1:{server.server_address[1]}/0"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryCacheBackend()
+    if request.param == "sqlite":
+        return SQLiteCacheBackend(str(tmp_path / "cache.db"))
+    return RedisCacheBackend(request.getfixturevalue("resp_server"), prefix="test:")
+
+
+def _record(payload: bytes = b"payload", ttl: float = 60) -> CacheRecord:
+    now = time.time()
+    return CacheRecord(payload, now + ttl / 2, now + ttl)
+
+
+def test_set_then_get_returns_record(backend):
+    record = _record(b"meals")
+    
+    assert backend.set(("get_popular_meals", 10, None), record)
+    stored = backend.get(("get_popular_meals", 10, None))
+    
+    assert stored.payload == b"meals"
+    assert stored.stale_at == pytest.approx(record.stale_at)
+    assert stored.expires_at == pytest.approx(record.expires_at)
+    assert backend.get(("get_popular_meals", 5, None)) is None
+
+
+def test_keys_with_equal_labels_stay_apart(backend):
+    backend.set(("lookup", 1), _record(b"int"))
+    backend.set(("lookup", "1"), _record(b"str"))
+    
+    assert backend.get(("lookup", 1)).payload == b"int"
+    assert backend.get(("lookup", "1")).payload == b"str"
+
+
+def test_expired_entries_are_not_returned(backend):
+    backend.set(("short_lived",), _record(ttl=0.2))
+    assert backend.get(("short_lived",)) is not None
+    
+    time.sleep(0.3)
+    
+    assert backend.get(("short_lived",)) is None
+
+
+def test_invalidate_tag_drops_entries_and_rejects_stale_writes(backend):
+    generation = backend.tag_generation("user:1")
+    backend.set(("recommend", 1), _record(), tag="user:1", generation=generation)
+    backend.set(("recommend", 2), _record(), tag="user:2", generation=backend.tag_generation("user:2"))
+    
+    assert backend.invalidate_tag("user:1") == 1
+    
+    assert backend.get(("recommend", 1)) is None
+    assert backend.get(("recommend", 2)) is not None
+    # A result computed before the invalidation must not be stored
+    assert not backend.set(("recommend", 1), _record(), tag="user:1", generation=generation)
+    assert backend.get(("recommend", 1)) is None
+    assert backend.set(("recommend", 1), _record(), tag="user:1", generation=backend.tag_generation("user:1"))
+
+
+def test_delete_function_leaves_other_functions(backend):
+    backend.set(("popular", 10), _record())
+    backend.set(("popular",), _record())
+    backend.set(("popular_by_category", 10), _record())
+    
+    assert backend.delete_function("popular") == 2
+    
+    assert backend.get(("popular", 10)) is None
+    assert backend.get(("popular_by_category", 10)) is not None
+
+
+def test_non_literal_key_parts_support_matching_and_listing(backend):
+    backend.set(("daily", date(2026, 1, 1), Color.RED), _record())
+    backend.set(("daily", date(2026, 1, 2), Color.RED), _record())
+    
+    assert sorted(backend.keys()) == ["daily:2026-01-01:Color.RED", "daily:2026-01-02:Color.RED"]
+    assert backend.delete_matching(lambda label: "2026-01-01" in label) == 1
+    assert backend.get(("daily", date(2026, 1, 1), Color.RED)) is None
+    assert backend.get(("daily", date(2026, 1, 2), Color.RED)) is not None
+
+
+@pytest.mark.parametrize("kind", ["memory", "sqlite"])
+def test_least_recently_used_entry_is_evicted(kind, tmp_path):
+    if kind == "memory":
+        backend = MemoryCacheBackend(max_entries=3)
+    else:
+        backend = SQLiteCacheBackend(str(tmp_path / "cache.db"), max_entries=3, touch_interval_seconds=0)
+    for index in range(3):
+        backend.set(("meal", index), _record())
+        time.sleep(0.01)
+    backend.get(("meal", 0))
+    
+    backend.set(("meal", 3), _record())
+    
+    assert backend.get(("meal", 1)) is None
+    assert backend.get(("meal", 0)) is not None
+    assert backend.get(("meal", 3)) is not None
+
+
+def test_sqlite_totals_follow_overwrites_and_byte_bound(tmp_path):
+    backend = SQLiteCacheBackend(str(tmp_path / "cache.db"), max_bytes=1000)
+    backend.set(("meal", 1), _record(b"x" * 400))
+    backend.set(("meal", 1), _record(b"x" * 100))
+    backend.set(("meal", 2), _record(b"x" * 400))
+    assert (backend.stats()["size"], backend.stats()["bytes"]) == (2, 500)
+    
+    backend.set(("meal", 3), _record(b"x" * 600))
+    
+    stats = backend.stats()
+    assert stats["bytes"] <= 900
+    assert backend.get(("meal", 3)) is not None
+    reopened = SQLiteCacheBackend(str(tmp_path / "cache.db"), max_bytes=1000)
+    assert (reopened.stats()["size"], reopened.stats()["bytes"]) == (stats["size"], stats["bytes"])
+
+
+def test_sqlite_cache_is_shared_between_processes(tmp_path):
+    path = str(tmp_path / "cache.db")
+    backend = SQLiteCacheBackend(path)
+    backend.set(("recommend", 1), _record(b"from parent"), tag="user:1")
+    script = textwrap.dedent(f"""
+        import time
+        from app.services.cache_backends import CacheRecord, SQLiteCacheBackend
+        backend = SQLiteCacheBackend({path!r})
+        assert backend.get(("recommend", 1)).payload == b"from parent"
+        backend.invalidate_tag("user:1")
+        now = time.time()
+        backend.set(("recommend", 2), CacheRecord(b"from child", now + 30, now + 60))
+    """)
+    
+    subprocess.run(
+        [sys.executable, "-c", script], cwd=BACKEND_DIR, check=True,
+        env={"DATABASE_URL": "sqlite://", "PATH": ""}
+    )
+    
+    assert backend.get(("recommend", 1)) is None
+    assert backend.tag_generation("user:1") == 1
+    assert backend.get(("recommend", 2)).payload == b"from child"
+
+
+def test_redis_stats_come_from_shared_counters(resp_server):
+    first = RedisCacheBackend(resp_server, prefix="test:")
+    second = RedisCacheBackend(resp_server, prefix="test:", stats_flush_interval_seconds=0)
+    first.set(("meal", 1), _record())
+    first.get(("meal", 1))
+    second.get(("meal", 2))
+    second.delete_function("meal")
+    
+    stats = first.stats()
+    
+    assert {counter: stats[counter] for counter in ("hits", "misses", "writes", "removed")} == {
+        "hits": 1, "misses": 1, "writes": 1, "removed": 1
+    }
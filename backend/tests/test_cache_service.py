@@ -0,0 +1,257 @@
+"""The @cached decorator: keys, hits, invalidation and concurrent callers."""
+import asyncio
+import threading
+import time
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.config import Settings
+from app.core.observer import EventManager
+from app.services import cache_service
+from app.services.cache_backends import MemoryCacheBackend
+from app.services.ml_recommendation_service import MLRecommendationService
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    """Empty in-process cache per test, and no trained CF model."""
+    cache_service.set_backend(MemoryCacheBackend())
+    monkeypatch.setattr(MLRecommendationService, "_load_ml_model", classmethod(lambda cls, algorithm=None: None))
+    yield
+    cache_service.set_backend(MemoryCacheBackend())
+
+
+@pytest.fixture
+def query_counter(seeded_session_factory):
+    """List whose length is the number of SQL statements run so far."""
+    statements = []
+    engine = seeded_session_factory.kw["bind"]
+    listener = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", listener)
+    yield statements
+    event.remove(engine, "before_cursor_execute", listener)
+
+
+def test_second_call_with_another_session_skips_the_database(seeded_session_factory, query_counter):
+    first_db, second_db = seeded_session_factory(), seeded_session_factory()
+    
+    first = MLRecommendationService.get_recommendations(first_db, 1, limit=5)
+    before = len(query_counter)
+    second = MLRecommendationService.get_recommendations(second_db, 1, limit=5)
+    
+    assert first
+    assert len(query_counter) == before
+    assert [rec["meal"].id for rec in second] == [rec["meal"].id for rec in first]
+    first_db.close()
+    second_db.close()
+
+
+def test_positional_and_keyword_calls_share_a_key(seeded_session_factory):
+    db = seeded_session_factory()
+    cache_key = MLRecommendationService.get_recommendations.cache_key
+    
+    assert cache_key(db, 1, None, 5) == cache_key(db, user_id=1, limit=5) == cache_key(db, 1, limit=5, use_ml=True)
+    assert cache_key(db, 1, None, 5) != cache_key(db, 2, None, 5)
+    db.close()
+
+
+def test_meal_rated_event_invalidates_only_that_user(seeded_session_factory, query_counter):
+    db = seeded_session_factory()
+    for user_id in (1, 2):
+        MLRecommendationService.get_recommendations(db, user_id, limit=5)
+    
+    EventManager().notify("meal_rated", {"user_id": 1, "meal_id": 3, "rating": 5.0})
+    
+    before = len(query_counter)
+    MLRecommendationService.get_recommendations(db, 2, limit=5)
+    assert len(query_counter) == before
+    MLRecommendationService.get_recommendations(db, 1, limit=5)
+    assert len(query_counter) > before
+    db.close()
+
+
+@pytest.mark.parametrize("backend, ttl", [
+    ("memory", "RECOMMENDATION_CACHE_LOCAL_TTL_SECONDS"),
+    ("sqlite", "RECOMMENDATION_CACHE_TTL_SECONDS"),
+    ("redis", "RECOMMENDATION_CACHE_TTL_SECONDS"),
+])
+def test_recommendations_stay_cached_long_only_with_a_shared_backend(backend, ttl):
+    # Invalidation events only reach the worker that handled the write unless the backend is shared
+    settings = Settings(CACHE_BACKEND=backend)
+    
+    assert settings.recommendation_cache_ttl_seconds == getattr(settings, ttl)
+    assert Settings(CACHE_BACKEND="memory").recommendation_cache_ttl_seconds < settings.RECOMMENDATION_CACHE_TTL_SECONDS
+
+
+def _run_concurrently(call, count=8):
+    """Start count threads running call(); returns (threads, outcomes)."""
+    outcomes = []
+    
+    def run():
+        try:
+            outcomes.append(call())
+        except Exception as e:
+            outcomes.append(e)
+    
+    threads = [threading.Thread(target=run) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, outcomes
+
+
+def test_single_flight_computes_once_for_concurrent_threads():
+    calls, release = [], threading.Event()
+    
+    @cache_service.cached(single_flight=True)
+    def slow_lookup(meal_id):
+        calls.append(meal_id)
+        assert release.wait(5)
+        return {"meal_id": meal_id, "score": 4.5}
+    
+    threads, outcomes = _run_concurrently(lambda: slow_lookup(7))
+    time.sleep(0.2)  # every caller is now waiting on the first one's computation
+    release.set()
+    for thread in threads:
+        thread.join(timeout=5)
+    
+    assert calls == [7]
+    assert outcomes == [{"meal_id": 7, "score": 4.5}] * 8
+    # Each caller gets its own copy of the shared result
+    assert len({id(outcome) for outcome in outcomes}) == 8
+
+
+def test_single_flight_computes_once_for_gathered_coroutines():
+    calls = []
+    
+    @cache_service.cached(single_flight=True)
+    async def slow_lookup(meal_id):
+        calls.append(meal_id)
+        await asyncio.sleep(0.05)
+        return [meal_id, meal_id + 1]
+    
+    async def gather():
+        return await asyncio.gather(*(slow_lookup(7) for _ in range(8)))
+    
+    results = asyncio.run(gather())
+    
+    assert calls == [7]
+    assert results == [[7, 8]] * 8
+    assert len({id(result) for result in results}) == 8
+
+
+def test_single_flight_error_reaches_every_waiter():
+    calls, release = [], threading.Event()
+    
+    @cache_service.cached(single_flight=True)
+    def failing_lookup(meal_id):
+        calls.append(meal_id)
+        assert release.wait(5)
+        raise ConnectionError("database went away")
+    
+    threads, outcomes = _run_concurrently(lambda: failing_lookup(7))
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join(timeout=5)
+    
+    assert calls == [7]
+    assert len(outcomes) == 8
+    assert all(isinstance(outcome, ConnectionError) for outcome in outcomes)
+    # Nothing was cached and the failed flight is gone: the next call computes again
+    with pytest.raises(ConnectionError):
+        failing_lookup(7)
+    assert calls == [7, 7]
+
+
+def test_single_flight_error_reaches_every_gathered_coroutine():
+    calls = []
+    
+    @cache_service.cached(single_flight=True)
+    async def failing_lookup(meal_id):
+        calls.append(meal_id)
+        await asyncio.sleep(0.05)
+        raise ConnectionError("database went away")
+    
+    async def gather():
+        return await asyncio.gather(*(failing_lookup(7) for _ in range(8)), return_exceptions=True)
+    
+    outcomes = asyncio.run(gather())
+    
+    assert calls == [7]
+    assert all(isinstance(outcome, ConnectionError) for outcome in outcomes)
+
+
+def _wait_for_refreshes():
+    deadline = time.monotonic() + 5
+    while cache_service._refreshing and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not cache_service._refreshing
+
+
+def test_stale_hit_is_served_while_one_refresh_runs_with_its_own_session(session_factory):
+    opened, calls, version = [], [], [1]
+    refreshing, release = threading.Event(), threading.Event()
+    
+    def open_session():
+        opened.append(session_factory())
+        return opened[-1]
+    
+    @cache_service.cached(ttl_seconds=60, soft_ttl_seconds=1, session_factory=open_session)
+    def meal_count(db: Session, user_id: int):
+        calls.append(db)
+        if len(calls) > 1:
+            refreshing.set()
+            assert release.wait(5)
+        return version[0]
+    
+    db = session_factory()
+    assert meal_count(db, 1) == 1
+    time.sleep(1.1)
+    version[0] = 2
+    
+    # Past the soft TTL: the stale value comes back at once, before the refresh finishes
+    assert meal_count(db, 1) == 1
+    assert refreshing.wait(5)
+    assert meal_count(db, 1) == 1
+    release.set()
+    _wait_for_refreshes()
+    
+    assert meal_count(db, 1) == 2
+    # One refresh, run with a session of its own rather than the caller's
+    assert len(calls) == 2
+    assert calls[1] is not db and calls[1] is opened[0]
+    assert len(opened) == 1
+    db.close()
+
+
+def test_invalidation_during_a_refresh_beats_the_stale_result(session_factory):
+    calls, version = [], [1]
+    refreshing, release = threading.Event(), threading.Event()
+    
+    @cache_service.cached(ttl_seconds=60, soft_ttl_seconds=1, user_param="user_id", session_factory=session_factory)
+    def meal_count(db: Session, user_id: int):
+        value = version[0]
+        calls.append(value)
+        if len(calls) == 2:
+            refreshing.set()
+            assert release.wait(5)
+        return value
+    
+    db = session_factory()
+    assert meal_count(db, 1) == 1
+    time.sleep(1.1)
+    version[0] = 2
+    assert meal_count(db, 1) == 1
+    assert refreshing.wait(5)
+    
+    # The user's data changes while the refresh is still computing from the old data
+    version[0] = 3
+    cache_service.invalidate_user(data={"user_id": 1})
+    release.set()
+    _wait_for_refreshes()
+    
+    assert meal_count(db, 1) == 3
+    assert calls == [1, 2, 3]
+    db.close()
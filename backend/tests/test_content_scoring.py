@@ -0,0 +1,120 @@
+"""The vectorized content scorer must match the scalar reference score for score."""
+import random
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app.enums import DietaryRestriction
+from app.models import Meal, Preference
+from app.services.meal_catalog import MealCatalogService
+from app.services.recommendation_service import RecommendationService
+
+FLAGS = DietaryRestriction.list()
+GOALS = ["weight_loss", "muscle_gain", "maintenance", "weight_gain", None]
+
+
+@pytest.fixture
+def db(seeded_session_factory):
+    """The seeded catalog plus meals at the edges of the scoring terms."""
+    db = seeded_session_factory()
+    db.add_all([
+        # Every dietary flag: the only meal passing all restrictions at once
+        Meal(id=31, name="Thai Tofu Bowl", description=None, category=None, ingredients="tofu, rice",
+             calories=420.0, protein=30.0, carbohydrates=50.0, fat=9.0, **{f"is_{flag}": True for flag in FLAGS}),
+        # No flags and no calories (skips the density bonus)
+        Meal(id=32, name="Water", description="", category="drink", ingredients=None,
+             calories=0.0, protein=0.0, carbohydrates=0.0, fat=0.0),
+        # Halal and kosher only, which no seeded meal is
+        Meal(id=33, name="Peanut Chicken", description="Italian style peanut chicken with milk sauce",
+             category="dinner", ingredients="chicken, peanuts, milk",
+             calories=650.0, protein=45.0, carbohydrates=20.0, fat=30.0, is_halal=True, is_kosher=True),
+    ])
+    db.commit()
+    MealCatalogService.invalidate()
+    yield db
+    db.close()
+
+
+def _assert_parity(db, user, preference, user_meals=(), today_nutrition=None):
+    today_nutrition = today_nutrition or {}
+    catalog = MealCatalogService.get(db)
+    meals = db.query(Meal).order_by(Meal.id).all()
+    
+    vectorized = RecommendationService._calculate_meal_scores(
+        catalog, np.arange(len(catalog)), user, preference, list(user_meals), today_nutrition
+    ).tolist()
+    reference = [
+        RecommendationService._calculate_meal_score(meal, user, preference, list(user_meals), today_nutrition)
+        for meal in meals
+    ]
+    
+    assert vectorized == reference
+    return dict(zip((meal.id for meal in meals), vectorized))
+
+
+def _user(goal="maintenance", calories=2000.0, protein=100.0):
+    return SimpleNamespace(daily_calorie_target=calories, daily_protein_target=protein, goal=goal)
+
+
+@pytest.mark.parametrize("restrictions", [
+    (),
+    ("vegan",),
+    ("vegetarian", "gluten_free"),
+    ("halal",),
+    ("halal", "kosher"),
+    tuple(FLAGS),
+])
+def test_diet_restrictions_filter_the_same_meals(db, restrictions):
+    preference = Preference(**{flag: flag in restrictions for flag in FLAGS})
+    
+    scores = _assert_parity(db, _user(), preference)
+    
+    required = DietaryRestriction.mask_of(preference)
+    for meal in db.query(Meal):
+        if meal.diet_mask & required != required:
+            assert scores[meal.id] == 0.0
+    if restrictions == tuple(FLAGS):
+        assert [meal_id for meal_id, score in scores.items() if score > 0] == [31]
+
+
+def test_disliked_ingredients_do_not_change_scores(db):
+    preference = Preference(
+        disliked_ingredients="peanuts, milk, rice", favorite_ingredients="chicken, peanuts",
+        preferred_cuisine="Italian"
+    )
+    
+    with_dislikes = _assert_parity(db, _user(goal="muscle_gain"), preference)
+    preference.disliked_ingredients = None
+    
+    assert _assert_parity(db, _user(goal="muscle_gain"), preference) == with_dislikes
+
+
+def test_random_profiles_match_the_scalar_reference(db):
+    rng = random.Random(42)
+    meals = db.query(Meal).order_by(Meal.id).all()
+    
+    for _ in range(100):
+        user = _user(
+            goal=rng.choice(GOALS),
+            calories=rng.choice([None, 0, 1200, 1800.0, 2600.0]),
+            protein=rng.choice([None, 0, 60, 150.0]),
+        )
+        preference = None
+        if rng.random() < 0.8:
+            preference = Preference(
+                preferred_cuisine=rng.choice([None, "", "Italian", "THAI", "meal 1", "dish"]),
+                favorite_ingredients=rng.choice([None, "", "rice, chicken", "Meal 2,  , dish", "1,2,3"]),
+                disliked_ingredients=rng.choice([None, "", "peanuts", "milk, tofu"]),
+                **{flag: rng.random() < 0.15 for flag in FLAGS}
+            )
+        user_meals = [
+            SimpleNamespace(meal_id=meal.id, meal=meal)
+            for meal in rng.sample(meals, rng.choice([0, 1, 5, 20]))
+        ]
+        today_nutrition = rng.choice([
+            {}, {"total_calories": 0, "total_protein": 0},
+            {"total_calories": rng.uniform(0, 3000), "total_protein": rng.uniform(0, 200)},
+        ])
+        
+        _assert_parity(db, user, preference, user_meals, today_nutrition)
@@ -0,0 +1,45 @@
+"""Item-item CF ranking: neighbour-derived predictions vs the popularity fallback."""
+import json
+
+import pytest
+
+from train_ml_model import ItemItemCollaborativeFilteringModel
+
+
+@pytest.fixture
+def model(tmp_path):
+    """
+    Meals 1 and 2 are rated together (so they are similar); meal 3 is rated
+    highly by many users who never rate 1 or 2; user 1 has only rated meal 1.
+    """
+    interactions = [{"user_id": 1, "meal_id": 1, "rating": 5.0}]
+    for user_id in range(2, 8):
+        interactions += [
+            {"user_id": user_id, "meal_id": 1, "rating": 5.0},
+            {"user_id": user_id, "meal_id": 2, "rating": 5.0},
+        ]
+    for user_id in range(10, 60):
+        interactions.append({"user_id": user_id, "meal_id": 3, "rating": 4.5})
+    interactions_file = tmp_path / "interactions.json"
+    interactions_file.write_text(json.dumps(interactions))
+    
+    model = ItemItemCollaborativeFilteringModel()
+    model.train(interactions_file, neighbour_k=10)
+    return model
+
+
+def test_neighbour_prediction_outranks_unrelated_popular_meal(model):
+    recommendations = model.get_recommendations("1", [1, 2, 3], limit=2)
+    
+    assert [meal_id for meal_id, _ in recommendations] == [2, 3]
+
+
+def test_fallback_is_on_the_rating_scale(model):
+    predictions = model.predict_ratings("1", [3, 999])
+    
+    global_mean = (13 * 5.0 + 50 * 4.5) / 63
+    prior = model.FALLBACK_PRIOR_COUNT
+    
+    # Mean rating shrunk toward the global mean; unknown meals get the global mean
+    assert predictions[0] == pytest.approx((50 * 4.5 + prior * global_mean) / (50 + prior))
+    assert predictions[1] == pytest.approx(global_mean)
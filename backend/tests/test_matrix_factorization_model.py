@@ -0,0 +1,65 @@
+"""ALS model: fold-in reproduces the trained factors, and the fallback stays on the rating scale."""
+import json
+
+import numpy as np
+import pytest
+
+from train_ml_model import MatrixFactorizationModel
+
+
+@pytest.fixture
+def model(tmp_path):
+    """ALS trained to convergence on 40 users x 30 meals at ~30% density (fixed seed)."""
+    rng = np.random.default_rng(7)
+    interactions = [
+        {"user_id": user_id, "meal_id": meal_id, "rating": float(rng.integers(2, 11)) / 2}
+        for user_id in range(1, 41)
+        for meal_id in range(1, 31)
+        if rng.random() < 0.3
+    ]
+    interactions_file = tmp_path / "interactions.json"
+    interactions_file.write_text(json.dumps(interactions))
+    
+    model = MatrixFactorizationModel(factors=4, iterations=50)
+    model.train(interactions_file)
+    return model
+
+
+def test_fold_in_solves_the_regularized_least_squares_problem(model):
+    ratings = {3: 5.0, 8: 1.5, 21: 4.0, 999: 2.0}  # meal 999 is unknown to the model
+    
+    vector = model.fold_in(ratings)
+    
+    # Zero gradient of |F x - (r - mean)|^2 + lambda * n * |x|^2 over the known meals
+    fixed = model.meal_factors[model.matrix.meal_indices_of([3, 8, 21])].astype(np.float64)
+    residuals = np.array([5.0, 1.5, 4.0]) - model.global_mean
+    gradient = fixed.T @ (fixed @ vector - residuals) + model.regularization * 3 * vector
+    np.testing.assert_allclose(gradient, 0.0, atol=1e-9)
+    assert model.fold_in({999: 2.0}) is None
+
+
+def test_folded_in_users_match_their_trained_factors(model):
+    meal_ids = list(range(1, 31))
+    
+    for user_id in map(str, model.matrix.user_ids.tolist()):
+        ratings = model.matrix.ratings_of(user_id)
+        
+        np.testing.assert_allclose(
+            model.fold_in(ratings), model.user_factors[model.matrix.user_index(user_id)], atol=1e-3
+        )
+        np.testing.assert_allclose(
+            model.predict_ratings("new user", meal_ids, user_ratings=ratings),
+            model.predict_ratings(user_id, meal_ids),
+            atol=1e-3
+        )
+
+
+def test_users_without_factors_get_predictions_on_the_rating_scale(model):
+    meal_ids = list(range(1, 31)) + [999]  # meal 999 is unknown to the model
+    
+    predictions = model.predict_ratings("new user", meal_ids)
+    recommendations = model.get_recommendations("new user", meal_ids, limit=5)
+    
+    assert np.all((predictions >= 1.0) & (predictions <= 5.0))
+    assert predictions[-1] == pytest.approx(model.global_mean)
+    assert all(1.0 <= score <= 5.0 for _, score in recommendations)
@@ -0,0 +1,18 @@
+"""Meal search reads the database, not the cached meal catalog."""
+from app.models import Meal
+from app.services.meal_catalog import MealCatalogService
+from app.services.meal_service import MealService
+
+
+def test_search_sees_meals_written_by_another_process(seeded_session_factory):
+    db = seeded_session_factory()
+    MealCatalogService.get(db)
+    # Inserted without the repository's meal_created event, as another worker's write would be
+    db.add(Meal(id=31, name="Spicy Tofu", description=None, category="dinner",
+                calories=300.0, protein=20.0, carbohydrates=10.0, fat=12.0))
+    db.commit()
+    
+    matches = MealService.search_meals(db, "spicy")
+    
+    assert 31 in {meal.id for meal in matches}
+    assert 31 not in MealCatalogService.get(db).ids
@@ -0,0 +1,89 @@
+"""Model registry: first loads are shared by concurrent callers, and pruning spares peers' versions."""
+import os
+import threading
+import time
+
+from app.ml.model_registry import ModelRegistry, prune_versions
+
+
+class _SlowModel:
+    """Model whose load blocks until the test releases it."""
+    
+    loading = None
+    release = None
+    loads = 0
+    
+    @classmethod
+    def load(cls, path):
+        cls.loads += 1
+        cls.loading.set()
+        assert cls.release.wait(5)
+        return cls()
+
+
+def test_concurrent_first_callers_wait_for_the_load(tmp_path):
+    (tmp_path / "model").mkdir()
+    _SlowModel.loading, _SlowModel.release, _SlowModel.loads = threading.Event(), threading.Event(), 0
+    registry = ModelRegistry({"user_user": (_SlowModel, (tmp_path / "model",))})
+    results = []
+    
+    def get():
+        results.append(registry.get("user_user"))
+    
+    first = threading.Thread(target=get)
+    first.start()
+    assert _SlowModel.loading.wait(5)
+    second = threading.Thread(target=get)
+    second.start()
+    second.join(timeout=0.2)
+    # The second caller must not see "no model" while the first load runs
+    assert second.is_alive()
+    assert results == []
+    
+    _SlowModel.release.set()
+    first.join(timeout=5)
+    second.join(timeout=5)
+    
+    assert len(results) == 2
+    assert results[0] is results[1]
+    assert isinstance(results[0], _SlowModel)
+    assert _SlowModel.loads == 1
+
+
+class _PrunedWhileLoading:
+    """Model whose first load finds its version deleted by another worker."""
+    
+    paths = []
+    
+    @classmethod
+    def load(cls, path):
+        cls.paths.append(path.name)
+        if len(cls.paths) == 1:
+            path.rmdir()
+            raise FileNotFoundError(path)
+        return cls()
+
+
+def test_version_pruned_during_load_is_retried_with_the_newest(tmp_path):
+    for version in (1, 2):
+        (tmp_path / f"model.v{version}").mkdir()
+    _PrunedWhileLoading.paths = []
+    registry = ModelRegistry({"user_user": (_PrunedWhileLoading, (tmp_path / "model",))})
+    
+    assert isinstance(registry.get("user_user"), _PrunedWhileLoading)
+    assert _PrunedWhileLoading.paths == ["model.v2", "model.v1"]
+    assert registry.path("user_user") == tmp_path / "model.v1"
+
+
+def test_pruning_keeps_one_version_behind_and_waits_out_the_grace_period(tmp_path):
+    hour_ago = time.time() - 3600
+    for version in (1, 2, 3, 4):
+        (tmp_path / f"model.v{version}").mkdir()
+        os.utime(tmp_path / f"model.v{version}", (hour_ago, hour_ago))
+    os.utime(tmp_path / "model.v3", None)  # v3 was published just now
+    
+    removed = prune_versions(tmp_path / "model", keep=1, grace_seconds=60)
+    
+    # v3 is kept as the version behind the newest; v2 was superseded by v3 too recently
+    assert removed == [tmp_path / "model.v1"]
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["model.v2", "model.v3", "model.v4"]
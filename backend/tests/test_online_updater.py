@@ -0,0 +1,222 @@
+"""Online CF updates: stored ratings are replayed on load, applied under live reads, and one writer snapshots them."""
+import json
+import sys
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app.ml.cf_runtime import CollaborativeFilteringModel
+from app.ml.model_registry import ModelRegistry
+from app.ml.online_updater import CFModelUpdater
+from app.models import MealRating, RecipeRating
+from app.services import ml_recommendation_service
+from app.services.ml_recommendation_service import MLRecommendationService
+import train_ml_model
+
+TRAINED_UNTIL = datetime(2026, 1, 1, 12)
+NOW = datetime(2026, 1, 2)
+
+
+@pytest.fixture
+def models_dir(tmp_path):
+    """models/ holding one trained bundle version with ratings up to TRAINED_UNTIL."""
+    interactions = [
+        {"user_id": user_id, "meal_id": meal_id, "rating": float(1 + (user_id + meal_id) % 5)}
+        for user_id in range(1, 11)
+        for meal_id in range(1, 6)
+        if (user_id * meal_id) % 3
+    ]
+    interactions_file = tmp_path / "interactions.json"
+    interactions_file.write_text(json.dumps(interactions))
+    
+    model = train_ml_model.CollaborativeFilteringModel()
+    model.train(interactions_file, neighbour_k=5)
+    model.ratings_until = TRAINED_UNTIL
+    models_dir = tmp_path / "models"
+    models_dir.mkdir()
+    model.save_bundle(models_dir / "cf_model.v1")
+    return models_dir
+
+
+@pytest.fixture
+def stored():
+    """Stand-in for the rating tables: (rated_at, user_id, meal_id, rating), oldest first."""
+    return [
+        (TRAINED_UNTIL - timedelta(hours=1), "1", 3, 1.0),  # already in the bundle
+        (TRAINED_UNTIL + timedelta(hours=1), "2", 6, 2.0),
+    ]
+
+
+def _replay_from(stored, hooks=()):
+    def replay(model):
+        for hook in hooks:
+            hook()
+        for rated_at, *rating in stored:
+            if rated_at >= model.ratings_until:
+                model.apply_rating(*rating)
+        return NOW
+    return replay
+
+
+def _start_worker(models_dir, replay, on_loaded=None):
+    """A worker process's registry and updater over the shared models/ directory."""
+    updaters = []
+    
+    def on_load(algorithm, model, path):
+        updaters[0].prepare(model)
+        if on_loaded is not None:
+            on_loaded(model)
+    
+    registry = ModelRegistry(
+        {"user_user": (CollaborativeFilteringModel, (models_dir / "cf_model",))}, on_load=on_load
+    )
+    updaters.append(CFModelUpdater(
+        registry, "user_user", replay, snapshot_path=models_dir / "cf_model", snapshot_every=10 ** 6
+    ))
+    registry.get("user_user")
+    return registry, updaters[0]
+
+
+def test_ratings_stored_since_the_bundle_are_replayed_on_load(models_dir, stored):
+    registry, _ = _start_worker(models_dir, _replay_from(stored))
+    
+    served = registry.get("user_user")
+    assert served.rating_overlay == {"2": {6: 2.0}}
+    assert 3 not in served._own_ratings("1")
+
+
+def test_one_worker_writes_the_snapshot_and_every_worker_serves_it_mapped(models_dir, stored):
+    first, first_updater = _start_worker(models_dir, _replay_from(stored))
+    second, second_updater = _start_worker(models_dir, _replay_from(stored))
+    
+    snapshot_path = first_updater.snapshot()
+    
+    assert snapshot_path == models_dir / "cf_model.v2"
+    assert second_updater.snapshot() is None
+    assert second.refresh("user_user")
+    for registry in (first, second):
+        served = registry.get("user_user")
+        assert registry.path("user_user") == snapshot_path
+        assert served.ratings_until == NOW
+        assert served.matrix.ratings_of("2")[6] == 2.0
+        # Nothing left to replay; the matrix stays on shared, memory-mapped pages
+        assert served.rating_overlay == {}
+        assert isinstance(served.matrix.data, np.memmap)
+    assert sorted(path.name for path in models_dir.iterdir() if not path.name.startswith(".")) == [
+        "cf_model.v1", "cf_model.v2"
+    ]
+
+
+def test_ratings_arriving_during_a_reload_reach_the_new_model(models_dir, stored):
+    updater = None
+    arriving = []
+    
+    def rate_during_replay():
+        if arriving:
+            updater.update("meal_rated", arriving.pop(0))
+    
+    def rate_before_swap(model):
+        if arriving:
+            updater.update("meal_rated", arriving.pop(0))
+    
+    registry, updater = _start_worker(models_dir, _replay_from(stored, [rate_during_replay]), rate_before_swap)
+    old = registry.get("user_user")
+    # An older stored rating of the same meal is replayed after the live one arrives
+    stored.append((TRAINED_UNTIL + timedelta(hours=2), "3", 7, 1.0))
+    arriving.extend([
+        {"user_id": 3, "meal_id": 7, "rating": 5.0},
+        {"user_id": 4, "meal_id": 8, "rating": 4.0},
+    ])
+    old.save_bundle(models_dir / "cf_model.v2")
+    
+    assert registry.refresh("user_user")
+    
+    new = registry.get("user_user")
+    assert new is not old
+    assert new._own_ratings("3")[7] == 5.0
+    assert new._own_ratings("4")[8] == 4.0
+    updater.update("meal_rated", {"user_id": 5, "meal_id": 9, "rating": 3.0})
+    assert new._own_ratings("5")[9] == 3.0
+    assert 9 not in old._own_ratings("5")
+
+
+def test_ratings_applied_while_requests_read_the_model(models_dir):
+    model = CollaborativeFilteringModel.load(models_dir / "cf_model.v1")
+    meal_ids = list(range(1, 21))
+    errors = []
+    done = threading.Event()
+    
+    def serve():
+        while not done.is_set():
+            try:
+                for user_id in ("1", "2", "new-1"):
+                    model.get_recommendations(user_id, meal_ids, limit=5)
+                popularity = [score for _, score in model.top_popular(10)]
+                assert popularity == sorted(popularity, reverse=True)
+            except Exception as e:
+                errors.append(e)
+                return
+    
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # switch threads often to interleave reads and writes
+    readers = [threading.Thread(target=serve) for _ in range(3)]
+    try:
+        for reader in readers:
+            reader.start()
+        for i in range(2000):
+            user_id = str(1 + i % 10) if i % 2 else f"new-{i % 40}"
+            model.apply_rating(user_id, 1 + i % 20, float(1 + i % 5))
+    finally:
+        done.set()
+        for reader in readers:
+            reader.join()
+        sys.setswitchinterval(switch_interval)
+    
+    assert errors == []
+    ranked_ids, scores = model._popularity_arrays()
+    expected = ranked_ids[np.lexsort((ranked_ids, -scores))[:10]].tolist()
+    assert [meal_id for meal_id, _ in model.top_popular(10)] == expected
+
+
+def test_snapshot_is_dropped_when_a_retrained_model_is_published(models_dir, stored):
+    def publish_retrained_model():
+        if (models_dir / "cf_model.v1").exists() and not (models_dir / "cf_model.v2").exists():
+            CollaborativeFilteringModel.load(models_dir / "cf_model.v1").save_bundle(models_dir / "cf_model.v2")
+    
+    registry, updater = _start_worker(models_dir, _replay_from(stored))
+    updater._replay_ratings = _replay_from(stored, [publish_retrained_model])
+    
+    assert updater.snapshot() is None
+    
+    assert not (models_dir / "cf_model.v3").exists()
+    assert registry.refresh("user_user")
+    assert registry.path("user_user") == models_dir / "cf_model.v2"
+
+
+def test_existing_bundle_is_never_replaced(models_dir):
+    model = CollaborativeFilteringModel.load(models_dir / "cf_model.v1")
+    
+    with pytest.raises(FileExistsError):
+        model.save_bundle(models_dir / "cf_model.v1")
+    assert CollaborativeFilteringModel.load(models_dir / "cf_model.v1").ratings_until == TRAINED_UNTIL
+
+
+def test_service_replays_both_rating_tables_since_the_cutoff(models_dir, seeded_session_factory, monkeypatch):
+    db = seeded_session_factory()
+    db.query(MealRating).delete()
+    db.add_all([
+        MealRating(user_id=1, meal_id=3, rating=1.0, created_at=TRAINED_UNTIL - timedelta(hours=1)),
+        MealRating(user_id=2, meal_id=6, rating=2.0, created_at=TRAINED_UNTIL + timedelta(hours=1)),
+        RecipeRating(user_id=3, meal_id=7, rating=5.0, created_at=TRAINED_UNTIL + timedelta(hours=2)),
+    ])
+    db.commit()
+    db.close()
+    monkeypatch.setattr(ml_recommendation_service, "SessionLocal", seeded_session_factory)
+    model = CollaborativeFilteringModel.load(models_dir / "cf_model.v1")
+    
+    ratings_until = MLRecommendationService._replay_app_ratings(model)
+    
+    assert isinstance(ratings_until, datetime)
+    assert model.rating_overlay == {"2": {6: 2.0}, "3": {7: 5.0}}
@@ -0,0 +1,74 @@
+"""Popular meals: diet validation, the no-model fallback and walking the model's ranking."""
+import pytest
+from fastapi import HTTPException
+
+from app.controllers.recommendation_controller import get_popular_meals
+from app.ml.cf_runtime import CollaborativeFilteringModel
+from app.models import Meal
+from app.services import cache_service
+from app.services.cache_backends import MemoryCacheBackend
+from app.services.ml_recommendation_service import MLRecommendationService
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    """Empty in-process cache per test, and no trained CF model."""
+    cache_service.set_backend(MemoryCacheBackend())
+    monkeypatch.setattr(MLRecommendationService, "_load_ml_model", classmethod(lambda cls, algorithm=None: None))
+    yield
+    cache_service.set_backend(MemoryCacheBackend())
+
+
+def test_unknown_diet_flag_is_rejected(seeded_session_factory):
+    with pytest.raises(HTTPException) as error:
+        get_popular_meals(limit=10, category=None, diet="vegan, keto", db=seeded_session_factory())
+    
+    assert error.value.status_code == 422
+    assert "keto" in error.value.detail
+
+
+def test_fallback_filters_the_whole_catalog(seeded_session_factory):
+    db = seeded_session_factory()
+    
+    # The only matches (meals 26, 27 and 30) lie beyond the first 20 meals
+    popular = MLRecommendationService.get_popular_meals(db, 2, diet_flags=["vegan", "dairy_free", "nut_free"])
+    by_category = MLRecommendationService.get_popular_meals(db, 10, category="lunch", diet_flags=["vegetarian"])
+    
+    assert [rec["meal"].id for rec in popular] == [26, 27]
+    assert [rec["meal"].id for rec in by_category] == [1, 5, 9, 13, 17, 21, 25, 29]
+
+
+def test_ranking_without_facets_is_walked_until_enough_meals_match(seeded_session_factory, monkeypatch):
+    model = CollaborativeFilteringModel()
+    model.meal_popularity = {meal_id: 5.0 - meal_id / 10 for meal_id in range(1, 31)}
+    model.is_trained = True
+    monkeypatch.setattr(MLRecommendationService, "_load_ml_model", classmethod(lambda cls, algorithm=None: model))
+    db = seeded_session_factory()
+    
+    # The first window (20 x limit) holds none of the matching meals 26, 27 and 30
+    first = MLRecommendationService.get_popular_meals(db, 1, diet_flags=["vegan", "dairy_free", "nut_free"])
+    every = MLRecommendationService.get_popular_meals(db, 5, diet_flags=["vegan", "dairy_free", "nut_free"])
+    
+    assert not model.has_popularity_facets
+    assert [rec["meal"].id for rec in first] == [26]
+    assert [rec["meal"].id for rec in every] == [26, 27, 30]
+    assert every[0]["score"] == pytest.approx(2.4)
+
+
+def test_faceted_ranking_refills_meals_deleted_since_training(seeded_session_factory, monkeypatch):
+    model = CollaborativeFilteringModel()
+    model.meal_popularity = {meal_id: 5.0 - meal_id / 10 for meal_id in range(1, 31)}
+    model.build_popularity_ranking(
+        {meal_id: {"category": ["breakfast", "lunch", "dinner", "snack"][meal_id % 4]} for meal_id in range(1, 31)}
+    )
+    model.is_trained = True
+    monkeypatch.setattr(MLRecommendationService, "_load_ml_model", classmethod(lambda cls, algorithm=None: model))
+    db = seeded_session_factory()
+    # The three most popular lunches (meals 1, 5 and 9) are gone from the database
+    db.query(Meal).filter(Meal.id.in_([1, 5, 9])).delete(synchronize_session=False)
+    db.commit()
+    
+    popular = MLRecommendationService.get_popular_meals(db, 2, category="lunch")
+    
+    assert model.has_popularity_facets
+    assert [rec["meal"].id for rec in popular] == [13, 17]
@@ -0,0 +1,224 @@
+"""User-user CF: sparse engine parity with the dict reference, and the on-scale fallback."""
+import json
+
+import numpy as np
+import pytest
+
+from app.ml.cf_runtime import RandomProjectionLSH, SparseRatingMatrix, top_k_indices
+from train_ml_model import (
+    CollaborativeFilteringModel, compute_top_k_neighbours, compute_top_k_neighbours_parallel
+)
+
+
+def _train(tmp_path, interactions, engine="sparse", **train_args):
+    interactions_file = tmp_path / "interactions.json"
+    interactions_file.write_text(json.dumps(interactions))
+    model = CollaborativeFilteringModel(engine=engine)
+    model.train(interactions_file, **train_args)
+    return model
+
+
+@pytest.fixture
+def interactions():
+    """
+    User 1 has only rated meal 1; users 2-7 rated meals 1 and 2 (so they are
+    user 1's neighbours); meal 3 is rated highly by many users who share no
+    meal with user 1.
+    """
+    interactions = [{"user_id": 1, "meal_id": 1, "rating": 5.0}]
+    for user_id in range(2, 8):
+        interactions += [
+            {"user_id": user_id, "meal_id": 1, "rating": 5.0},
+            {"user_id": user_id, "meal_id": 2, "rating": 5.0},
+        ]
+    for user_id in range(10, 60):
+        interactions.append({"user_id": user_id, "meal_id": 3, "rating": 4.5})
+    return interactions
+
+
+@pytest.fixture
+def random_interactions():
+    """40 users x 30 meals at ~30% density, half-star ratings (fixed seed)."""
+    rng = np.random.default_rng(7)
+    return [
+        {"user_id": user_id, "meal_id": meal_id, "rating": float(rng.integers(2, 11)) / 2}
+        for user_id in range(1, 41)
+        for meal_id in range(1, 31)
+        if rng.random() < 0.3
+    ]
+
+
+def test_sparse_cosine_matches_the_dict_reference(tmp_path, random_interactions):
+    sparse = _train(tmp_path, random_interactions, neighbour_k=0)
+    reference = _train(tmp_path, random_interactions, engine="dict", neighbour_k=0)
+    matrix = sparse.matrix
+    
+    for user_idx, user_id in enumerate(matrix.user_ids.tolist()):
+        user_id = str(user_id)
+        expected = np.array([
+            0.0 if other == user_id
+            else reference.cosine_similarity(reference.user_ratings[user_id], reference.user_ratings[other])
+            for other in map(str, matrix.user_ids.tolist())
+        ])
+        np.testing.assert_allclose(matrix.user_similarities(user_idx), expected, atol=1e-9)
+        # Arbitrary rating vectors (online updates) go through the same kernel
+        from_ratings = matrix.similarities_to_ratings(reference.user_ratings[user_id])
+        from_ratings[user_idx] = 0.0
+        np.testing.assert_allclose(from_ratings, expected, atol=1e-9)
+
+
+def test_sparse_predictions_match_the_dict_reference(tmp_path, random_interactions):
+    sparse = _train(tmp_path, random_interactions, neighbour_k=0)
+    reference = _train(tmp_path, random_interactions, engine="dict", neighbour_k=0)
+    meal_ids = list(range(1, 33))
+    
+    for user_id in ("1", "17", "40", "unknown"):
+        np.testing.assert_allclose(
+            sparse.predict_ratings(user_id, meal_ids), reference.predict_ratings(user_id, meal_ids), atol=1e-9
+        )
+
+
+def _exhaustive_top_k(model, ratings_by_id, item_id, k):
+    """Reference top-k by cosine against every other row (positive similarities only)."""
+    scores = [
+        (other, model.cosine_similarity(ratings_by_id[item_id], ratings))
+        for other, ratings in ratings_by_id.items() if other != item_id
+    ]
+    return sorted((score for score in scores if score[1] > 0), key=lambda score: -score[1])[:k]
+
+
+def _assert_same_neighbours(found, expected):
+    assert [score for _, score in found] == pytest.approx([score for _, score in expected], abs=1e-6)
+    # Ties may be listed in another order, but every neighbour's score must be its true one
+    true_scores = dict(expected)
+    for neighbour, score in found:
+        if neighbour in true_scores:
+            assert score == pytest.approx(true_scores[neighbour], abs=1e-6)
+        else:
+            assert score == pytest.approx(expected[-1][1], abs=1e-6)
+
+
+def test_neighbour_tables_match_exhaustive_search(tmp_path, random_interactions):
+    model = _train(tmp_path, random_interactions, neighbour_k=5)
+    reference = _train(tmp_path, random_interactions, engine="dict", neighbour_k=0)
+    
+    for user_id in reference.user_ratings:
+        _assert_same_neighbours(
+            model.find_similar_users(user_id, k=5), _exhaustive_top_k(reference, reference.user_ratings, user_id, 5)
+        )
+    for meal_id in reference.meal_ratings:
+        _assert_same_neighbours(
+            model.find_similar_meals(meal_id, k=5), _exhaustive_top_k(reference, reference.meal_ratings, meal_id, 5)
+        )
+
+
+def test_neighbour_rows_match_exhaustive_search_after_compaction(tmp_path, random_interactions):
+    model = _train(tmp_path, random_interactions, neighbour_k=5)
+    reference = _train(tmp_path, random_interactions, engine="dict", neighbour_k=0)
+    for user_id, meal_id, rating in (("3", 4, 5.0), ("3", 30, 1.0), ("41", 4, 4.5), ("41", 12, 2.0)):
+        model.apply_rating(user_id, meal_id, rating)
+        reference.apply_rating(user_id, meal_id, rating)
+    
+    model.compact()
+    
+    for user_id in ("3", "41"):
+        _assert_same_neighbours(
+            model.find_similar_users(user_id, k=5), _exhaustive_top_k(reference, reference.user_ratings, user_id, 5)
+        )
+    for meal_id in (4, 12, 30):
+        _assert_same_neighbours(
+            model.find_similar_meals(meal_id, k=5), _exhaustive_top_k(reference, reference.meal_ratings, meal_id, 5)
+        )
+
+
+@pytest.mark.parametrize("axis", ["users", "meals"])
+def test_parallel_neighbour_index_matches_the_serial_one(tmp_path, random_interactions, axis):
+    matrix = _train(tmp_path, random_interactions, neighbour_k=0).matrix
+    
+    serial = compute_top_k_neighbours(matrix, axis, 5)
+    # Small blocks so the rows are spread over several tasks in both processes
+    parallel = compute_top_k_neighbours_parallel(matrix, axis, 5, workers=2, block_size=8)
+    
+    np.testing.assert_array_equal(parallel[0], serial[0])
+    np.testing.assert_array_equal(parallel[1], serial[1])
+
+
+@pytest.fixture(scope="module")
+def taste_clusters():
+    """
+    600 users in 30 taste clusters: each rates 25 of its cluster's 40 meals
+    (out of 400), so a user's true neighbours are clear (cosine ~0.5-0.7).
+    """
+    rng = np.random.default_rng(0)
+    cluster_meals = np.stack([rng.choice(400, 40, replace=False) for _ in range(30)])
+    user_ratings = {}
+    for user in range(600):
+        meals = rng.choice(cluster_meals[rng.integers(30)], 25, replace=False)
+        user_ratings[str(user)] = dict(zip(meals.tolist(), rng.integers(1, 6, 25).astype(float).tolist()))
+    return SparseRatingMatrix.from_ratings(user_ratings)
+
+
+def _lsh_recall(matrix, index, probes, k=10):
+    """Mean recall@k of LSH queries against exact search; checks every returned score is exact."""
+    recalls = []
+    for user_idx in range(matrix.n_users):
+        exact_scores = matrix.user_similarities(user_idx)
+        exact = set(top_k_indices(exact_scores, k).tolist())
+        meals, ratings = matrix.user_row(user_idx)
+        neighbours, scores = index.query(
+            matrix, dict(zip(matrix.meal_ids[meals].tolist(), ratings.tolist())), k, exclude=user_idx, probes=probes
+        )
+        np.testing.assert_allclose(scores, exact_scores[neighbours], atol=1e-9)
+        recalls.append(len(exact & set(neighbours.tolist())) / len(exact))
+    return float(np.mean(recalls))
+
+
+def test_lsh_recall_of_clear_neighbours(taste_clusters):
+    index = RandomProjectionLSH.build(taste_clusters, n_tables=16, n_bits=8)
+    
+    # The API default probes (ML_LSH_PROBES) find most true neighbours; probing helps
+    recall = _lsh_recall(taste_clusters, index, probes=2)
+    assert recall >= 0.85
+    assert _lsh_recall(taste_clusters, index, probes=0) < recall
+    # Fewer bits per table: larger buckets, more candidates, higher recall
+    assert _lsh_recall(taste_clusters, RandomProjectionLSH.build(taste_clusters, n_tables=16, n_bits=6), 2) >= 0.95
+
+
+def test_lsh_candidates_stay_within_the_budget(taste_clusters):
+    index = RandomProjectionLSH.build(taste_clusters, n_tables=16, n_bits=8)
+    capped = RandomProjectionLSH.build(taste_clusters, n_tables=16, n_bits=8, max_candidates=50)
+    
+    for user_idx in range(0, taste_clusters.n_users, 20):
+        meals, ratings = taste_clusters.user_row(user_idx)
+        meal_ids = taste_clusters.meal_ids[meals]
+        candidates = capped.candidates(meal_ids, ratings)
+        assert len(candidates) <= 50
+        assert set(candidates.tolist()) <= set(index.candidates(meal_ids, ratings).tolist())
+    # The users kept are the ones colliding in the most tables, so most true neighbours survive
+    assert _lsh_recall(taste_clusters, capped, probes=2) >= 0.6
+
+
+@pytest.mark.parametrize("engine", ["sparse", "dict"])
+def test_fallback_is_on_the_rating_scale(tmp_path, interactions, engine):
+    model = _train(tmp_path, interactions, engine=engine, neighbour_k=0)
+    
+    predictions = model.predict_ratings("1", [2, 3, 999])
+    
+    global_mean = (13 * 5.0 + 50 * 4.5) / 63
+    prior = model.FALLBACK_PRIOR_COUNT
+    assert predictions[0] == pytest.approx(5.0)
+    # No neighbour rated meals 3 and 999: shrunk mean rating, global mean when unknown
+    assert predictions[1] == pytest.approx((50 * 4.5 + prior * global_mean) / (50 + prior))
+    assert predictions[2] == pytest.approx(global_mean)
+    assert ((predictions >= 1.0) & (predictions <= 5.0)).all()
+
+
+def test_neighbour_prediction_outranks_unrelated_popular_meal(tmp_path, interactions):
+    model = _train(tmp_path, interactions, neighbour_k=5)
+    
+    recommendations = model.get_recommendations("1", [1, 2, 3], limit=2)
+    
+    assert [meal_id for meal_id, _ in recommendations] == [2, 3]
+    # Users without neighbours get every meal's fallback, still on the scale
+    predictions = model.predict_ratings("unknown", [1, 2, 3])
+    assert ((predictions >= 1.0) & (predictions <= 5.0)).all()